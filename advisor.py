@@ -0,0 +1,96 @@
+import json
+import re
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import event as sa_event
+from sqlalchemy.exc import DBAPIError
+
+from extensions import db
+
+# Statements worth explaining; inserts never scan
+EXPLAINED_STATEMENTS = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+
+# SQLite reports a full table scan as "SCAN <table>" ("SCAN TABLE <table>"
+# before 3.36); scans through an index name it after the table
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+class FullScan:
+    def __init__(self, table, statement, detail):
+        self.table = table
+        self.statement = statement
+        self.detail = detail
+
+@contextmanager
+def capture_statements(engine=None):
+    """Collect the distinct statements run inside the block, for explaining.
+
+    Yields a dict of SQL text to the parameters it first ran with. Wrap a
+    page render, a CLI command or a whole test session in it. Only this
+    thread's statements are collected, so background jobs don't mix in.
+    """
+    statements = {}
+    thread = threading.get_ident()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() != thread or executemany:
+            return
+        if statement.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+            statements.setdefault(statement, parameters)
+
+    if engine is None:
+        engine = db.engine
+    sa_event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        sa_event.remove(engine, 'before_cursor_execute', record)
+
+def _sqlite_scans(connection, statement, parameters):
+    plan = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)
+    for row in plan:
+        detail = row[-1]
+        match = SQLITE_FULL_SCAN.match(detail)
+        # Reading SQLite's own catalog, e.g. to list tables, isn't a missing index
+        if match and not match.group(1).startswith('sqlite_'):
+            yield match.group(1), detail
+
+def _postgresql_scans(connection, statement, parameters):
+    plan = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {statement}', parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node['Node Type'] == 'Seq Scan':
+            yield node['Relation Name'], f"Seq Scan on {node['Relation Name']}"
+        nodes.extend(node.get('Plans', []))
+
+def find_full_scans(statements, engine=None):
+    """EXPLAIN each statement and return a FullScan for every table it reads
+    in full.
+
+    On PostgreSQL sequential scans are disabled while explaining, so the
+    planner only falls back to one when no index can serve the query, not
+    merely because a test table is small. Statements that can't be
+    explained, e.g. because a temporary table is gone, are skipped.
+    """
+    if engine is None:
+        engine = db.engine
+    explain = {'sqlite': _sqlite_scans, 'postgresql': _postgresql_scans}.get(engine.dialect.name)
+    if explain is None:
+        raise ValueError(f"Can't explain queries on {engine.dialect.name}")
+
+    scans = []
+    with engine.connect() as connection:
+        if engine.dialect.name == 'postgresql':
+            connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        for statement, parameters in statements.items():
+            try:
+                with connection.begin_nested():
+                    found = list(explain(connection, statement, parameters))
+            except DBAPIError:
+                continue
+            scans.extend(FullScan(table, statement, detail) for table, detail in found)
+        connection.rollback()
+    return scans
@@ -1,51 +1,68 @@
 import os
-import logging
 
 from flask import Flask
 from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
-from extensions import db, csrf
-from models import User
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from extensions import csrf
+from database import init_database
+from config import CONFIG_PROFILES
+from logs import configure_logging
+from identity import load_cached_user
+from routes import views
+from commands import register_commands
 
 # Base class for SQLAlchemy models
 class Base(DeclarativeBase):
     pass
 
-# Initialize Flask app
-app = Flask(__name__)
-
-# Load configuration from config.py
-app.config.from_object('config.Config')
-
-# Set secret key from environment variable
-app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
-
-# Configure proxy fix for proper URL generation
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
-
-# Initialize SQLAlchemy with the app
-# db = SQLAlchemy(model_class=Base)
-db.init_app(app)
-
-# Initialize CSRF protection
-csrf.init_app(app)
-
 # Initialize Flask-Login
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message_category = 'info'
 
-# Import models for table creation
-with app.app_context():
-    db.create_all()
-    logging.info("Database tables created")
+def create_app(profile=None, config=None):
+    """Build the Flask app for a config profile from config.CONFIG_PROFILES,
+    with its views and CLI commands.
+    
+    The profile defaults to the APP_ENV environment variable, then
+    'development'; config overrides single settings, e.g. the database URL
+    in tests. Heavy libraries (openpyxl, qrcode, Pillow, NumPy) are
+    imported by the code that uses them, unless PRELOAD_HEAVY_MODULES asks
+    for them up front.
+    """
+    profile = profile or os.environ.get("APP_ENV", "development")
+    if profile not in CONFIG_PROFILES:
+        raise ValueError(f"Unknown APP_ENV {profile!r}; expected one of {', '.join(CONFIG_PROFILES)}")
+    if profile == 'production' and not os.environ.get("SESSION_SECRET"):
+        raise RuntimeError("Set SESSION_SECRET before running in production")
+    
+    app = Flask(__name__)
+    
+    # Load configuration from config.py
+    app.config.from_object(CONFIG_PROFILES[profile])
+    app.config.update(config or {})
+    configure_logging(app)
+    
+    if app.config['PRELOAD_HEAVY_MODULES']:
+        from preload import preload_heavy_modules
+        preload_heavy_modules(app.logger)
+    
+    # Configure proxy fix for proper URL generation
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+    
+    init_database(app)
+    csrf.init_app(app)
+    login_manager.init_app(app)
+    
+    views.init_app(app)
+    register_commands(app)
+    return app
+
+# The schema is created and upgraded by `flask --app main migrate` (see
+# migrations.py), run once before the workers start rather than at import
 
-# Import user loader function
+# Load users from the identity cache, so most requests skip the users table
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_cached_user(int(user_id))
@@ -0,0 +1,158 @@
+"""Preload benchmark: worker memory and first-request latency.
+
+Builds the app in a parent process, with and without PRELOAD=1, and forks
+workers from it the way gunicorn does. Each worker times its first check-in
+pass (qrcode and Pillow), participant export (openpyxl) and student
+dashboard (NumPy), then reports its RSS and PSS. PSS splits pages shared
+with the parent between the processes sharing them, so it shows what
+preloading saves per worker. Linux only; uses a throwaway SQLite database.
+
+    python benchmarks/preload.py --workers 4
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def memory_kb():
+    """RSS and PSS of this process in kB"""
+    with open('/proc/self/smaps_rollup') as smaps:
+        fields = dict(line.split(':', 1) for line in smaps if ':' in line)
+    return int(fields['Rss'].split()[0]), int(fields['Pss'].split()[0])
+
+def first_requests(app, student_id, event_id):
+    """Seconds taken by the first request of each kind in this process"""
+    from utils import build_participants_xlsx
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(student_id)
+        session['_fresh'] = True
+
+    timings = {}
+    started = time.perf_counter()
+    assert client.get(f'/events/{event_id}/check-in-pass.png').status_code == 200
+    timings['check-in pass'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with app.app_context():
+        build_participants_xlsx(event_id).close()
+    timings['xlsx export'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    assert client.get('/student/dashboard').status_code == 200
+    timings['student dashboard'] = time.perf_counter() - started
+    return timings
+
+def seed(app):
+    from extensions import db
+    from migrations import run_migrations
+    from models import User, UserRole, Club, Event, Registration
+
+    with app.app_context():
+        run_migrations(echo=lambda message: None)
+        organizer = User(username='organizer', email='organizer@example.com',
+                         first_name='Pre', last_name='Load', role=UserRole.ORGANIZER)
+        student = User(username='student', email='student@example.com',
+                       first_name='First', last_name='Request')
+        for user in (organizer, student):
+            user.set_password('preload')
+        db.session.add_all([organizer, student])
+        db.session.flush()
+        club = Club(name='Preload Club', admin_id=organizer.id)
+        db.session.add(club)
+        db.session.flush()
+        start = datetime.now() + timedelta(days=1)
+        event = Event(title='Preload', description='Benchmark event', location='Hall',
+                      start_time=start, end_time=start + timedelta(hours=2), category='Academic',
+                      max_participants=100, organizer_id=organizer.id, club_id=club.id)
+        db.session.add(event)
+        db.session.flush()
+        db.session.add(Registration(user_id=student.id, event_id=event.id))
+        db.session.commit()
+        ids = student.id, event.id
+        # Forked workers must not share the parent's connections
+        db.engine.dispose()
+    return ids
+
+def run_mode(workers):
+    """Build the app as configured by the environment, fork workers and
+    print one JSON result per worker"""
+    import gc
+    import logging
+
+    from main import app
+
+    logging.disable(logging.INFO)
+    app.config['RECOMMENDATION_FILE'] = os.path.join(os.environ['BENCHMARK_DIR'], 'recommendations.npz')
+    student_id, event_id = seed(app)
+    if app.config['PRELOAD_HEAVY_MODULES']:
+        gc.freeze()
+
+    # Workers report their memory only once all of them are up, so PSS
+    # splits the shared pages between every worker
+    go_read, go_write = os.pipe()
+    children = []
+    for _ in range(workers):
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            os.close(go_write)
+            timings = first_requests(app, student_id, event_id)
+            os.write(write_end, (json.dumps(timings) + '\n').encode())
+            os.read(go_read, 1)
+            rss, pss = memory_kb()
+            os.write(write_end, json.dumps({'rss': rss, 'pss': pss}).encode())
+            os._exit(0)
+        os.close(write_end)
+        children.append((pid, os.fdopen(read_end)))
+
+    timings = [json.loads(output.readline()) for _, output in children]
+    os.close(go_write)
+    for (pid, output), worker_timings in zip(children, timings):
+        print(json.dumps(dict(json.loads(output.read()), timings=worker_timings)))
+        output.close()
+        os.waitpid(pid, 0)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--mode', choices=['cold', 'preload'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.workers)
+        return
+
+    results = {}
+    for mode in ('cold', 'preload'):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            env = dict(os.environ, BENCHMARK_DIR=temp_dir, PRELOAD='1' if mode == 'preload' else '0',
+                       DATABASE_URL=f"sqlite:///{os.path.join(temp_dir, 'preload.db')}")
+            output = subprocess.run([sys.executable, __file__, '--mode', mode, '--workers', str(args.workers)],
+                                    env=env, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        results[mode] = [json.loads(line) for line in output.splitlines() if line.startswith('{')]
+
+    kinds = list(results['cold'][0]['timings'])
+    print(f"{args.workers} workers; medians per worker\n")
+    print(f"{'':<26}{'cold':>10}{'preload':>10}")
+    for kind in kinds:
+        row = [statistics.median(worker['timings'][kind] for worker in results[mode]) * 1000
+               for mode in ('cold', 'preload')]
+        print(f"{'first ' + kind + ' (ms)':<26}{row[0]:>10.1f}{row[1]:>10.1f}")
+    for field in ('rss', 'pss'):
+        row = [statistics.median(worker[field] for worker in results[mode]) / 1024
+               for mode in ('cold', 'preload')]
+        print(f"{field.upper() + ' (MB)':<26}{row[0]:>10.1f}{row[1]:>10.1f}")
+
+if __name__ == '__main__':
+    main()
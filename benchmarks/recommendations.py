@@ -0,0 +1,130 @@
+"""Recommendation latency benchmark.
+
+Builds the recommendation model from synthetic registrations, attendance
+and ratings, then times top-k lookups for random users. Students favour a
+few categories and clubs, so the hit rate on registrations held out of
+the build shows the scores make sense. No database is needed.
+
+    python benchmarks/recommendations.py --users 50000 --events 10000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def synthetic_interactions(rng, n_users, n_events, n_categories, n_clubs, per_user, now):
+    """Events spread over a year around now, and per-user registrations
+    drawn mostly from a favourite category and club"""
+    event_categories = rng.integers(n_categories, size=n_events)
+    event_clubs = rng.integers(n_clubs, size=n_events)
+    event_starts = now + rng.uniform(-180, 180, size=n_events) * 86400
+    by_club = [np.flatnonzero(event_clubs == club) for club in range(n_clubs)]
+    by_category = [np.flatnonzero(event_categories == category) for category in range(n_categories)]
+
+    favourite_clubs = rng.integers(n_clubs, size=n_users)
+    favourite_categories = rng.integers(n_categories, size=n_users)
+    registrations = []
+    for user in range(n_users):
+        count = rng.poisson(per_user) + 1
+        source = rng.choice(3, size=count, p=[0.4, 0.4, 0.2])
+        picks = np.concatenate([
+            rng.choice(by_club[favourite_clubs[user]], size=(source == 0).sum()),
+            rng.choice(by_category[favourite_categories[user]], size=(source == 1).sum()),
+            rng.integers(n_events, size=(source == 2).sum()),
+        ])
+        registrations.append(np.unique(picks))
+    return event_categories, event_clubs, event_starts, registrations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--categories', type=int, default=7)
+    parser.add_argument('--clubs', type=int, default=150)
+    parser.add_argument('--registrations-per-user', type=int, default=20)
+    parser.add_argument('--factors', type=int, default=32)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from recommender import (RecommendationModel, compute_model, REGISTRATION_WEIGHT,
+                             ATTENDANCE_WEIGHT, RATING_WEIGHT)
+
+    rng = np.random.default_rng(args.seed)
+    now = datetime.now()
+    started = time.perf_counter()
+    event_categories, event_clubs, event_starts, registrations = synthetic_interactions(
+        rng, args.users, args.events, args.categories, args.clubs,
+        args.registrations_per_user, now.timestamp())
+
+    # Hold one upcoming registration out of the build for a sample of users
+    sample = rng.choice(args.users, size=min(args.lookups, args.users), replace=False)
+    held_out = {}
+    for user in sample:
+        upcoming = registrations[user][event_starts[registrations[user]] > now.timestamp()]
+        if len(upcoming):
+            held_out[user] = rng.choice(upcoming)
+            registrations[user] = registrations[user][registrations[user] != held_out[user]]
+
+    user_index = np.repeat(np.arange(args.users), [len(events) for events in registrations])
+    event_index = np.concatenate(registrations)
+    weights = np.full(len(event_index), REGISTRATION_WEIGHT)
+    # Past events: most registrants attended and some rated
+    past = np.flatnonzero(event_starts[event_index] < now.timestamp())
+    attended = past[rng.random(len(past)) < 0.7]
+    rated = attended[rng.random(len(attended)) < 0.4]
+    user_index = np.concatenate([user_index, user_index[attended], user_index[rated]])
+    event_index = np.concatenate([event_index, event_index[attended], event_index[rated]])
+    weights = np.concatenate([weights, np.full(len(attended), ATTENDANCE_WEIGHT),
+                              RATING_WEIGHT * (rng.integers(1, 6, size=len(rated)) - 3)])
+    generated = time.perf_counter() - started
+
+    started = time.perf_counter()
+    model = compute_model(np.arange(args.users), np.arange(args.events), event_categories, event_clubs,
+                          event_starts, user_index, event_index, weights, args.factors, now)
+    built = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'recommendations.npz')
+        model.save(path)
+        size = os.path.getsize(path)
+        started = time.perf_counter()
+        model = RecommendationModel.load(path)
+        loaded = time.perf_counter() - started
+
+    print(f"{args.users} users, {args.events} events, {len(event_index)} interactions "
+          f"(generated in {generated:.1f}s)")
+    print(f"  build  {built:7.2f} s   {len(model.user_ids)} user and {len(model.event_ids)} upcoming event vectors "
+          f"of {model.event_vectors.shape[1]} dims")
+    print(f"  file   {size / 1024 / 1024:7.1f} MB  loaded in {loaded * 1000:.0f} ms")
+
+    timings = []
+    hits = 0
+    for user in sample:
+        registered = set(registrations[user].tolist())
+        started = time.perf_counter()
+        top = model.top_event_ids(int(user), args.k, registered, now)
+        timings.append(time.perf_counter() - started)
+        hits += user in held_out and held_out[user] in top
+    print(f"  top-{args.k} lookup  p50 {percentile(timings, 0.5) * 1000:6.2f} ms  "
+          f"p95 {percentile(timings, 0.95) * 1000:6.2f} ms  "
+          f"p99 {percentile(timings, 0.99) * 1000:6.2f} ms  over {len(timings)} users")
+    print(f"  hit rate on held-out registrations: {hits / max(len(held_out), 1):.1%} "
+          f"(random picks would hit {args.k / max(len(model.event_ids), 1):.2%})")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
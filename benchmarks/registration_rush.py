@@ -0,0 +1,136 @@
+"""Registration rush load test.
+
+Fires concurrent registrations at a single event with a fixed number of
+seats and checks that exactly that many succeed, with everyone else turned
+away cleanly. Runs against a throwaway SQLite database unless a database
+URL is given.
+
+    python benchmarks/registration_rush.py --seats 50 --requests 300
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Barrier
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seats', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=150)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    temp_dir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        temp_dir = tempfile.TemporaryDirectory()
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(temp_dir.name, 'rush.db')}"
+
+    import logging
+    from main import app
+    from extensions import db
+    from migrations import run_migrations
+    from models import User, UserRole, Club, Event, Registration
+
+    logging.disable(logging.INFO)
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    # One event with a seat limit and one student per request
+    run = time.time_ns()
+    with app.app_context():
+        run_migrations(echo=lambda message: None)
+        organizer = User(username=f'rush_{run}', email=f'rush_{run}@example.com',
+                         first_name='Rush', last_name='Organizer', role=UserRole.ORGANIZER)
+        organizer.set_password('rush')
+        db.session.add(organizer)
+        db.session.flush()
+        club = Club(name=f'Rush Club {run}', admin_id=organizer.id)
+        db.session.add(club)
+        db.session.flush()
+        start = datetime.now() + timedelta(days=1)
+        event = Event(title='Registration Rush', description='Load test event',
+                      start_time=start, end_time=start + timedelta(hours=2), location='Main Hall',
+                      category='Other', max_participants=args.seats,
+                      organizer_id=organizer.id, club_id=club.id)
+        db.session.add(event)
+        students = [User(username=f'rush_{run}_{i}', email=f'rush_{run}_{i}@example.com',
+                         first_name='Rush', last_name=f'Student{i}', password_hash='!')
+                    for i in range(args.requests)]
+        db.session.add_all(students)
+        db.session.commit()
+        event_id = event.id
+        student_ids = [student.id for student in students]
+
+    # Log every student in up front so only the registrations are timed
+    clients = []
+    for student_id in student_ids:
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(student_id)
+            session['_fresh'] = True
+        clients.append(client)
+
+    barrier = Barrier(min(args.concurrency, len(clients)))
+
+    def register(client):
+        try:
+            barrier.wait(timeout=1)
+        except Exception:
+            pass
+        started = time.perf_counter()
+        response = client.post(f'/events/{event_id}/register')
+        elapsed = time.perf_counter() - started
+        with client.session_transaction() as session:
+            categories = [category for category, _ in session.pop('_flashes', [])]
+        if response.status_code >= 500:
+            return 'error', elapsed
+        return ('registered' if 'success' in categories else 'turned_away'), elapsed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(register, clients))
+    total = time.perf_counter() - started
+
+    with app.app_context():
+        stored_count = db.session.get(Event, event_id).registration_count
+        actual_count = Registration.query.filter_by(event_id=event_id).count()
+
+    outcomes = {}
+    for outcome, elapsed in results:
+        outcomes.setdefault(outcome, []).append(elapsed)
+
+    print(f"{len(results)} registrations for {args.seats} seats "
+          f"with {args.concurrency} concurrent clients in {total:.2f}s")
+    for outcome in ('registered', 'turned_away', 'error'):
+        timings = outcomes.get(outcome, [])
+        print(f"  {outcome:<12} {len(timings):>5}  "
+              f"p50 {percentile(timings, 0.5) * 1000:7.1f} ms  "
+              f"p95 {percentile(timings, 0.95) * 1000:7.1f} ms")
+    print(f"  registrations stored: {actual_count}, seat counter: {stored_count}")
+
+    expected = min(args.seats, args.requests)
+    ok = (len(outcomes.get('registered', [])) == expected and actual_count == expected
+          and stored_count == expected and not outcomes.get('error'))
+    print("PASS" if ok else "FAIL: event was overbooked or requests failed")
+
+    if temp_dir:
+        with app.app_context():
+            db.engine.dispose()
+        temp_dir.cleanup()
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""Concurrent SQLite write benchmark.
+
+Many students register for and unregister from a handful of events while
+others read event pages, from several forked worker processes sharing one
+SQLite file as gunicorn workers would. Meanwhile another process keeps a
+read transaction open for --long-read seconds at a time, as a slow client
+downloading a streamed participant export does. It runs first with the
+old settings (rollback journal, full sync, the driver's 5 s busy timeout)
+and then with the engine configuration from database.py (WAL, NORMAL
+sync, SQLITE_BUSY_TIMEOUT). Reports throughput, latency, "database is
+locked" failures and how long requests waited for a pooled connection.
+
+With the rollback journal a writer can't commit while any read
+transaction is open, so writes queued behind a long read fail once they
+have waited out the busy timeout; with WAL readers never block writers.
+
+    python benchmarks/sqlite_writes.py --processes 4 --threads 8 --operations 2000 --long-read 6
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Engine settings for each run; 'before' matches the settings this replaced
+MODES = {
+    'before': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL', 'SQLITE_BUSY_TIMEOUT': '5000'},
+    'after': {},
+}
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def hold_read_transactions(app, seconds):
+    """Keep a read transaction open for seconds at a time until killed"""
+    from extensions import db
+
+    with app.app_context():
+        connection = db.engine.raw_connection()
+    cursor = connection.cursor()
+    while True:
+        cursor.execute('BEGIN')
+        cursor.execute('SELECT count(*) FROM registrations').fetchone()
+        time.sleep(seconds)
+        cursor.execute('COMMIT')
+
+def run_mode(args):
+    """Run the workload against the engine configured by the environment
+    and print the results as JSON"""
+    import logging
+    from main import app
+    from extensions import db
+    from database import pool_stats
+    from migrations import run_migrations
+    from models import User, UserRole, Club, Event
+
+    logging.disable(logging.WARNING)
+    app.config['WTF_CSRF_ENABLED'] = False
+    # Raise "database is locked" to the caller rather than render a 500 page
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+
+    with app.app_context():
+        run_migrations(echo=lambda message: None)
+        organizer = User(username='writes', email='writes@example.com',
+                         first_name='Write', last_name='Organizer', role=UserRole.ORGANIZER)
+        organizer.set_password('writes')
+        db.session.add(organizer)
+        db.session.flush()
+        club = Club(name='Write Club', admin_id=organizer.id)
+        db.session.add(club)
+        db.session.flush()
+        start = datetime.now() + timedelta(days=1)
+        events = [Event(title=f'Write {i}', description='Benchmark event', location='Hall',
+                        start_time=start, end_time=start + timedelta(hours=2), category='Other',
+                        max_participants=None, organizer_id=organizer.id, club_id=club.id)
+                  for i in range(args.events)]
+        students = [User(username=f'writer{i}', email=f'writer{i}@example.com',
+                         first_name='Write', last_name=f'Student{i}', password_hash='!')
+                    for i in range(args.processes * args.threads * 4)]
+        db.session.add_all(events + students)
+        db.session.commit()
+        event_ids = [event.id for event in events]
+        student_ids = [student.id for student in students]
+
+    clients = []
+    for student_id in student_ids:
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(student_id)
+            session['_fresh'] = True
+        clients.append(client)
+
+    def operation(number):
+        rng = random.Random(number)
+        client = clients[number % len(clients)]
+        event_id = rng.choice(event_ids)
+        if rng.random() < args.write_share:
+            kind = 'write'
+            action = rng.choice(['register', 'unregister'])
+            request = lambda: client.post(f'/events/{event_id}/{action}')
+        else:
+            kind = 'read'
+            request = lambda: client.get(f'/events/{event_id}')
+        started = time.perf_counter()
+        try:
+            outcome = 'ok' if request().status_code < 500 else 'error'
+        except Exception as e:
+            outcome = 'locked' if 'database is locked' in str(e) else 'error'
+        return kind, outcome, time.perf_counter() - started
+
+    with app.app_context():
+        # Forked workers must not share the parent's connections
+        db.engine.dispose()
+
+    reader = None
+    if args.long_read:
+        reader = os.fork()
+        if reader == 0:
+            hold_read_transactions(app, args.long_read)
+            os._exit(0)
+        # Let the reader open its first transaction before the load starts
+        time.sleep(0.5)
+
+    started = time.perf_counter()
+    children = []
+    for worker in range(args.processes):
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            with ThreadPoolExecutor(max_workers=args.threads) as pool:
+                results = list(pool.map(operation, range(worker, args.operations, args.processes)))
+            with app.app_context():
+                stats = pool_stats()
+            with os.fdopen(write_end, 'w') as output:
+                json.dump({'results': results, 'pool': stats}, output)
+            os._exit(0)
+        os.close(write_end)
+        children.append((pid, read_end))
+
+    runs = []
+    for pid, read_end in children:
+        with os.fdopen(read_end) as output:
+            runs.append(json.load(output))
+        os.waitpid(pid, 0)
+    total = time.perf_counter() - started
+    if reader:
+        os.kill(reader, signal.SIGTERM)
+        os.waitpid(reader, 0)
+
+    waits = [run['pool'] for run in runs]
+    checkouts = sum(stats['checkouts'] for stats in waits)
+    pool = {
+        'checkouts': checkouts,
+        'slow': sum(stats['slow'] for stats in waits),
+        'mean_wait': sum(stats['mean_wait'] * stats['checkouts'] for stats in waits) / max(checkouts, 1),
+        'max_wait': max(stats['max_wait'] for stats in waits),
+    }
+    results = [result for run in runs for result in run['results']]
+    print(json.dumps({'results': results, 'total': total, 'pool': pool}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8, help='Threads per process')
+    parser.add_argument('--operations', type=int, default=2000)
+    parser.add_argument('--events', type=int, default=5)
+    parser.add_argument('--write-share', type=float, default=0.5, help='Fraction of operations that write')
+    parser.add_argument('--long-read', type=float, default=6,
+                        help='Seconds each long read transaction stays open; 0 for none')
+    parser.add_argument('--mode', choices=list(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args)
+        return 0
+
+    failed = False
+    for mode, settings in MODES.items():
+        with tempfile.TemporaryDirectory() as temp_dir:
+            env = dict(os.environ, **settings, DATABASE_URL=f"sqlite:///{os.path.join(temp_dir, 'writes.db')}")
+            output = subprocess.run([sys.executable, __file__, '--mode', mode] + sys.argv[1:],
+                                    env=env, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        run = json.loads(output.splitlines()[-1])
+
+        print(f"{mode}: {len(run['results'])} operations from {args.processes} processes "
+              f"of {args.threads} threads, {args.long_read:g}s read transactions, "
+              f"in {run['total']:.2f}s ({len(run['results']) / run['total']:.0f}/s)")
+        for kind in ('write', 'read'):
+            timings = [elapsed for k, outcome, elapsed in run['results'] if k == kind and outcome == 'ok']
+            counts = {outcome: sum(1 for k, o, _ in run['results'] if k == kind and o == outcome)
+                      for outcome in ('ok', 'locked', 'error')}
+            print(f"  {kind:<6} ok {counts['ok']:>5}  locked {counts['locked']:>4}  error {counts['error']:>4}  "
+                  f"p50 {percentile(timings, 0.5) * 1000:7.1f} ms  p95 {percentile(timings, 0.95) * 1000:7.1f} ms")
+            failed |= mode == 'after' and (counts['locked'] or counts['error'])
+        pool = run['pool']
+        print(f"  pool checkouts {pool['checkouts']}, mean wait {pool['mean_wait'] * 1000:.2f} ms, "
+              f"max wait {pool['max_wait'] * 1000:.1f} ms, {pool['slow']} slow")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Worker start-up benchmark.
+
+Imports the app the way a worker does (`import main`) in fresh
+interpreters with `python -X importtime`, and reports the median import
+cost of each of the project's modules and of the libraries they pull in.
+Fails if a heavy library that should only load on first use is imported
+at start-up, unless PRELOAD=1 asks for them (see preload.py).
+
+    python benchmarks/startup.py --runs 5
+    APP_ENV=production SESSION_SECRET=x python benchmarks/startup.py
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries only the code paths that need them import
+LAZY_MODULES = ('numpy', 'pandas', 'openpyxl', 'qrcode', 'PIL', 'redis')
+
+def project_modules():
+    return {name[:-3] for name in os.listdir(ROOT) if name.endswith('.py')}
+
+def import_times(target):
+    """Run one cold import of target. Returns the wall time in seconds and
+    {module: (self_us, cumulative_us)} from -X importtime."""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {target}'],
+                            cwd=ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented under the module that made them
+        modules.setdefault(name.strip(), (int(own), int(cumulative)))
+    return elapsed, modules
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--target', default='main', help='Module to import (default main)')
+    parser.add_argument('--top', type=int, default=10, help='Libraries to list')
+    args = parser.parse_args()
+
+    runs = [import_times(args.target) for _ in range(args.runs)]
+    walls = [elapsed for elapsed, _ in runs]
+    print(f"interpreter + import {args.target}: median {statistics.median(walls) * 1000:.0f} ms, "
+          f"min {min(walls) * 1000:.0f} ms over {args.runs} runs")
+
+    def median_ms(name, column):
+        return statistics.median(modules.get(name, (0, 0))[column] for _, modules in runs) / 1000
+
+    loaded = runs[-1][1]
+    ours = sorted(project_modules() & set(loaded), key=lambda name: -median_ms(name, 1))
+    print(f"\n{'project module':<20}{'self ms':>10}{'cumulative ms':>16}")
+    for name in ours:
+        print(f"{name:<20}{median_ms(name, 0):>10.1f}{median_ms(name, 1):>16.1f}")
+
+    # Libraries by the cost of their top-level package
+    libraries = sorted({name for name in loaded if '.' not in name} - project_modules(),
+                       key=lambda name: -median_ms(name, 1))
+    print(f"\n{'library':<20}{'cumulative ms':>26}")
+    for name in libraries[:args.top]:
+        print(f"{name:<20}{median_ms(name, 1):>26.1f}")
+
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    if eager and os.environ.get('PRELOAD') != '1':
+        sys.exit(f"\nImported at start-up but should load on first use: {', '.join(eager)}")
+
+if __name__ == '__main__':
+    main()
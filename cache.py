@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from models import CacheVersion
+
+def bump_version(*names):
+    """Invalidate everything cached under these names"""
+    dialect = db.engine.dialect.name
+    for name in names:
+        if dialect in ('postgresql', 'sqlite'):
+            insert = (postgresql if dialect == 'postgresql' else sqlite).insert(CacheVersion)
+            db.session.execute(
+                insert.values(name=name, version=1)
+                .on_conflict_do_update(index_elements=[CacheVersion.name],
+                                       set_={'version': CacheVersion.version + 1})
+            )
+        else:
+            updated = db.session.execute(
+                db.update(CacheVersion)
+                .where(CacheVersion.name == name)
+                .values(version=CacheVersion.version + 1)
+            ).rowcount
+            if not updated:
+                db.session.add(CacheVersion(name=name, version=1))
+
+def current_version(name):
+    return db.session.scalar(db.select(CacheVersion.version).where(CacheVersion.name == name)) or 0
+
+def current_versions(names):
+    """Return {name: version} for several names with one query"""
+    if not names:
+        return {}
+    stored = dict(db.session.execute(
+        db.select(CacheVersion.name, CacheVersion.version).where(CacheVersion.name.in_(names))).all())
+    return {name: stored.get(name, 0) for name in names}
+
+class VersionedCache:
+    """Bounded in-process LRU cache whose entries expire on a version bump.
+
+    Each entry remembers the version of `name` it was built from; a lookup
+    costs one primary-key query for the current version.
+    """
+
+    def __init__(self, name, max_entries=256):
+        self.name = name
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        """Return (version, value) for key, calling build() on a miss"""
+        version = current_version(self.name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry
+        value = build()
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return version, value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class TTLCache:
+    """Bounded in-process LRU cache whose entries expire after a time to live"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
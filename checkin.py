@@ -0,0 +1,175 @@
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from models import User, Registration, Attendance, Event, RosterChange, RosterAction
+
+def _serializer(salt):
+    return URLSafeSerializer(current_app.secret_key, salt=salt)
+
+def registrant_query(event_id):
+    """Query (User, attendance id or None) pairs for an event's registrants"""
+    return db.session.query(User, Attendance.id) \
+        .join(Registration, db.and_(Registration.user_id == User.id,
+                                    Registration.event_id == event_id)) \
+        .outerjoin(Attendance, db.and_(Attendance.user_id == User.id,
+                                       Attendance.event_id == event_id))
+
+def record_roster_changes(event_id, user_ids, action):
+    """Bump the event's roster version and log the changes under it.
+    
+    Must run in the same transaction as the registration or attendance
+    write it describes. The version bump locks the event row, so versions
+    become visible to readers in order.
+    """
+    if not user_ids:
+        return
+    db.session.execute(
+        db.update(Event)
+        .where(Event.id == event_id)
+        .values(roster_version=Event.roster_version + 1)
+    )
+    version = db.session.scalar(db.select(Event.roster_version).where(Event.id == event_id))
+    db.session.execute(db.insert(RosterChange), [
+        {'event_id': event_id, 'version': version, 'user_id': user_id, 'action': action}
+        for user_id in user_ids
+    ])
+
+def roster_snapshot(event_id):
+    """Full check-in roster: [user_id, full name, checked in] per registrant"""
+    version = db.session.scalar(db.select(Event.roster_version).where(Event.id == event_id))
+    rows = db.session.query(User.id, User.first_name, User.last_name, Attendance.id) \
+        .join(Registration, db.and_(Registration.user_id == User.id,
+                                    Registration.event_id == event_id)) \
+        .outerjoin(Attendance, db.and_(Attendance.user_id == User.id,
+                                       Attendance.event_id == event_id)) \
+        .order_by(User.id) \
+        .all()
+    return {
+        'version': version,
+        'attendees': [[user_id, f"{first_name} {last_name}", attendance_id is not None]
+                      for user_id, first_name, last_name, attendance_id in rows]
+    }
+
+def roster_changes_since(event_id, since):
+    """Roster changes after a version: [version, user_id, action, full name].
+
+    The version is None if the event doesn't exist.
+    """
+    version = db.session.scalar(db.select(Event.roster_version).where(Event.id == event_id))
+    if version is None or since >= version:
+        return {'version': version, 'changes': []}
+    rows = db.session.query(RosterChange.version, RosterChange.user_id, RosterChange.action,
+                            User.first_name, User.last_name) \
+        .join(User, User.id == RosterChange.user_id) \
+        .filter(RosterChange.event_id == event_id,
+                RosterChange.version > since,
+                RosterChange.version <= version) \
+        .order_by(RosterChange.version, RosterChange.id) \
+        .all()
+    return {
+        'version': version,
+        'changes': [[change_version, user_id, action, f"{first_name} {last_name}"]
+                    for change_version, user_id, action, first_name, last_name in rows]
+    }
+
+def make_check_in_token(registration):
+    """Sign a registration into a token a student presents at the door"""
+    return _serializer('event-check-in').dumps(
+        [registration.id, registration.user_id, registration.event_id])
+
+def read_check_in_token(token, event_id):
+    """Return (registration_id, user_id) from a token for this event, or None.
+
+    Only the signature is checked; no database lookup is made.
+    """
+    try:
+        registration_id, user_id, token_event_id = _serializer('event-check-in').loads(token)
+    except (BadSignature, TypeError, ValueError):
+        return None
+    if token_event_id != event_id:
+        return None
+    return registration_id, user_id
+
+def make_scanner_key(event_id):
+    """Sign the key door scanners send with batch check-ins for an event"""
+    return _serializer('event-scanner').dumps(event_id)
+
+def is_valid_scanner_key(key, event_id):
+    try:
+        return _serializer('event-scanner').loads(key or '') == event_id
+    except BadSignature:
+        return False
+
+def insert_ignoring_duplicates(model):
+    """INSERT that skips rows a concurrent writer already added"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(model).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return sqlite.insert(model).on_conflict_do_nothing()
+    return db.insert(model)
+
+def check_in_batch(event_id, tokens):
+    """Check in every scanned token for an event in a single transaction.
+
+    Returns one result per token, in order, with a status of 'checked_in',
+    'already_checked_in', 'not_registered' or 'invalid'. Tokens for people
+    who are already checked in, including repeats within the batch, are
+    reported rather than treated as errors.
+    """
+    decoded = [read_check_in_token(token, event_id) for token in tokens]
+    registration_ids = {item[0] for item in decoded if item}
+
+    # One query for which registrations still exist and who already attended
+    known = {}
+    if registration_ids:
+        rows = db.session.query(Registration.id, Registration.user_id, Attendance.id) \
+            .outerjoin(Attendance, db.and_(Attendance.user_id == Registration.user_id,
+                                           Attendance.event_id == event_id)) \
+            .filter(Registration.event_id == event_id,
+                    Registration.id.in_(registration_ids)) \
+            .all()
+        known = {registration_id: (user_id, attendance_id is not None)
+                 for registration_id, user_id, attendance_id in rows}
+
+    results = []
+    pending = {}
+    for item in decoded:
+        if not item:
+            results.append({'status': 'invalid'})
+            continue
+        registration_id, user_id = item
+        if registration_id not in known or known[registration_id][0] != user_id:
+            results.append({'status': 'not_registered', 'user_id': user_id})
+            continue
+        if known[registration_id][1] or user_id in pending:
+            results.append({'status': 'already_checked_in', 'user_id': user_id})
+            continue
+        pending[user_id] = len(results)
+        results.append({'status': 'checked_in', 'user_id': user_id})
+
+    if pending:
+        statement = insert_ignoring_duplicates(Attendance)
+        rows = [{'user_id': user_id, 'event_id': event_id} for user_id in pending]
+        if db.engine.dialect.insert_executemany_returning:
+            inserted = set(db.session.scalars(statement.returning(Attendance.user_id), rows))
+        else:
+            db.session.execute(statement, rows)
+            inserted = set(pending)
+
+        # Rows skipped by the conflict clause were checked in concurrently
+        for user_id, index in pending.items():
+            if user_id not in inserted:
+                results[index]['status'] = 'already_checked_in'
+
+        if inserted:
+            db.session.execute(
+                db.update(Event)
+                .where(Event.id == event_id)
+                .values(attendance_count=Event.attendance_count + len(inserted))
+            )
+            record_roster_changes(event_id, sorted(inserted), RosterAction.CHECKED_IN)
+    db.session.commit()
+    return results
@@ -0,0 +1,219 @@
+from collections import Counter
+
+import click
+from flask import current_app, url_for
+from flask.cli import AppGroup
+
+from extensions import db
+from loading import count_queries
+from advisor import capture_statements, find_full_scans
+from jobs import run_queued_jobs, purge_expired_jobs, recover_stale_jobs
+from search import rebuild_search_index
+from migrations import MIGRATIONS, run_migrations, pending_migrations, backfill_name_keys
+from reminders import dispatch_due_reminders, run_dispatcher
+from rollups import refresh_rollups
+from models import User, UserRole, Club, Event
+
+# Added to the app's `flask` command by create_app()
+commands = AppGroup('commands')
+
+def register_commands(app):
+    for command in commands.commands.values():
+        app.cli.add_command(command)
+
+@commands.command('migrate')
+@click.option('--online', is_flag=True,
+              help='Build indexes concurrently on PostgreSQL and backfill in batches, for a live database.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per backfill batch in online mode.')
+@click.option('--list', 'list_only', is_flag=True, help='Show which migrations are pending without running them.')
+def migrate_command(online, batch_size, list_only):
+    """Bring the database schema up to date. Run before starting the workers."""
+    if list_only:
+        pending = {version for version, _, _ in pending_migrations()}
+        for version, name, _ in MIGRATIONS:
+            click.echo(f"{'pending' if version in pending else 'applied':<8} {version:>3} {name}")
+        return
+    applied = run_migrations(online=online, batch_size=batch_size, echo=click.echo)
+    click.echo(f"Applied {len(applied)} migrations" if applied else "The schema is up to date")
+
+@commands.command('reconcile-counters')
+def reconcile_counters_command():
+    """Rebuild the denormalized event counters from the source tables."""
+    updated = Event.reconcile_counters()
+    db.session.commit()
+    click.echo(f"Reconciled counters for {updated} events")
+
+@commands.command('rebuild-name-keys')
+@click.option('--batch-size', default=1000, show_default=True)
+def rebuild_name_keys_command(batch_size):
+    """Backfill the normalized full-name key used by check-in lookups."""
+    updated = backfill_name_keys(batch_size)
+    click.echo(f"Rebuilt name keys for {updated} users")
+
+@commands.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Create the full-text event search index if needed and refill it."""
+    rebuild_search_index()
+    db.session.commit()
+    click.echo(f"Indexed {Event.query.count()} events")
+
+@commands.command('refresh-rollups')
+@click.option('--full', is_flag=True, help='Rebuild every day instead of only the days that changed.')
+def refresh_rollups_command(full):
+    """Bring the daily dashboard rollups up to date."""
+    refreshed = refresh_rollups(full=full)
+    click.echo(f"Refreshed rollups for {refreshed} days")
+
+@commands.command('build-recommendations')
+@click.option('--factors', type=int, help='Co-registration factors (default RECOMMENDATION_FACTORS).')
+def build_recommendations_command(factors):
+    """Precompute the vectors behind the students' recommended events."""
+    from recommender import build_recommendations
+    model = build_recommendations(factors)
+    click.echo(f"Built recommendations for {len(model.user_ids)} users and {len(model.event_ids)} upcoming events")
+
+@commands.command('run-jobs')
+def run_jobs_command():
+    """Run background jobs left queued or stuck running by a restart, and purge old ones."""
+    purged = purge_expired_jobs()
+    recovered = recover_stale_jobs()
+    ran = run_queued_jobs()
+    click.echo(f"Ran {ran} queued jobs ({len(recovered)} left behind by a stopped worker), "
+               f"purged {purged} expired jobs")
+
+@commands.command('send-reminders')
+@click.option('--loop', is_flag=True, help='Keep running and send reminders as they fall due.')
+@click.option('--interval', default=60, show_default=True, help='Most seconds to sleep between polls.')
+@click.option('--lookahead', default=0, show_default=True,
+              help='Also send reminders due within this many seconds.')
+@click.option('--batch-size', type=int, help='Reminders claimed per batch (default REMINDER_BATCH_SIZE).')
+def send_reminders_command(loop, interval, lookahead, batch_size):
+    """Send due event reminders through the configured delivery backend.
+
+    Several dispatchers may run at once; each batch is claimed before it
+    is sent, so no reminder goes out twice.
+    """
+    if loop:
+        run_dispatcher(interval, lookahead, batch_size)
+    else:
+        sent = dispatch_due_reminders(batch_size, lookahead)
+        click.echo(f"Sent {sent} reminders")
+
+# Pages rendered by `flask check-queries` and the role to view them as
+# (None renders the page anonymously)
+QUERY_CHECK_PAGES = [
+    ('index', None),
+    ('events_list', None),
+    ('event_detail', None),
+    ('events_calendar', None),
+    ('admin_dashboard', UserRole.ADMIN),
+    ('admin_users', UserRole.ADMIN),
+    ('admin_clubs', UserRole.ADMIN),
+    ('organizer_dashboard', UserRole.ORGANIZER),
+    ('organizer_events', UserRole.ORGANIZER),
+    ('event_check_in', UserRole.ORGANIZER),
+    ('student_dashboard', UserRole.STUDENT),
+    ('my_events', UserRole.STUDENT),
+]
+
+def check_page_requests(app):
+    """Yield (url, user_id) for each page in QUERY_CHECK_PAGES there is data to render"""
+    with app.app_context():
+        event = Event.query.order_by(Event.id.desc()).first()
+        club = Club.query.first()
+        admin = User.query.filter_by(role=UserRole.ADMIN).first()
+        student = User.query.filter_by(role=UserRole.STUDENT).first()
+        user_ids = {
+            UserRole.ADMIN: admin.id if admin else None,
+            UserRole.ORGANIZER: event.organizer_id if event else None,
+            UserRole.STUDENT: student.id if student else None,
+        }
+        url_args = {'event_id': event.id if event else None, 'club_id': club.id if club else None}
+
+    for endpoint, role in QUERY_CHECK_PAGES:
+        arguments = {name: url_args[name] for name in app.url_map._rules_by_endpoint[endpoint][0].arguments}
+        if None in arguments.values() or (role and user_ids[role] is None):
+            click.echo(f"SKIP  {endpoint}: no data to render it with")
+            continue
+
+        with app.test_request_context():
+            url = url_for(endpoint, **arguments)
+        yield url, user_ids[role] if role else None
+
+def request_page(app, url, user_id=None):
+    # Each page gets a fresh app context. A request would otherwise reuse
+    # the one the CLI pushed, with the signed-in user cached in g and rows
+    # loaded by earlier pages in the session's identity map.
+    client = app.test_client()
+    if user_id:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+    with app.app_context():
+        return client.get(url)
+
+@commands.command('check-queries')
+@click.option('--max-repeats', default=3, show_default=True,
+              help='How many times one SQL statement may run while rendering a page.')
+def check_queries_command(max_repeats):
+    """Render the main pages and flag statements that run once per row.
+
+    A statement that repeats while a page renders is almost always a lazy
+    load inside a template loop, so the page's query count grows with the
+    number of rows shown. Run this against a database with realistic data.
+    """
+    app = current_app._get_current_object()
+    engine = db.engine
+
+    failures = 0
+    for url, user_id in check_page_requests(app):
+        with count_queries(engine) as statements:
+            response = request_page(app, url, user_id)
+
+        repeated = {sql: n for sql, n in Counter(statements).items() if n > max_repeats}
+        # Every checked page renders for its user; a redirect to the login
+        # page means it was never really rendered
+        status = 'FAIL' if repeated or response.status_code != 200 else 'ok'
+        click.echo(f"{status:<5} {url} -> {response.status_code}, {len(statements)} statements")
+        for sql, n in repeated.items():
+            click.echo(f"      {n}x {' '.join(sql.split())[:120]}")
+        if status == 'FAIL':
+            failures += 1
+
+    if failures:
+        raise SystemExit(1)
+
+@commands.command('advise-indexes')
+@click.option('--ignore-table', multiple=True, help='A table that may be scanned in full, e.g. a small lookup table.')
+def advise_indexes_command(ignore_table):
+    """Render the main pages, EXPLAIN every query they run and flag full table scans.
+
+    Each flagged query reads a whole table on every request, so it slows
+    down as the table grows; it usually needs an index on the columns it
+    filters or sorts by. Works on SQLite and PostgreSQL.
+    """
+    app = current_app._get_current_object()
+    engine = db.engine
+
+    pages = {}
+    failures = 0
+    for url, user_id in check_page_requests(app):
+        with capture_statements(engine) as statements:
+            response = request_page(app, url, user_id)
+        # As in check-queries, a page that didn't render ran none of its queries
+        status = 'ok' if response.status_code == 200 else 'FAIL'
+        click.echo(f"{status:<5} {url} -> {response.status_code}, {len(statements)} statements")
+        if status == 'FAIL':
+            failures += 1
+        for statement, parameters in statements.items():
+            pages.setdefault(statement, (parameters, url))
+
+    scans = find_full_scans({statement: parameters for statement, (parameters, _) in pages.items()}, engine)
+    scans = [scan for scan in scans if scan.table not in ignore_table]
+    for scan in scans:
+        click.echo(f"SCAN  {scan.table} on {pages[scan.statement][1]}: {scan.detail}")
+        click.echo(f"      {' '.join(scan.statement.split())[:160]}")
+    click.echo(f"{len(scans)} full table scans in {len(pages)} distinct statements")
+
+    if scans or failures:
+        raise SystemExit(1)
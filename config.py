@@ -2,18 +2,102 @@ import os
 
 class Config:
     # Flask configuration
-    DEBUG = True
+    DEBUG = False
     SECRET_KEY = os.environ.get("SESSION_SECRET", "dev_secret_key")
     
     # SQLAlchemy configuration
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL") or "sqlite:///site.db"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        'pool_pre_ping': True,
-        'pool_recycle': 300,
-    }
+    
+    # Engine and pool (see database.py); pool sizes apply per process
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))  # seconds to wait for a connection
+    DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 300))  # seconds before a connection is replaced
+    DB_SLOW_CHECKOUT = float(os.environ.get("DB_SLOW_CHECKOUT", 0.1))  # log checkouts that wait longer
+    DB_POOL_STATS_INTERVAL = int(os.environ.get("DB_POOL_STATS_INTERVAL", 300))  # seconds between pool stats log lines; 0 for none
+    SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 10000))  # milliseconds a write waits for the lock
+    
+    # Logging (see logs.py); LOG_FORMAT is 'text' or 'json'
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+    
+    # Import openpyxl, qrcode, Pillow and NumPy while building the app
+    # rather than on first use (see preload.py and gunicorn.conf.py)
+    PRELOAD_HEAVY_MODULES = os.environ.get("PRELOAD") == "1"
     
     # Upload configuration
     UPLOAD_FOLDER = os.path.join(os.getcwd(), 'static', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload size
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
\ No newline at end of file
+    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+    
+    # Background jobs
+    JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+    JOB_ARTIFACT_FOLDER = os.path.join(os.getcwd(), 'instance', 'job_artifacts')
+    JOB_ARTIFACT_TTL = 24 * 60 * 60  # seconds finished artifacts are kept
+    # Seconds after which a job still queued or running is taken to have lost
+    # its worker and is run again; keep it above the longest job's run time
+    JOB_CLAIM_TIMEOUT = 30 * 60
+    JOB_RECOVERY_INTERVAL = 5 * 60  # seconds between sweeps for such jobs in each process
+    
+    # Pagination
+    EVENTS_PER_PAGE = 24
+    USERS_PER_PAGE = 50
+    MAX_PER_PAGE = 100  # largest page a client may ask the JSON feeds for
+    
+    # Event reminders (see reminders.py)
+    REMINDER_BACKEND = os.environ.get("REMINDER_BACKEND", "file")  # 'file' or 'smtp'
+    REMINDER_FILE = os.path.join(os.getcwd(), 'instance', 'reminders.log')
+    REMINDER_BATCH_SIZE = 500
+    REMINDER_CLAIM_TIMEOUT = 5 * 60  # seconds before an unfinished claim is retried
+    MAIL_SERVER = os.environ.get("MAIL_SERVER", "localhost")
+    MAIL_PORT = int(os.environ.get("MAIL_PORT", 25))
+    MAIL_USE_TLS = os.environ.get("MAIL_USE_TLS") == "1"
+    MAIL_USERNAME = os.environ.get("MAIL_USERNAME")
+    MAIL_PASSWORD = os.environ.get("MAIL_PASSWORD")
+    MAIL_DEFAULT_SENDER = os.environ.get("MAIL_DEFAULT_SENDER", "events@campus.local")
+    
+    # Dashboard rollups (see rollups.py)
+    ROLLUP_MAX_AGE = 10 * 60  # seconds before a dashboard view queues a refresh
+    
+    # Signed-in user cache (see identity.py); other processes may see a
+    # changed role or profile for up to USER_CACHE_TTL seconds
+    USER_CACHE_TTL = 30
+    USER_CACHE_MAX_ENTRIES = 10000
+    
+    # Page cache for anonymous visitors (see pagecache.py)
+    PAGE_CACHE_BACKEND = os.environ.get("PAGE_CACHE_BACKEND", "memory")  # 'memory' or 'redis'
+    PAGE_CACHE_REDIS_URL = os.environ.get("PAGE_CACHE_REDIS_URL", "memory://")
+    PAGE_CACHE_KEY_PREFIX = 'campus:page:'
+    PAGE_CACHE_MAX_ENTRIES = 512
+    PAGE_CACHE_TTL = 60  # seconds a page is served before it is rebuilt
+    PAGE_CACHE_MAX_AGE = 30  # seconds browsers and proxies may reuse a page
+    
+    # Event recommendations (see recommender.py)
+    RECOMMENDATION_FILE = os.path.join(os.getcwd(), 'instance', 'recommendations.npz')
+    RECOMMENDATION_FACTORS = 32  # co-registration factors per user and event
+    RECOMMENDATION_MAX_AGE = 6 * 60 * 60  # seconds before a dashboard view queues a rebuild
+
+# Profiles, chosen by the APP_ENV environment variable (see app.create_app)
+class DevelopmentConfig(Config):
+    DEBUG = True
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "DEBUG")
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get("TEST_DATABASE_URL", "sqlite://")
+    WTF_CSRF_ENABLED = False
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "WARNING")
+
+class ProductionConfig(Config):
+    # One JSON object per line for the log shipper; debug records are
+    # never built, so logging calls on hot paths stay cheap
+    LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+
+CONFIG_PROFILES = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
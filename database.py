@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+
+from sqlalchemy import event as sa_event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+class CheckoutStats:
+    """How long requests waited for a pooled connection"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.slow = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait, slow):
+        with self._lock:
+            self.checkouts += 1
+            self.slow += slow
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'slow': self.slow,
+                'mean_wait': self.total_wait / self.checkouts if self.checkouts else 0.0,
+                'max_wait': self.max_wait,
+            }
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that times every checkout, including opening a new
+    connection, and logs those slower than slow_checkout seconds: they
+    mean the pool is too small for the load"""
+
+    slow_checkout = 0.1
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_stats = CheckoutStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait = time.perf_counter() - started
+            slow = wait > self.slow_checkout
+            self.checkout_stats.record(wait, slow)
+            if slow:
+                logger.warning("Waited %.0f ms for a database connection (%s)",
+                               wait * 1000, self.status())
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.slow_checkout = self.slow_checkout
+        return pool
+
+def is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database.
+
+    Pool sizes and timeouts come from the DB_POOL_* settings; an in-memory
+    SQLite database keeps Flask-SQLAlchemy's single shared connection.
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if is_memory_sqlite(url):
+        return {}
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+    }
+    if url.get_backend_name() != 'sqlite':
+        # Server connections can be dropped behind the app's back
+        options.update(pool_pre_ping=True, pool_recycle=config['DB_POOL_RECYCLE'])
+    return options
+
+def sqlite_pragmas(config):
+    """PRAGMAs run on every new SQLite connection.
+
+    WAL lets readers carry on while a write commits, so check-ins and
+    registrations only queue behind other writes; NORMAL sync is safe with
+    WAL and saves an fsync per commit. busy_timeout makes a write wait
+    that long for the lock instead of failing with "database is locked".
+    """
+    return {
+        'journal_mode': config['SQLITE_JOURNAL_MODE'],
+        'synchronous': config['SQLITE_SYNCHRONOUS'],
+        'busy_timeout': config['SQLITE_BUSY_TIMEOUT'],
+        'temp_store': 'MEMORY',
+    }
+
+def init_database(app):
+    """Configure the engine for the app's database and bind db to the app"""
+    # Options set explicitly in the config win over the computed ones
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    db.init_app(app)
+
+    with app.app_context():
+        engine = db.engine
+    if isinstance(engine.pool, TimedQueuePool):
+        engine.pool.slow_checkout = app.config['DB_SLOW_CHECKOUT']
+        if app.config['DB_POOL_STATS_INTERVAL']:
+            app.teardown_request(pool_stats_logger(engine, app.config['DB_POOL_STATS_INTERVAL']))
+    if engine.dialect.name == 'sqlite' and not is_memory_sqlite(engine.url):
+        pragmas = sqlite_pragmas(app.config)
+
+        @sa_event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+            cursor.close()
+
+def pool_stats(engine=None):
+    """Checkout wait statistics for the engine's pool, or None if it isn't timed"""
+    if engine is None:
+        engine = db.engine
+    if not isinstance(engine.pool, TimedQueuePool):
+        return None
+    return dict(engine.pool.checkout_stats.snapshot(), status=engine.pool.status())
+
+def pool_stats_logger(engine, interval):
+    """A teardown_request callback that logs pool_stats() at most every
+    interval seconds, so waits for a connection show up in each worker's
+    logs even while none is slow enough to be logged on its own"""
+    lock = threading.Lock()
+    last_logged = [time.monotonic()]
+
+    def log_pool_stats(exception=None):
+        now = time.monotonic()
+        with lock:
+            if now - last_logged[0] < interval:
+                return
+            last_logged[0] = now
+        stats = pool_stats(engine)
+        logger.info("Database pool: %d checkouts, mean wait %.1f ms, max wait %.1f ms, %d slow (%s)",
+                    stats['checkouts'], stats['mean_wait'] * 1000, stats['max_wait'] * 1000,
+                    stats['slow'], stats['status'], extra={'pool': stats})
+
+    return log_pool_stats
@@ -2,4 +2,39 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_wtf import CSRFProtect
 
 db = SQLAlchemy()
-csrf = CSRFProtect() 
\ No newline at end of file
+csrf = CSRFProtect() 
+
+class Views:
+    """Views, error handlers and template filters, recorded at import and
+    added to each app by init_app.
+
+    Like a blueprint, but endpoints keep their plain names, so
+    url_for('login') and the per-endpoint settings keyed on them work
+    unchanged.
+    """
+
+    def __init__(self):
+        self.deferred = []
+
+    def route(self, rule, **options):
+        def decorator(view):
+            endpoint = options.pop('endpoint', view.__name__)
+            self.deferred.append(lambda app: app.add_url_rule(rule, endpoint, view, **options))
+            return view
+        return decorator
+
+    def errorhandler(self, code):
+        def decorator(handler):
+            self.deferred.append(lambda app: app.register_error_handler(code, handler))
+            return handler
+        return decorator
+
+    def template_filter(self, name):
+        def decorator(function):
+            self.deferred.append(lambda app: app.add_template_filter(function, name))
+            return function
+        return decorator
+
+    def init_app(self, app):
+        for setup in self.deferred:
+            setup(app)
@@ -105,6 +105,7 @@ class EventSearchForm(FlaskForm):
 class CheckInForm(FlaskForm):
     full_name = StringField('Full Name', validators=[DataRequired()])
     event_id = HiddenField('Event ID', validators=[DataRequired()])
+    user_id = HiddenField('User ID', validators=[Optional()])
     submit = SubmitField('Check In')
 
 class RatingForm(FlaskForm):
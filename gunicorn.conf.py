@@ -0,0 +1,26 @@
+import gc
+import os
+
+# gunicorn -c gunicorn.conf.py main:app. gunicorn also reads this file
+# from the working directory without -c, so the deploy command gets these
+# settings too; --bind and --workers on the command line still win.
+bind = os.environ.get("BIND", "0.0.0.0:8080")
+# gunicorn's own default of one worker unless WEB_CONCURRENCY asks for more
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+
+# PRELOAD=1 builds the app, and imports the heavy libraries with it (see
+# preload.py), once in the master; workers are forked with them loaded
+preload_app = os.environ.get("PRELOAD") == "1"
+
+def when_ready(server):
+    # Keep the garbage collector in the workers from touching, and so
+    # copying, the memory they share with the master
+    if preload_app:
+        gc.freeze()
+
+def post_worker_init(worker):
+    # Start the worker's job pool now, so its sweep picks up jobs a stopped
+    # worker left queued or running without waiting for a new job
+    from jobs import start_job_pool
+
+    start_job_pool(worker.wsgi)
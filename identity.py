@@ -0,0 +1,74 @@
+from flask import current_app
+from flask_login import UserMixin
+
+from extensions import db
+from cache import TTLCache
+from models import User, UserRole
+
+# User columns kept in the cache; these cover the navigation bar and role checks
+IDENTITY_COLUMNS = ('id', 'username', 'email', 'first_name', 'last_name', 'role', 'profile_picture')
+
+class CachedUser(UserMixin):
+    """Identity and role of the signed-in user, built from the user cache.
+
+    Any other attribute, such as bio, check_password() or a relationship,
+    loads the full row on first use. The identity is read-only: make
+    changes on `row`.
+    """
+
+    def __init__(self, identity):
+        for name in IDENTITY_COLUMNS:
+            object.__setattr__(self, name, identity[name])
+        object.__setattr__(self, '_row', None)
+
+    @property
+    def row(self):
+        """The full User row, loaded once per request"""
+        if self._row is None:
+            object.__setattr__(self, '_row', db.session.get(User, self.id))
+        return self._row
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.row, name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Cached user identities are read-only; set {name} on current_user.row")
+
+    def get_full_name(self):
+        return f"{self.first_name} {self.last_name}"
+
+    def is_admin(self):
+        return self.role == UserRole.ADMIN
+
+    def is_organizer(self):
+        return self.role == UserRole.ORGANIZER
+
+    def is_student(self):
+        return self.role == UserRole.STUDENT
+
+def get_user_cache():
+    cache = current_app.extensions.get('user_cache')
+    if cache is None:
+        cache = TTLCache(current_app.config['USER_CACHE_MAX_ENTRIES'])
+        current_app.extensions['user_cache'] = cache
+    return cache
+
+def load_cached_user(user_id):
+    """Flask-Login user loader: the cached identity, or one narrow query on a miss"""
+    cache = get_user_cache()
+    identity = cache.get(user_id)
+    if identity is None:
+        row = db.session.execute(
+            db.select(*[getattr(User, name) for name in IDENTITY_COLUMNS]).where(User.id == user_id)
+        ).one_or_none()
+        if row is None:
+            return None
+        identity = row._asdict()
+        cache.set(user_id, identity, current_app.config['USER_CACHE_TTL'])
+    return CachedUser(identity)
+
+def forget_user(user_id):
+    """Drop a user's cached identity; call after committing a change to it"""
+    get_user_cache().pop(user_id)
@@ -0,0 +1,248 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import Job, JobStatus
+
+logger = logging.getLogger(__name__)
+
+# Job functions by kind, registered with @job
+JOB_HANDLERS = {}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def job(kind):
+    """Register a function as the handler for a kind of job.
+
+    Handlers are called as handler(job, **job.params) inside an app context
+    and may return (artifact filename, download name) for a downloadable
+    result written to the artifact folder.
+    """
+    def decorator(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return decorator
+
+def artifact_folder():
+    folder = current_app.config['JOB_ARTIFACT_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def enqueue(kind, user_id=None, dedupe_key=None, **params):
+    """Queue a job as part of the current transaction.
+
+    The job is handed to the worker pool only once the transaction commits,
+    so it never runs against data the request rolled back. If dedupe_key is
+    given and a matching job is still pending, that job is returned instead.
+    """
+    if dedupe_key:
+        # A job orphaned by a dead worker doesn't count; see recover_stale_jobs
+        cutoff = stale_claim_cutoff()
+        pending = Job.query.filter(Job.dedupe_key == dedupe_key,
+                                   db.or_(db.and_(Job.status == JobStatus.QUEUED,
+                                                  Job.created_at >= cutoff),
+                                          db.and_(Job.status == JobStatus.RUNNING,
+                                                  Job.started_at >= cutoff))).first()
+        if pending:
+            return pending
+
+    new_job = Job(kind=kind, params=params, user_id=user_id, dedupe_key=dedupe_key)
+    db.session.add(new_job)
+    db.session.flush()
+    db.session.info.setdefault('queued_job_ids', []).append(new_job.id)
+    return new_job
+
+@sa_event.listens_for(Session, 'after_commit')
+def _submit_committed_jobs(session):
+    job_ids = session.info.pop('queued_job_ids', None)
+    if job_ids:
+        app = current_app._get_current_object()
+        for job_id in job_ids:
+            _get_executor(app).submit(_run_in_app, app, job_id)
+
+@sa_event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back_jobs(session):
+    session.info.pop('queued_job_ids', None)
+
+def _get_executor(app):
+    # Created lazily so each forked worker process gets its own threads
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=app.config['JOB_WORKERS'],
+                                           thread_name_prefix='job')
+            # Sweep for jobs orphaned by a dead worker when the pool starts,
+            # and then every JOB_RECOVERY_INTERVAL
+            _schedule_recovery(app, 0)
+    return _executor
+
+def start_job_pool(app):
+    """Start this process's worker pool, and its sweep for orphaned jobs,
+    without waiting for the first job to be queued"""
+    _get_executor(app)
+
+def _schedule_recovery(app, delay):
+    timer = threading.Timer(delay, _recover_in_app, (app,))
+    timer.daemon = True
+    timer.start()
+
+def _run_in_app(app, job_id):
+    with app.app_context():
+        run_job(job_id)
+
+def _recover_in_app(app):
+    try:
+        with app.app_context():
+            job_ids = recover_stale_jobs()
+        for job_id in job_ids:
+            _get_executor(app).submit(_run_in_app, app, job_id)
+    except Exception:
+        logger.exception("Sweep for stale jobs failed")
+    finally:
+        _schedule_recovery(app, app.config['JOB_RECOVERY_INTERVAL'])
+
+def run_job(job_id):
+    """Claim and run one queued job. Returns False if it was already claimed."""
+    # Claim atomically so a job is never run twice, even across processes
+    claimed = db.session.execute(
+        db.update(Job)
+        .where(Job.id == job_id, Job.status == JobStatus.QUEUED)
+        .values(status=JobStatus.RUNNING, started_at=datetime.now())
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return False
+
+    current_job = db.session.get(Job, job_id)
+    try:
+        handler = JOB_HANDLERS[current_job.kind]
+        result = handler(current_job, **current_job.params)
+        if result:
+            current_job.artifact, current_job.download_name = result
+        current_job.status = JobStatus.FINISHED
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Job %s (%s) failed", job_id, current_job.kind)
+        current_job.status = JobStatus.FAILED
+        current_job.error = str(e)
+    current_job.finished_at = datetime.now()
+    db.session.commit()
+    return True
+
+def stale_claim_cutoff(now=None):
+    """Jobs queued or started before this, and still not claimed or
+    finished, have outlived JOB_CLAIM_TIMEOUT"""
+    now = now or datetime.now()
+    return now - timedelta(seconds=current_app.config['JOB_CLAIM_TIMEOUT'])
+
+def recover_stale_jobs(now=None):
+    """Find the jobs that outlived JOB_CLAIM_TIMEOUT, queueing again the
+    running ones.
+
+    Their worker process most likely restarted or crashed before it picked
+    them up or mid-job, so nothing will ever run or finish them. Returns the
+    ids of both; the caller runs them, and run_job's claim keeps any one
+    from running twice.
+    """
+    cutoff = stale_claim_cutoff(now)
+    orphaned_ids = db.session.scalars(
+        db.select(Job.id).where(Job.status == JobStatus.QUEUED, Job.created_at < cutoff)
+    ).all()
+    requeued_ids = db.session.scalars(
+        db.update(Job)
+        .where(Job.status == JobStatus.RUNNING, Job.started_at < cutoff)
+        .values(status=JobStatus.QUEUED, started_at=None)
+        .returning(Job.id)
+    ).all()
+    db.session.commit()
+    if orphaned_ids:
+        logger.warning("Resubmitting %d jobs queued by a stopped worker: %s",
+                       len(orphaned_ids), ', '.join(map(str, orphaned_ids)))
+    if requeued_ids:
+        logger.warning("Requeued %d jobs left running by a stopped worker: %s",
+                       len(requeued_ids), ', '.join(map(str, requeued_ids)))
+    return sorted(orphaned_ids + requeued_ids)
+
+def run_queued_jobs():
+    """Run every queued job in this process, e.g. after a restart"""
+    count = 0
+    for (job_id,) in db.session.query(Job.id).filter_by(status=JobStatus.QUEUED).order_by(Job.id).all():
+        if run_job(job_id):
+            count += 1
+    return count
+
+def purge_expired_jobs():
+    """Delete finished jobs and their artifacts once they are past the TTL"""
+    cutoff = datetime.now() - timedelta(seconds=current_app.config['JOB_ARTIFACT_TTL'])
+    expired = Job.query.filter(Job.status.in_([JobStatus.FINISHED, JobStatus.FAILED]),
+                               Job.finished_at < cutoff).all()
+    for expired_job in expired:
+        if expired_job.artifact:
+            try:
+                os.remove(os.path.join(artifact_folder(), expired_job.artifact))
+            except FileNotFoundError:
+                pass
+        db.session.delete(expired_job)
+    db.session.commit()
+    return len(expired)
+
+# Job handlers
+
+@job('export_participants')
+def export_participants_job(current_job, event_id, format='xlsx'):
+    from utils import stream_participants_csv, build_participants_xlsx
+
+    # Exports are the jobs that leave files behind, so tidy up old ones here
+    purge_expired_jobs()
+
+    filename = f"job_{current_job.id}_event_{event_id}_participants.{format}"
+    path = os.path.join(artifact_folder(), filename)
+    if format == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as output:
+            for chunk in stream_participants_csv(event_id):
+                output.write(chunk)
+    else:
+        with build_participants_xlsx(event_id) as workbook, open(path, 'wb') as output:
+            for chunk in iter(lambda: workbook.read(64 * 1024), b''):
+                output.write(chunk)
+
+    download_name = f"event_{event_id}_participants_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return filename, download_name
+
+@job('check_in_qr')
+def check_in_qr_job(current_job, event_id, url):
+    from utils import generate_qr_code
+
+    generate_qr_code(url, f"event_{event_id}_checkin.png")
+
+@job('optimize_image')
+def optimize_image_job(current_job, path, max_size=1600):
+    """Downscale an uploaded image in place if it is larger than max_size"""
+    from PIL import Image
+
+    full_path = os.path.join(current_app.root_path, 'static', path)
+    with Image.open(full_path) as image:
+        if max(image.size) <= max_size:
+            return
+        image.thumbnail((max_size, max_size))
+        image.save(full_path, optimize=True)
+
+@job('refresh_rollups')
+def refresh_rollups_job(current_job):
+    from rollups import refresh_rollups
+
+    refresh_rollups()
+
+@job('build_recommendations')
+def build_recommendations_job(current_job):
+    from recommender import build_recommendations
+
+    build_recommendations()
@@ -0,0 +1,75 @@
+from contextlib import contextmanager
+
+from flask import request
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import joinedload, selectinload
+
+from extensions import db
+
+# Relationships preloaded per view, keyed by endpoint and then by the model
+# being queried. Filled in by the @preloads decorator on each route.
+VIEW_PRELOADS = {}
+
+def preloads(mapping):
+    """Declare which relationships a view preloads, e.g.
+
+        @preloads({Event: ('organizer', 'club'), Rating: ('user',)})
+
+    Paths may be dotted ('registrations.user') to reach nested relationships.
+    """
+    def decorator(view):
+        VIEW_PRELOADS[view.__name__] = mapping
+        return view
+    return decorator
+
+def loader_options(model, paths):
+    """Build loader options for relationship paths on a model.
+
+    Many-to-one relationships are joined into the main query; collections
+    are fetched with one extra SELECT ... IN query each.
+    """
+    options = []
+    for path in paths:
+        current_model = model
+        option = None
+        for name in path.split('.'):
+            attribute = getattr(current_model, name)
+            relationship = attribute.property
+            if relationship.uselist:
+                option = option.selectinload(attribute) if option else selectinload(attribute)
+            else:
+                option = option.joinedload(attribute) if option else joinedload(attribute)
+            current_model = relationship.mapper.class_
+        options.append(option)
+    return options
+
+def preloaded(query, *paths):
+    """Apply the current view's preloads for the query's model.
+
+    Explicit paths replace the view defaults.
+    """
+    model = query.column_descriptions[0]['entity']
+    if not paths:
+        paths = VIEW_PRELOADS.get(request.endpoint, {}).get(model, ())
+    if not paths:
+        return query
+    return query.options(*loader_options(model, paths))
+
+@contextmanager
+def count_queries(engine=None):
+    """Count the SQL statements executed inside the block.
+
+    Yields a list that collects each statement's SQL text.
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    if engine is None:
+        engine = db.engine
+    sa_event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        sa_event.remove(engine, 'before_cursor_execute', record)
@@ -0,0 +1,48 @@
+import json
+import logging
+import sys
+import time
+
+from flask.logging import default_handler
+
+# Attributes of every log record; any others were passed with extra={...}
+STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, e.g.
+
+        {"time": "2025-05-01T09:30:00.125Z", "level": "ERROR", "logger": "routes",
+         "message": "Check-in failed", "event_id": 12}
+
+    Fields given with extra={...} are added as they are, so log lines can
+    be filtered by event or user without parsing the message.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in STANDARD_ATTRIBUTES:
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+LOG_FORMATTERS = {
+    'text': lambda: logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'),
+    'json': JsonFormatter,
+}
+
+def configure_logging(app):
+    """Send every logger's records to stderr in the app's LOG_FORMAT, from LOG_LEVEL up"""
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(LOG_FORMATTERS[app.config['LOG_FORMAT']]())
+    root = logging.getLogger()
+    # Replace rather than add, so building a second app doesn't log twice
+    root.handlers[:] = [handler]
+    root.setLevel(app.config['LOG_LEVEL'])
+    app.logger.removeHandler(default_handler)
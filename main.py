@@ -1,5 +1,10 @@
-from app import app
-import routes  # noqa: F401
+from app import create_app
+
+# The app gunicorn serves and `flask --app main` runs commands against
+app = create_app()
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080, debug=True)
+    from migrations import run_migrations
+    with app.app_context():
+        run_migrations()
+    app.run(host="0.0.0.0", port=8080)  # debug follows the APP_ENV profile
@@ -0,0 +1,222 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from extensions import db
+from models import User, Event, Reminder, SchemaMigration, normalize_name
+import search
+
+# Migrations by version, registered with @migration in the order they apply
+MIGRATIONS = []
+
+# Arbitrary key for the PostgreSQL advisory lock held while migrating
+MIGRATION_LOCK_KEY = 7318021
+
+# How long online DDL may wait for a table lock before giving up, so it
+# never queues up requests behind a long-running transaction
+ONLINE_LOCK_TIMEOUT = '5s'
+
+def migration(version, name):
+    """Register a function as schema migration number `version`.
+
+    Migrations are called as migration(context) with a MigrationContext
+    and must be safe to run on a database that already has the change:
+    databases set up before migrations existed run every one of them.
+    """
+    def decorator(apply):
+        MIGRATIONS.append((version, name, apply))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return apply
+    return decorator
+
+class MigrationContext:
+    """Schema helpers for migrations.
+
+    In online mode indexes are built concurrently on PostgreSQL, DDL gives
+    up rather than waiting long for locks, and backfills commit in batches
+    so no long transaction holds row locks while the app is serving.
+    """
+
+    def __init__(self, online=False, batch_size=1000, echo=print):
+        self.online = online
+        self.batch_size = batch_size
+        self.echo = echo
+        self.dialect = db.engine.dialect.name
+
+    def add_columns(self, model, columns):
+        """Add columns, given as {name: DDL}, that the table lacks. Returns the names added."""
+        table = model.__tablename__
+        existing = {column['name'] for column in inspect(db.engine).get_columns(table)}
+        added = []
+        for name, ddl in columns.items():
+            if name not in existing:
+                if self.online and self.dialect == 'postgresql':
+                    db.session.execute(text(f"SET LOCAL lock_timeout = '{ONLINE_LOCK_TIMEOUT}'"))
+                db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+                db.session.commit()
+                self.echo(f"Added column {table}.{name}")
+                added.append(name)
+        return added
+
+    def create_indexes(self, model=None):
+        """Create the indexes declared on the models, or on one model, that the database lacks"""
+        tables = [model.__table__] if model else db.metadata.sorted_tables
+        inspector = inspect(db.engine)
+        invalid = set()
+        if self.dialect == 'postgresql':
+            # Left behind by a concurrent build that failed; rebuilt below
+            invalid = set(db.session.scalars(text(
+                "SELECT indexrelid::regclass::text FROM pg_index WHERE NOT indisvalid")))
+        for table in tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table.name)} - invalid
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                if self.online and self.dialect == 'postgresql':
+                    self._create_index_concurrently(index)
+                else:
+                    if index.name in invalid:
+                        db.session.execute(text(f"DROP INDEX {index.name}"))
+                        db.session.commit()
+                    index.create(db.engine)
+                self.echo(f"Created index {index.name}")
+
+    def _create_index_concurrently(self, index):
+        ddl = str(CreateIndex(index).compile(dialect=db.engine.dialect))
+        ddl = ddl.replace(' INDEX ', ' INDEX CONCURRENTLY ', 1)
+        # CONCURRENTLY can't run in a transaction block
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.execute(text(f"SET lock_timeout = '{ONLINE_LOCK_TIMEOUT}'"))
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+            connection.execute(text(ddl))
+
+    def backfill(self, model, update):
+        """Run update(*criteria) over the table, in primary-key batches when online.
+
+        update receives criteria restricting it to one batch of rows and
+        returns the number of rows it changed. Returns the total.
+        """
+        if not self.online:
+            updated = update()
+            db.session.commit()
+            return updated
+
+        key = model.__mapper__.primary_key[0]
+        last_id = db.session.scalar(db.select(db.func.max(key))) or 0
+        updated = 0
+        for start in range(0, last_id, self.batch_size):
+            updated += update(key > start, key <= start + self.batch_size)
+            db.session.commit()
+        return updated
+
+def backfill_name_keys(batch_size=1000):
+    """Fill in the normalized full-name key of every user. Returns the number updated."""
+    last_id = 0
+    updated = 0
+    while True:
+        rows = db.session.query(User.id, User.first_name, User.last_name) \
+            .filter(User.id > last_id) \
+            .order_by(User.id) \
+            .limit(batch_size) \
+            .all()
+        if not rows:
+            return updated
+        db.session.execute(db.update(User), [
+            {'id': user_id, 'full_name_key': normalize_name(f"{first_name} {last_name}")}
+            for user_id, first_name, last_name in rows
+        ])
+        db.session.commit()
+        last_id = rows[-1].id
+        updated += len(rows)
+
+@migration(1, 'create_missing_tables')
+def create_missing_tables(context):
+    # Also creates the full-text search index; see search.py
+    db.create_all()
+
+@migration(2, 'event_counters')
+def add_event_counters(context):
+    added = context.add_columns(Event, {
+        'registration_count': 'INTEGER NOT NULL DEFAULT 0',
+        'attendance_count': 'INTEGER NOT NULL DEFAULT 0',
+        'rating_sum': 'INTEGER NOT NULL DEFAULT 0',
+        'rating_count': 'INTEGER NOT NULL DEFAULT 0',
+        'roster_version': 'INTEGER NOT NULL DEFAULT 0',
+    })
+    if added:
+        updated = context.backfill(Event, Event.reconcile_counters)
+        context.echo(f"Reconciled counters for {updated} events")
+
+@migration(3, 'user_name_keys')
+def add_user_name_keys(context):
+    if context.add_columns(User, {'full_name_key': 'VARCHAR(129)'}):
+        updated = backfill_name_keys(context.batch_size)
+        context.echo(f"Rebuilt name keys for {updated} users")
+
+@migration(4, 'reminder_dispatch')
+def add_reminder_dispatch_columns(context):
+    context.add_columns(Reminder, {
+        'sent_at': 'TIMESTAMP',
+        'claimed_at': 'TIMESTAMP',
+        'claim_token': 'VARCHAR(32)',
+    })
+
+@migration(5, 'query_indexes')
+def create_query_indexes(context):
+    # Keyset paging, rollups, reminders, rosters and the advisor's findings
+    context.create_indexes()
+
+@migration(6, 'search_index')
+def fill_search_index(context):
+    search.rebuild_search_index()
+    db.session.commit()
+
+def applied_versions():
+    return set(db.session.scalars(db.select(SchemaMigration.version)))
+
+def pending_migrations():
+    if not inspect(db.engine).has_table(SchemaMigration.__tablename__):
+        return list(MIGRATIONS)
+    applied = applied_versions()
+    return [entry for entry in MIGRATIONS if entry[0] not in applied]
+
+def _stamp(version, name):
+    db.session.add(SchemaMigration(version=version, name=name))
+    db.session.commit()
+
+def run_migrations(online=False, batch_size=1000, echo=print):
+    """Bring the schema up to date and return the names of the migrations applied.
+
+    An empty database gets the current schema in one go and every migration
+    is recorded as applied. Run it once before starting the app's workers;
+    on PostgreSQL an advisory lock makes overlapping runs wait their turn.
+    """
+    lock = None
+    if db.engine.dialect.name == 'postgresql':
+        lock = db.engine.connect()
+        lock.execute(text("SELECT pg_advisory_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+    try:
+        existing_tables = set(inspect(db.engine).get_table_names())
+        if not existing_tables & set(db.metadata.tables):
+            db.create_all()
+            for version, name, _ in MIGRATIONS:
+                _stamp(version, name)
+            echo("Created the schema")
+            return [name for _, name, _ in MIGRATIONS]
+
+        if SchemaMigration.__tablename__ not in existing_tables:
+            SchemaMigration.__table__.create(db.engine)
+
+        context = MigrationContext(online, batch_size, echo)
+        applied = []
+        for version, name, apply in pending_migrations():
+            echo(f"Applying migration {version}: {name}")
+            apply(context)
+            _stamp(version, name)
+            applied.append(name)
+        return applied
+    finally:
+        if lock is not None:
+            lock.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': MIGRATION_LOCK_KEY})
+            lock.close()
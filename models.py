@@ -4,6 +4,10 @@ from werkzeug.security import generate_password_hash, check_password_hash
 
 from extensions import db
 
+def normalize_name(name):
+    """Normalize a person's name for lookups: case-folded, single-spaced"""
+    return ' '.join((name or '').casefold().split())
+
 # Define user roles
 class UserRole:
     ADMIN = 'admin'
@@ -19,10 +23,13 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     first_name = db.Column(db.String(64), nullable=False)
     last_name = db.Column(db.String(64), nullable=False)
-    role = db.Column(db.String(20), nullable=False, default=UserRole.STUDENT)
+    # normalize_name(first_name + last_name), kept current by the mapper
+    # events below; indexed for exact and prefix lookups at check-in
+    full_name_key = db.Column(db.String(129), nullable=True, index=True)
+    role = db.Column(db.String(20), nullable=False, default=UserRole.STUDENT, index=True)
     profile_picture = db.Column(db.String(255), nullable=True)
     bio = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.now)
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     
     # Relationships
@@ -32,6 +39,7 @@ class User(UserMixin, db.Model):
     attendances = db.relationship('Attendance', backref='user', lazy=True)
     ratings = db.relationship('Rating', backref='user', lazy=True)
     reminders = db.relationship('Reminder', backref='user', lazy=True)
+    waitlist_entries = db.relationship('WaitlistEntry', backref='user', lazy=True)
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -50,6 +58,17 @@ class User(UserMixin, db.Model):
     
     def is_student(self):
         return self.role == UserRole.STUDENT
+    
+    @classmethod
+    def name_prefix_filter(cls, prefix):
+        """Filter matching full names that start with prefix, using the index"""
+        key = normalize_name(prefix)
+        return db.and_(cls.full_name_key >= key, cls.full_name_key < key + '\uffff')
+
+@db.event.listens_for(User, 'before_insert')
+@db.event.listens_for(User, 'before_update')
+def update_full_name_key(mapper, connection, user):
+    user.full_name_key = normalize_name(user.get_full_name())
 
 class Club(db.Model):
     __tablename__ = 'clubs'
@@ -58,7 +77,7 @@ class Club(db.Model):
     name = db.Column(db.String(120), unique=True, nullable=False)
     description = db.Column(db.Text, nullable=True)
     logo = db.Column(db.String(255), nullable=True)
-    admin_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    admin_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     
@@ -87,42 +106,112 @@ class Event(db.Model):
     start_time = db.Column(db.DateTime, nullable=False)
     end_time = db.Column(db.DateTime, nullable=False)
     location = db.Column(db.String(120), nullable=False)
-    category = db.Column(db.String(50), nullable=False)
+    category = db.Column(db.String(50), nullable=False, index=True)
     max_participants = db.Column(db.Integer, nullable=True)
     poster = db.Column(db.String(255), nullable=True)
     organizer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    club_id = db.Column(db.Integer, db.ForeignKey('clubs.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.now)
+    club_id = db.Column(db.Integer, db.ForeignKey('clubs.id'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     
+    # Denormalized counters, kept in step with the source tables by the routes
+    # that write them and rebuilt by `flask reconcile-counters`
+    registration_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    attendance_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped whenever the check-in roster changes; see RosterChange
+    roster_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Relationships
     registrations = db.relationship('Registration', backref='event', lazy=True, cascade="all, delete-orphan")
     attendances = db.relationship('Attendance', backref='event', lazy=True, cascade="all, delete-orphan")
     ratings = db.relationship('Rating', backref='event', lazy=True, cascade="all, delete-orphan")
     photos = db.relationship('Photo', backref='event', lazy=True, cascade="all, delete-orphan")
     reminders = db.relationship('Reminder', backref='event', lazy=True, cascade="all, delete-orphan")
+    roster_changes = db.relationship('RosterChange', backref='event', lazy=True, cascade="all, delete-orphan")
+    waitlist_entries = db.relationship('WaitlistEntry', backref='event', lazy=True, cascade="all, delete-orphan")
     
-    def is_past(self):
-        return datetime.now() > self.end_time
+    __table_args__ = (
+        # Date-window lookups such as the calendar feed
+        db.Index('ix_events_start_end', 'start_time', 'end_time'),
+        # Keyset pages of the event lists, overall and per organizer
+        db.Index('ix_events_start_id', 'start_time', 'id'),
+        db.Index('ix_events_organizer_start_id', 'organizer_id', 'start_time', 'id'),
+        # Events changed since the last rollup refresh
+        db.Index('ix_events_updated_at', 'updated_at'),
+    )
     
-    def is_upcoming(self):
-        return datetime.now() < self.start_time
+    # Pass `now` when classifying many events so they share one reference time
+    def is_past(self, now=None):
+        return (now or datetime.now()) > self.end_time
     
-    def is_ongoing(self):
-        now = datetime.now()
+    def is_upcoming(self, now=None):
+        return (now or datetime.now()) < self.start_time
+    
+    def is_ongoing(self, now=None):
+        now = now or datetime.now()
         return self.start_time <= now <= self.end_time
     
+    # Figures attached by utils.attach_event_stats; when absent the stored
+    # counters are used instead
+    stats = None
+    
     def get_registration_count(self):
-        return Registration.query.filter_by(event_id=self.id).count()
+        if self.stats is not None:
+            return self.stats['registrations']
+        return self.registration_count or 0
     
     def get_attendance_count(self):
-        return Attendance.query.filter_by(event_id=self.id).count()
+        if self.stats is not None:
+            return self.stats['attendance']
+        return self.attendance_count or 0
+    
+    def get_rating_count(self):
+        if self.stats is not None:
+            return self.stats['ratings']
+        return self.rating_count or 0
     
     def get_average_rating(self):
-        ratings = Rating.query.filter_by(event_id=self.id).all()
-        if not ratings:
+        if self.stats is not None:
+            return self.stats['average_rating']
+        if not self.rating_count:
             return 0
-        return sum(rating.rating for rating in ratings) / len(ratings)
+        return self.rating_sum / self.rating_count
+    
+    def update_counters(self, registrations=0, attendances=0, rating_sum=0, ratings=0):
+        """Adjust the stored counters as part of the current transaction.
+        
+        The increments are issued as ``col = col + n`` so concurrent writers
+        never overwrite each other's updates.
+        """
+        if registrations:
+            self.registration_count = Event.registration_count + registrations
+        if attendances:
+            self.attendance_count = Event.attendance_count + attendances
+        if rating_sum:
+            self.rating_sum = Event.rating_sum + rating_sum
+        if ratings:
+            self.rating_count = Event.rating_count + ratings
+    
+    @classmethod
+    def reconcile_counters(cls, *criteria):
+        """Rebuild the counters of every event, or of those matching criteria,
+        from the source tables"""
+        def event_aggregate(model, expr):
+            return (db.select(expr)
+                    .where(model.event_id == cls.id)
+                    .scalar_subquery())
+        
+        result = db.session.execute(
+            db.update(cls).values(
+                registration_count=event_aggregate(Registration, db.func.count(Registration.id)),
+                attendance_count=event_aggregate(Attendance, db.func.count(Attendance.id)),
+                rating_sum=event_aggregate(Rating, db.func.coalesce(db.func.sum(Rating.rating), 0)),
+                rating_count=event_aggregate(Rating, db.func.count(Rating.id)),
+            ).where(*criteria)
+        )
+        return result.rowcount
 
 class Registration(db.Model):
     __tablename__ = 'registrations'
@@ -134,6 +223,8 @@ class Registration(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('user_id', 'event_id', name='unique_user_event_registration'),
+        # The unique constraint serves lookups by user; this one serves an event's roster
+        db.Index('ix_registrations_event_user', 'event_id', 'user_id'),
     )
 
 class Attendance(db.Model):
@@ -146,6 +237,7 @@ class Attendance(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('user_id', 'event_id', name='unique_user_event_attendance'),
+        db.Index('ix_attendance_event_user', 'event_id', 'user_id'),
     )
 
 class Rating(db.Model):
@@ -160,6 +252,8 @@ class Rating(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('user_id', 'event_id', name='unique_user_event_rating'),
+        # Covers an event's rating count and average without reading the rows
+        db.Index('ix_ratings_event_rating', 'event_id', 'rating'),
     )
 
 class Photo(db.Model):
@@ -179,7 +273,123 @@ class Reminder(db.Model):
     event_id = db.Column(db.Integer, db.ForeignKey('events.id'), nullable=False)
     remind_at = db.Column(db.DateTime, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.now)
+    # Set by the dispatcher in reminders.py
+    sent_at = db.Column(db.DateTime, nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    claim_token = db.Column(db.String(32), nullable=True)
     
     __table_args__ = (
         db.UniqueConstraint('user_id', 'event_id', name='unique_user_event_reminder'),
+        # Unsent reminders by due time; sent ones drop out of the index
+        db.Index('ix_reminders_pending_remind_at', 'remind_at',
+                 sqlite_where=db.text('sent_at IS NULL'),
+                 postgresql_where=db.text('sent_at IS NULL')),
+        db.Index('ix_reminders_claim_token', 'claim_token'),
+    )
+
+class WaitlistEntry(db.Model):
+    """A place in line for a full event. Entries are served in id order."""
+    __tablename__ = 'waitlist_entries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'event_id', name='unique_user_event_waitlist'),
+        # The head of each event's line, and positions within it
+        db.Index('ix_waitlist_entries_event_id_id', 'event_id', 'id'),
+    )
+
+class DailyEventStats(db.Model):
+    """Rollup of events and their counters by start day, club, organizer and
+    category. Rebuilt from the events table by rollups.refresh_rollups."""
+    __tablename__ = 'daily_event_stats'
+    
+    day = db.Column(db.Date, primary_key=True)
+    club_id = db.Column(db.Integer, primary_key=True)
+    organizer_id = db.Column(db.Integer, primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    events = db.Column(db.Integer, nullable=False, default=0)
+    registrations = db.Column(db.Integer, nullable=False, default=0)
+    attendances = db.Column(db.Integer, nullable=False, default=0)
+    ratings = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index('ix_daily_event_stats_organizer_day', 'organizer_id', 'day'),
     )
+
+class RollupState(db.Model):
+    """When each rollup was last refreshed"""
+    __tablename__ = 'rollup_state'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+
+class RosterAction:
+    REGISTERED = 'registered'
+    UNREGISTERED = 'unregistered'
+    CHECKED_IN = 'checked_in'
+
+class RosterChange(db.Model):
+    """Log of roster changes that door devices sync from, by event version"""
+    __tablename__ = 'roster_changes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id'), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    action = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    
+    __table_args__ = (
+        db.Index('ix_roster_changes_event_version', 'event_id', 'version'),
+    )
+
+class JobStatus:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+
+class Job(db.Model):
+    """Background job run by the local worker pool in jobs.py"""
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default=JobStatus.QUEUED, index=True)
+    # Jobs with the same key are not queued twice while one is pending
+    dedupe_key = db.Column(db.String(120), nullable=True, index=True)
+    artifact = db.Column(db.String(255), nullable=True)
+    download_name = db.Column(db.String(255), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def is_pending(self):
+        return self.status in (JobStatus.QUEUED, JobStatus.RUNNING)
+
+class CacheVersion(db.Model):
+    """Version stamps for cached data, shared by every worker process.
+
+    Writers bump a name in the same transaction as the change, and readers
+    compare it with the version their cached copy was built from.
+    """
+    __tablename__ = 'cache_versions'
+    
+    name = db.Column(db.String(120), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class SchemaMigration(db.Model):
+    """A migration from migrations.py that has been applied to this database"""
+    __tablename__ = 'schema_migrations'
+    
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
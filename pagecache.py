@@ -0,0 +1,144 @@
+import hashlib
+import json
+import threading
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import current_app, make_response, request, session, Response
+from flask_login import current_user
+
+from cache import TTLCache, bump_version, current_versions
+
+# Tags for the public pages; detail pages also carry their event's tag
+EVENT_LIST_TAG = 'pages:events'
+CLUB_TAG = 'pages:clubs'
+
+def event_tag(event_id):
+    return f'pages:event:{event_id}'
+
+def invalidate_pages(*tags):
+    """Expire cached pages carrying any of these tags, in the current transaction"""
+    bump_version(*tags)
+
+class MemoryBackend(TTLCache):
+    """Bounded in-process LRU of rendered pages"""
+
+    def __init__(self, config):
+        super().__init__(config['PAGE_CACHE_MAX_ENTRIES'])
+
+class FakeRedis:
+    """The few Redis commands the page cache uses, kept in process.
+
+    Stands in for a server when PAGE_CACHE_REDIS_URL is memory://, e.g. in
+    development and tests.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            value = self._values.get(name)
+            if value is None:
+                return None
+            if value[0] is not None and value[0] <= time.monotonic():
+                del self._values[name]
+                return None
+            return value[1]
+
+    def set(self, name, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode()
+        with self._lock:
+            self._values[name] = (time.monotonic() + ex if ex else None, value)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._values.pop(name, None) is not None for name in names)
+
+class RedisBackend:
+    """Rendered pages in Redis, shared by every app process, expired by TTL"""
+
+    def __init__(self, config, client=None):
+        if client is None:
+            url = config['PAGE_CACHE_REDIS_URL']
+            if url == 'memory://':
+                client = FakeRedis()
+            else:
+                import redis
+                client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = config['PAGE_CACHE_KEY_PREFIX']
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, page, ttl):
+        self.client.set(self.prefix + key, json.dumps(page), ex=ttl)
+
+PAGE_CACHE_BACKENDS = {
+    'memory': MemoryBackend,
+    'redis': RedisBackend,
+}
+
+def get_backend():
+    # One backend per app, created on first use
+    backend = current_app.extensions.get('page_cache')
+    if backend is None:
+        backend = PAGE_CACHE_BACKENDS[current_app.config['PAGE_CACHE_BACKEND']](current_app.config)
+        current_app.extensions['page_cache'] = backend
+    return backend
+
+def page_key():
+    # Query arguments are sorted so the same page always has the same key
+    query = urlencode(sorted(request.args.items(multi=True)))
+    return f'{request.path}?{query}'
+
+def _page_response(page):
+    response = Response(page['body'], content_type=page['content_type'])
+    response.set_etag(page['etag'])
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['PAGE_CACHE_MAX_AGE']
+    return response.make_conditional(request)
+
+def cached_page(*tags):
+    """Serve a public view from the page cache to anonymous visitors.
+
+    Tags may name view arguments, e.g. 'pages:event:{event_id}'. A page is
+    rebuilt once any of its tags is invalidated, or after PAGE_CACHE_TTL
+    seconds so time-dependent content and live counts catch up. Cached
+    responses carry an ETag and a public Cache-Control so a reverse proxy
+    can serve them too; signed-in users get their own, private pages.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if (request.method not in ('GET', 'HEAD') or current_user.is_authenticated
+                    or '_flashes' in session):
+                response = make_response(view(**kwargs))
+                response.cache_control.private = True
+                return response
+
+            # Read the tag versions before rendering, so a write made
+            # meanwhile expires the page we are about to store
+            versions = current_versions([tag.format(**kwargs) for tag in tags])
+            backend = get_backend()
+            key = page_key()
+            page = backend.get(key)
+            if page is None or page['tags'] != versions:
+                response = make_response(view(**kwargs))
+                # Pages that set cookies or aren't plain successes are never shared
+                if response.status_code != 200 or session.modified:
+                    response.cache_control.private = True
+                    return response
+                body = response.get_data(as_text=True)
+                page = {'tags': versions, 'body': body, 'content_type': response.content_type,
+                        'etag': hashlib.md5(body.encode()).hexdigest()}
+                backend.set(key, page, current_app.config['PAGE_CACHE_TTL'])
+            return _page_response(page)
+        return wrapper
+    return decorator
@@ -0,0 +1,67 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import DateTime
+
+from extensions import db
+
+class KeysetPage:
+    """One page of results plus the cursor for the page after it"""
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+def encode_cursor(values):
+    payload = json.dumps([value.isoformat() if isinstance(value, datetime) else value
+                          for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, columns):
+    """Decode a cursor into values for columns, or None if it is malformed"""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(payload)
+        if not isinstance(values, list) or len(values) != len(columns):
+            return None
+        return [datetime.fromisoformat(value) if isinstance(column.type, DateTime) else value
+                for column, value in zip(columns, values)]
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        return None
+
+def keyset_page(query, columns, cursor=None, per_page=20, descending=False):
+    """Return the page of query that follows cursor, ordered by columns.
+
+    The last column must be unique (normally the primary key) so the order
+    is total. Instead of an OFFSET, each page seeks past the last row of the
+    previous one, so with an index on the columns every page costs the same.
+    Columns may also come from a joined subquery, e.g. a search rank; they
+    are selected alongside the items to build the cursor.
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        if values is not None:
+            row, last = db.tuple_(*columns), db.tuple_(*values)
+            query = query.filter(row < last if descending else row > last)
+
+    order = [column.desc() if descending else column for column in columns]
+    # One extra row tells us whether there is a next page
+    rows = query.add_columns(*columns).order_by(*order).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(list(rows[-1][1:]))
+    return KeysetPage([row[0] for row in rows], next_cursor)
@@ -0,0 +1,27 @@
+import importlib
+import time
+
+# Modules the first export, QR code or recommendation in a worker would
+# otherwise import while a user waits
+PRELOAD_MODULES = ('openpyxl', 'qrcode', 'qrcode.image.pil', 'PIL.Image', 'recommender')
+
+def preload_heavy_modules(logger=None, modules=PRELOAD_MODULES):
+    """Import the heavy libraries now and return the seconds each took.
+    
+    Called while building the app when PRELOAD_HEAVY_MODULES is set. Under
+    `gunicorn --preload` that happens once in the master, and the forked
+    workers share the loaded modules' memory until they write to it.
+    """
+    timings = {}
+    for name in modules:
+        started = time.perf_counter()
+        importlib.import_module(name)
+        timings[name] = time.perf_counter() - started
+    # Pillow otherwise registers its image format plugins on the first save
+    from PIL import Image
+    started = time.perf_counter()
+    Image.init()
+    timings['PIL plugins'] = time.perf_counter() - started
+    if logger is not None:
+        logger.info("Preloaded %s in %.0f ms", ', '.join(timings), sum(timings.values()) * 1000)
+    return timings
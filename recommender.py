@@ -0,0 +1,238 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import current_app
+
+from extensions import db
+from models import Event, Registration, Attendance, Rating, User
+from jobs import enqueue
+
+# How much each kind of interaction says about a user's taste
+REGISTRATION_WEIGHT = 1.0
+ATTENDANCE_WEIGHT = 1.0
+RATING_WEIGHT = 0.5  # per star above or below 3
+
+# How much each part of a user's vector counts towards an event's score
+CATEGORY_WEIGHT = 1.0
+CLUB_WEIGHT = 0.5
+CO_REGISTRATION_WEIGHT = 1.0
+POPULARITY_WEIGHT = 0.2
+
+class RecommendationModel:
+    """Precomputed user and event vectors; an event's score for a user is
+    the dot product of the two.
+
+    Event vectors are one-hot category and club columns, co-registration
+    factors and a popularity column, for events upcoming when the model was
+    built. User vectors hold the matching category and club affinities,
+    factors and popularity weight, stored as float16 to keep them compact.
+    """
+
+    def __init__(self, user_ids, user_vectors, event_ids, event_vectors, event_starts, built_at):
+        self.user_ids = user_ids
+        self.user_vectors = user_vectors
+        self.event_ids = event_ids
+        self.event_vectors = event_vectors
+        self.event_starts = event_starts
+        self.built_at = built_at
+        # Users without history are ranked by popularity alone
+        self.cold_vector = np.zeros(event_vectors.shape[1], dtype=np.float32)
+        self.cold_vector[-1] = POPULARITY_WEIGHT
+
+    def user_vector(self, user_id):
+        position = np.searchsorted(self.user_ids, user_id)
+        if position < len(self.user_ids) and self.user_ids[position] == user_id:
+            return self.user_vectors[position].astype(np.float32)
+        return self.cold_vector
+
+    def top_event_ids(self, user_id, k, exclude_ids=(), now=None):
+        """Ids of the k best scoring events that haven't started, best first"""
+        now = now or datetime.now()
+        scores = self.event_vectors @ self.user_vector(user_id)
+        candidates = self.event_starts > now.timestamp()
+        if len(exclude_ids):
+            candidates &= ~np.isin(self.event_ids, np.fromiter(exclude_ids, dtype=np.int64))
+        k = min(k, int(candidates.sum()))
+        if k == 0:
+            return []
+        scores = np.where(candidates, scores, -np.inf)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return self.event_ids[top].tolist()
+
+    def save(self, path):
+        # Write a new file and swap it in, so readers never see half a model
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as output:
+            np.savez(output, user_ids=self.user_ids, user_vectors=self.user_vectors,
+                     event_ids=self.event_ids, event_vectors=self.event_vectors,
+                     event_starts=self.event_starts, built_at=np.float64(self.built_at.timestamp()))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['user_ids'], data['user_vectors'], data['event_ids'],
+                       data['event_vectors'], data['event_starts'],
+                       datetime.fromtimestamp(float(data['built_at'])))
+
+def _sparse_product(rows, cols, values, dense, n_rows):
+    """Multiply the sparse matrix given as (rows, cols, values) by a dense one"""
+    result = np.empty((n_rows, dense.shape[1]), dtype=np.float64)
+    for column in range(dense.shape[1]):
+        result[:, column] = np.bincount(rows, weights=values * dense[cols, column], minlength=n_rows)
+    return result
+
+def _normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float64)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+def _event_factors(user_index, event_index, weights, n_users, n_events, factors, seed=0):
+    """Top right singular vectors of the user-event matrix, one row per event.
+
+    A randomized SVD with two power iterations, working on the matrix as
+    coordinate arrays so it is never materialized.
+    """
+    rank = min(factors, n_users, n_events)
+    oversampled = min(rank + 10, n_events)
+    probe = np.random.default_rng(seed).standard_normal((n_events, oversampled))
+    basis = _sparse_product(user_index, event_index, weights, probe, n_users)
+    for _ in range(2):
+        basis, _ = np.linalg.qr(basis)
+        basis = _sparse_product(event_index, user_index, weights, basis, n_events)
+        basis, _ = np.linalg.qr(basis)
+        basis = _sparse_product(user_index, event_index, weights, basis, n_users)
+    basis, _ = np.linalg.qr(basis)
+    # Project the matrix onto the basis and decompose the small result
+    projected = _sparse_product(event_index, user_index, weights, basis, n_events).T
+    _, _, right = np.linalg.svd(projected, full_matrices=False)
+    return right[:rank].T
+
+def compute_model(user_ids, event_ids, event_categories, event_clubs, event_starts,
+                  user_index, event_index, weights, factors=32, built_at=None):
+    """Build a RecommendationModel from interaction arrays.
+
+    user_ids and event_ids are sorted; event_categories and event_clubs give
+    each event's category and club as small integer codes; event_starts are
+    POSIX timestamps. Each interaction is a (user_index, event_index, weight)
+    triple, with repeated pairs summed.
+    """
+    built_at = built_at or datetime.now()
+    n_users, n_events = len(user_ids), len(event_ids)
+    n_categories = int(event_categories.max()) + 1 if n_events else 0
+    n_clubs = int(event_clubs.max()) + 1 if n_events else 0
+
+    # Combine the interactions for each user and event pair
+    pairs, inverse = np.unique(user_index.astype(np.int64) * n_events + event_index, return_inverse=True)
+    weights = np.bincount(inverse, weights=weights)
+    user_index, event_index = pairs // n_events, pairs % n_events
+
+    # Affinity for each category and club, from the events the user took part in
+    category_affinity = np.bincount(user_index * n_categories + event_categories[event_index],
+                                    weights=weights, minlength=n_users * n_categories)
+    club_affinity = np.bincount(user_index * n_clubs + event_clubs[event_index],
+                                weights=weights, minlength=n_users * n_clubs)
+    category_affinity = _normalize_rows(category_affinity.reshape(n_users, n_categories))
+    club_affinity = _normalize_rows(club_affinity.reshape(n_users, n_clubs))
+
+    # Co-registration: events share factors when the same people sign up for
+    # them. Dividing by sqrt(popularity) stops the biggest events dominating.
+    popularity = np.bincount(event_index, minlength=n_events)
+    scaled = weights / np.sqrt(np.maximum(popularity, 1))[event_index]
+    event_factors = _event_factors(user_index, event_index, scaled, n_users, n_events, factors)
+    user_factors = _normalize_rows(
+        _sparse_product(user_index, event_index, scaled, event_factors, n_users))
+    event_factors = _normalize_rows(event_factors)
+
+    # Only users with history and events still to come are kept
+    active_users = np.bincount(user_index, minlength=n_users) > 0
+    user_vectors = np.hstack([
+        CATEGORY_WEIGHT * category_affinity,
+        CLUB_WEIGHT * club_affinity,
+        CO_REGISTRATION_WEIGHT * user_factors,
+        np.full((n_users, 1), POPULARITY_WEIGHT),
+    ])[active_users].astype(np.float16)
+
+    upcoming = event_starts > built_at.timestamp()
+    event_vectors = np.hstack([
+        np.eye(n_categories)[event_categories],
+        np.eye(n_clubs)[event_clubs],
+        event_factors,
+        (np.log1p(popularity) / max(np.log1p(popularity.max(initial=0)), 1))[:, None],
+    ])[upcoming].astype(np.float32)
+
+    return RecommendationModel(np.asarray(user_ids)[active_users], user_vectors,
+                               np.asarray(event_ids)[upcoming], event_vectors,
+                               np.asarray(event_starts, dtype=np.float64)[upcoming], built_at)
+
+def build_recommendations(factors=None):
+    """Compute the model from the database and save it. Returns the model."""
+    factors = factors or current_app.config['RECOMMENDATION_FACTORS']
+    user_ids = np.array(db.session.scalars(db.select(User.id).order_by(User.id)).all(), dtype=np.int64)
+    events = db.session.execute(
+        db.select(Event.id, Event.category, Event.club_id, Event.start_time).order_by(Event.id)).all()
+    event_ids = np.array([row.id for row in events], dtype=np.int64)
+    _, event_categories = np.unique([row.category for row in events], return_inverse=True)
+    _, event_clubs = np.unique(np.array([row.club_id for row in events], dtype=np.int64), return_inverse=True)
+    event_starts = np.array([row.start_time.timestamp() for row in events], dtype=np.float64)
+
+    interactions = [
+        db.select(Registration.user_id, Registration.event_id, db.literal(REGISTRATION_WEIGHT)),
+        db.select(Attendance.user_id, Attendance.event_id, db.literal(ATTENDANCE_WEIGHT)),
+        db.select(Rating.user_id, Rating.event_id, RATING_WEIGHT * (Rating.rating - 3)),
+    ]
+    rows = [row for statement in interactions for row in db.session.execute(statement)]
+    pairs = np.array([(user_id, event_id) for user_id, event_id, _ in rows], dtype=np.int64).reshape(-1, 2)
+    weights = np.array([weight for _, _, weight in rows], dtype=np.float64)
+
+    model = compute_model(user_ids, event_ids, event_categories, event_clubs, event_starts,
+                          np.searchsorted(user_ids, pairs[:, 0]), np.searchsorted(event_ids, pairs[:, 1]),
+                          weights, factors)
+    model.save(current_app.config['RECOMMENDATION_FILE'])
+    return model
+
+_loaded = {'path': None, 'mtime': None, 'model': None}
+
+def get_model():
+    """The saved model, reloaded when the file changes, or None if there is none"""
+    path = current_app.config['RECOMMENDATION_FILE']
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+    if _loaded['path'] != path or _loaded['mtime'] != mtime:
+        _loaded.update(path=path, mtime=mtime, model=RecommendationModel.load(path))
+    return _loaded['model']
+
+def ensure_fresh_recommendations():
+    """Queue a rebuild if the model is missing or older than RECOMMENDATION_MAX_AGE"""
+    path = current_app.config['RECOMMENDATION_FILE']
+    max_age = current_app.config['RECOMMENDATION_MAX_AGE']
+    if not os.path.exists(path) or time.time() - os.path.getmtime(path) > max_age:
+        enqueue('build_recommendations', dedupe_key='build_recommendations')
+        db.session.commit()
+
+def recommend_events(user_id, limit=3, now=None):
+    """Upcoming events the user isn't registered for, best match first.
+
+    Without a model, falls back to the next unregistered events in the
+    coming week.
+    """
+    now = now or datetime.now()
+    registered_event_ids = db.select(Registration.event_id).where(Registration.user_id == user_id)
+    model = get_model()
+    if model is None:
+        return Event.query.filter(
+            ~Event.id.in_(registered_event_ids),
+            Event.start_time > now,
+            Event.start_time < now + timedelta(days=7)
+        ).order_by(Event.start_time).limit(limit).all()
+
+    event_ids = model.top_event_ids(user_id, limit, set(db.session.scalars(registered_event_ids)), now)
+    events = {event.id: event for event in Event.query.filter(Event.id.in_(event_ids))}
+    # Events deleted since the model was built are skipped
+    return [events[event_id] for event_id in event_ids if event_id in events]
@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import smtplib
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from flask import current_app
+
+from extensions import db
+from models import Reminder, User, Event
+
+logger = logging.getLogger(__name__)
+
+class ReminderMessage:
+    def __init__(self, reminder_id, to, subject, body):
+        self.reminder_id = reminder_id
+        self.to = to
+        self.subject = subject
+        self.body = body
+
+class FileBackend:
+    """Append each reminder as a JSON line to a file, for development and tests"""
+
+    def __init__(self, config):
+        self.path = config['REMINDER_FILE']
+
+    def deliver(self, messages):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as sink:
+            for message in messages:
+                sink.write(json.dumps({'reminder_id': message.reminder_id, 'to': message.to,
+                                       'subject': message.subject, 'body': message.body}) + '\n')
+        return [message.reminder_id for message in messages]
+
+class SMTPBackend:
+    """Send reminders as email, reusing one SMTP connection per batch"""
+
+    def __init__(self, config):
+        self.config = config
+
+    def deliver(self, messages):
+        config = self.config
+        delivered = []
+        with smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=30) as smtp:
+            if config['MAIL_USE_TLS']:
+                smtp.starttls()
+            if config['MAIL_USERNAME']:
+                smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+            for message in messages:
+                email = EmailMessage()
+                email['From'] = config['MAIL_DEFAULT_SENDER']
+                email['To'] = message.to
+                email['Subject'] = message.subject
+                email.set_content(message.body)
+                try:
+                    smtp.send_message(email)
+                except smtplib.SMTPRecipientsRefused:
+                    logger.warning("Reminder %s refused for %s", message.reminder_id, message.to)
+                    continue
+                delivered.append(message.reminder_id)
+        return delivered
+
+DELIVERY_BACKENDS = {
+    'file': FileBackend,
+    'smtp': SMTPBackend,
+}
+
+def get_backend():
+    return DELIVERY_BACKENDS[current_app.config['REMINDER_BACKEND']](current_app.config)
+
+def claim_due_reminders(batch_size, lookahead=0):
+    """Claim a batch of unsent reminders due within lookahead seconds.
+
+    One UPDATE stamps the batch with a fresh token, so concurrent
+    dispatchers never claim the same reminder; on PostgreSQL rows locked by
+    another dispatcher are skipped rather than waited for. Claims that were
+    never finished, e.g. because the dispatcher died, become claimable
+    again after REMINDER_CLAIM_TIMEOUT. Returns the claim token, or None if
+    nothing was due.
+    """
+    now = datetime.now()
+    stale = now - timedelta(seconds=current_app.config['REMINDER_CLAIM_TIMEOUT'])
+    due = db.select(Reminder.id) \
+        .where(Reminder.sent_at.is_(None),
+               Reminder.remind_at <= now + timedelta(seconds=lookahead),
+               db.or_(Reminder.claimed_at.is_(None), Reminder.claimed_at < stale)) \
+        .order_by(Reminder.remind_at) \
+        .limit(batch_size)
+    if db.engine.dialect.name == 'postgresql':
+        due = due.with_for_update(skip_locked=True)
+
+    token = uuid.uuid4().hex
+    claimed = db.session.execute(
+        db.update(Reminder)
+        .where(Reminder.id.in_(due))
+        .values(claimed_at=now, claim_token=token),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    db.session.commit()
+    return token if claimed else None
+
+def build_messages(token):
+    """Build the messages for a claimed batch with a single joined query"""
+    rows = db.session.query(Reminder.id, User.email, User.first_name,
+                            Event.title, Event.start_time, Event.location) \
+        .join(User, User.id == Reminder.user_id) \
+        .join(Event, Event.id == Reminder.event_id) \
+        .filter(Reminder.claim_token == token) \
+        .all()
+    return [ReminderMessage(
+        reminder_id,
+        email,
+        f"Reminder: {title} starts {start_time.strftime('%b %d at %I:%M %p')}",
+        f"Hi {first_name},\n\n"
+        f"This is a reminder that {title} starts on "
+        f"{start_time.strftime('%A, %B %d at %I:%M %p')} at {location}.\n\n"
+        f"See you there!"
+    ) for reminder_id, email, first_name, title, start_time, location in rows]
+
+def dispatch_batch(backend, batch_size, lookahead=0):
+    """Claim, deliver and mark one batch. Returns (claimed, delivered)."""
+    token = claim_due_reminders(batch_size, lookahead)
+    if token is None:
+        return 0, 0
+
+    messages = build_messages(token)
+    try:
+        delivered = backend.deliver(messages)
+    except Exception:
+        # Left claimed, so the batch is retried once the claim times out
+        logger.exception("Delivering %d reminders failed", len(messages))
+        return len(messages), 0
+
+    if delivered:
+        db.session.execute(
+            db.update(Reminder)
+            .where(Reminder.claim_token == token, Reminder.id.in_(delivered))
+            .values(sent_at=datetime.now(), claim_token=None),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+    return len(messages), len(delivered)
+
+def dispatch_due_reminders(batch_size=None, lookahead=0, backend=None):
+    """Send every reminder that is due, batch by batch. Returns the number sent."""
+    batch_size = batch_size or current_app.config['REMINDER_BATCH_SIZE']
+    backend = backend or get_backend()
+    sent = 0
+    while True:
+        claimed, delivered = dispatch_batch(backend, batch_size, lookahead)
+        sent += delivered
+        if claimed < batch_size or not delivered:
+            return sent
+
+def next_reminder_due():
+    """When the earliest unsent, unclaimed reminder is due, or None"""
+    return db.session.scalar(db.select(db.func.min(Reminder.remind_at))
+                             .where(Reminder.sent_at.is_(None), Reminder.claim_token.is_(None)))
+
+def run_dispatcher(interval=60, lookahead=0, batch_size=None):
+    """Send due reminders forever, sleeping until the next one is due.
+
+    Sleeps at most interval seconds so reminders created in the meantime
+    are picked up.
+    """
+    backend = get_backend()
+    while True:
+        sent = dispatch_due_reminders(batch_size, lookahead, backend)
+        if sent:
+            logger.info("Sent %d reminders", sent)
+
+        next_due = next_reminder_due()
+        db.session.remove()
+        delay = interval
+        if next_due is not None:
+            delay = min(interval, max(1, (next_due - datetime.now()).total_seconds() - lookahead))
+        time.sleep(delay)
@@ -0,0 +1,166 @@
+from datetime import date, datetime, time, timedelta
+
+from flask import current_app
+
+from extensions import db
+from models import Event, DailyEventStats, RollupState
+from jobs import enqueue
+
+ROLLUP_NAME = 'daily_event_stats'
+
+# Look back this far past the last refresh for changes committed during it
+REFRESH_OVERLAP = timedelta(minutes=5)
+
+# Events that started this recently are classified from the events table,
+# since they may still be running; older ones count as past
+RECENT_EVENT_DAYS = 7
+
+ROLLUP_COLUMNS = ['day', 'club_id', 'organizer_id', 'category', 'events',
+                  'registrations', 'attendances', 'ratings', 'rating_sum']
+
+def _as_date(value):
+    # SQLite returns date() as a string
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+def _rollup_select(*criteria):
+    day = db.func.date(Event.start_time)
+    return db.select(
+        day, Event.club_id, Event.organizer_id, Event.category,
+        db.func.count(Event.id),
+        db.func.sum(Event.registration_count),
+        db.func.sum(Event.attendance_count),
+        db.func.sum(Event.rating_count),
+        db.func.sum(Event.rating_sum),
+    ).where(*criteria).group_by(day, Event.club_id, Event.organizer_id, Event.category)
+
+def refresh_days(days):
+    """Recompute the rollup rows for these days, in the current transaction"""
+    days = sorted(set(days))
+    for start in range(0, len(days), 100):
+        chunk = days[start:start + 100]
+        db.session.execute(db.delete(DailyEventStats).where(DailyEventStats.day.in_(chunk)))
+        on_days = db.or_(*[
+            db.and_(Event.start_time >= datetime.combine(day, time.min),
+                    Event.start_time < datetime.combine(day + timedelta(days=1), time.min))
+            for day in chunk
+        ])
+        db.session.execute(db.insert(DailyEventStats).from_select(ROLLUP_COLUMNS, _rollup_select(on_days)))
+
+def refresh_rollups(full=False):
+    """Bring the daily rollups up to date and commit. Returns the days refreshed.
+
+    Every registration, check-in and rating touches its event's row, so
+    only the days of events updated since the last refresh are recomputed.
+    Days an event leaves (by deletion or a new start date) are refreshed
+    by the routes that make those changes.
+    """
+    now = datetime.now()
+    state = db.session.get(RollupState, ROLLUP_NAME)
+    if full or state is None:
+        db.session.execute(db.delete(DailyEventStats))
+        db.session.execute(db.insert(DailyEventStats).from_select(ROLLUP_COLUMNS, _rollup_select()))
+        refreshed = db.session.scalar(db.select(db.func.count(db.distinct(DailyEventStats.day))))
+    else:
+        changed_days = db.session.query(db.func.date(Event.start_time)) \
+            .filter(Event.updated_at > state.refreshed_at - REFRESH_OVERLAP) \
+            .distinct()
+        days = [_as_date(day) for (day,) in changed_days]
+        refresh_days(days)
+        refreshed = len(days)
+
+    if state is None:
+        db.session.add(RollupState(name=ROLLUP_NAME, refreshed_at=now))
+    else:
+        state.refreshed_at = now
+    db.session.commit()
+    return refreshed
+
+def ensure_fresh_rollups():
+    """Build the rollups if they don't exist yet, or queue a refresh if they are old"""
+    refreshed_at = db.session.scalar(
+        db.select(RollupState.refreshed_at).where(RollupState.name == ROLLUP_NAME))
+    if refreshed_at is None:
+        refresh_rollups()
+    elif datetime.now() - refreshed_at > timedelta(seconds=current_app.config['ROLLUP_MAX_AGE']):
+        enqueue('refresh_rollups', dedupe_key='refresh_rollups')
+        db.session.commit()
+
+def rollup_totals():
+    """Events, registrations, attendance and ratings across all days"""
+    events, registrations, attendances, ratings = db.session.execute(db.select(
+        db.func.coalesce(db.func.sum(DailyEventStats.events), 0),
+        db.func.coalesce(db.func.sum(DailyEventStats.registrations), 0),
+        db.func.coalesce(db.func.sum(DailyEventStats.attendances), 0),
+        db.func.coalesce(db.func.sum(DailyEventStats.ratings), 0),
+    )).one()
+    return {'events': events, 'registrations': registrations,
+            'attendances': attendances, 'ratings': ratings}
+
+def organizer_event_stats(organizer_id, now=None):
+    """Event totals for an organizer: total, upcoming, past, ongoing and per category.
+
+    Read from the rollups, except events that started in the last few days,
+    which are checked against the clock one by one.
+    """
+    now = now or datetime.now()
+    recent_start = datetime.combine(now.date() - timedelta(days=RECENT_EVENT_DAYS), time.min)
+    today_end = datetime.combine(now.date() + timedelta(days=1), time.min)
+
+    stats = {'total': 0, 'upcoming': 0, 'past': 0, 'ongoing': 0, 'categories': {}}
+    period = db.case((DailyEventStats.day < recent_start.date(), 'past'),
+                     (DailyEventStats.day >= today_end.date(), 'upcoming'),
+                     else_='recent')
+    rows = db.session.query(DailyEventStats.category, period, db.func.sum(DailyEventStats.events)) \
+        .filter(DailyEventStats.organizer_id == organizer_id) \
+        .group_by(DailyEventStats.category, period)
+    for category, event_period, count in rows:
+        if event_period != 'recent':
+            stats[event_period] += count
+            stats['categories'][category] = stats['categories'].get(category, 0) + count
+
+    recent_events = db.session.query(Event.category, Event.start_time, Event.end_time) \
+        .filter(Event.organizer_id == organizer_id,
+                Event.start_time >= recent_start,
+                Event.start_time < today_end)
+    for category, start_time, end_time in recent_events:
+        if now < start_time:
+            stats['upcoming'] += 1
+        elif now > end_time:
+            stats['past'] += 1
+        else:
+            stats['ongoing'] += 1
+        stats['categories'][category] = stats['categories'].get(category, 0) + 1
+
+    stats['total'] = stats['upcoming'] + stats['past'] + stats['ongoing']
+    return stats
+
+def monthly_history(months=6, today=None):
+    """Events, registrations and attendance per month for the last few months,
+    by event start date. Returns chart-ready lists.
+    """
+    today = today or date.today()
+    first_month = date(today.year, today.month, 1)
+    for _ in range(months - 1):
+        first_month = (first_month - timedelta(days=1)).replace(day=1)
+
+    month = db.func.strftime('%Y-%m', DailyEventStats.day) \
+        if db.engine.dialect.name == 'sqlite' else db.func.to_char(DailyEventStats.day, 'YYYY-MM')
+    rows = db.session.query(
+        month,
+        db.func.sum(DailyEventStats.events),
+        db.func.sum(DailyEventStats.registrations),
+        db.func.sum(DailyEventStats.attendances)
+    ).filter(DailyEventStats.day >= first_month, DailyEventStats.day <= today) \
+        .group_by(month)
+    totals = {key: values for key, *values in rows}
+
+    history = {'labels': [], 'events': [], 'registrations': [], 'attendances': []}
+    current = first_month
+    for _ in range(months):
+        events, registrations, attendances = totals.get(current.strftime('%Y-%m'), (0, 0, 0))
+        history['labels'].append(current.strftime('%b %Y'))
+        history['events'].append(events)
+        history['registrations'].append(registrations)
+        history['attendances'].append(attendances)
+        current = (current + timedelta(days=32)).replace(day=1)
+    return history
@@ -1,23 +1,43 @@
 import os
+import json
+import hashlib
 from datetime import datetime, timedelta
-from flask import render_template, url_for, flash, redirect, request, jsonify, abort, send_from_directory
+from flask import (current_app, render_template, url_for, flash, redirect, request, jsonify, abort, send_file,
+                   Response, stream_with_context)
 from flask_login import login_user, current_user, logout_user, login_required
 
-from app import app, db
+from extensions import db, csrf, Views
 from forms import (RegistrationForm, LoginForm, UpdateProfileForm, ChangePasswordForm,
                   ClubForm, EventForm, EventSearchForm, CheckInForm, RatingForm)
-from models import User, UserRole, Club, Event, Registration, Attendance, Rating
-from utils import (save_file, get_event_stats, get_user_events_stats, 
-                  generate_qr_code, export_participant_list)
+from models import (User, UserRole, Club, Event, Registration, Attendance, Rating, RosterAction, Job,
+                    JobStatus, normalize_name)
+from utils import (save_file, get_user_events_stats, 
+                  generate_qr_code_png, attach_event_stats, get_category_counts, stream_participants_csv)
+from loading import preloads, preloaded
+from jobs import enqueue, artifact_folder
+from cache import VersionedCache, bump_version
+from identity import forget_user
+from pagecache import cached_page, invalidate_pages, event_tag, EVENT_LIST_TAG, CLUB_TAG
+from pagination import keyset_page
+from rollups import (ensure_fresh_rollups, rollup_totals, organizer_event_stats, monthly_history,
+                     refresh_days)
+from seats import (SeatStatus, register_user, release_seat, promote_from_waitlist, join_waitlist,
+                   leave_waitlist, waitlist_position, waitlist_length)
+import search
+from checkin import (registrant_query, record_roster_changes, roster_snapshot, roster_changes_since,
+                     make_check_in_token, make_scanner_key, is_valid_scanner_key, check_in_batch)
+
+# Added to the app by create_app()
+views = Views()
 
 # Custom filters
-@app.template_filter('format_datetime')
+@views.template_filter('format_datetime')
 def format_datetime_filter(value, format='%Y-%m-%d %H:%M'):
     if value:
         return value.strftime(format)
     return ""
 
-@app.template_filter('nl2br')
+@views.template_filter('nl2br')
 def nl2br_filter(value):
     """Convert newlines to HTML line breaks."""
     if value:
@@ -25,13 +45,15 @@ def nl2br_filter(value):
     return ""
 
 # Basic routes
-@app.route('/')
+@views.route('/')
+@cached_page(EVENT_LIST_TAG)
 def index():
     upcoming_events = Event.query.filter(Event.start_time > datetime.now()).order_by(Event.start_time).limit(6).all()
-    categories = sorted(set([event.category for event in Event.query.all()]))
-    return render_template('index.html', upcoming_events=upcoming_events, categories=categories)
+    category_counts = get_category_counts()
+    return render_template('index.html', upcoming_events=upcoming_events,
+                           categories=list(category_counts), category_counts=category_counts)
 
-@app.route('/login', methods=['GET', 'POST'])
+@views.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
@@ -55,7 +77,7 @@ def login():
     
     return render_template('login.html', form=form)
 
-@app.route('/register', methods=['GET', 'POST'])
+@views.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
@@ -80,12 +102,12 @@ def register():
     
     return render_template('register.html', form=form)
 
-@app.route('/logout')
+@views.route('/logout')
 def logout():
     logout_user()
     return redirect(url_for('index'))
 
-@app.route('/dashboard')
+@views.route('/dashboard')
 @login_required
 def dashboard():
     if current_user.is_admin():
@@ -96,41 +118,43 @@ def dashboard():
         return redirect(url_for('student_dashboard'))
 
 # Profile routes
-@app.route('/profile')
+@views.route('/profile')
 @login_required
 def profile():
-    return render_template('profile/view.html', user=current_user)
+    return render_template('profile/view.html', user=current_user.row)
 
-@app.route('/profile/edit', methods=['GET', 'POST'])
+@views.route('/profile/edit', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
-    form = UpdateProfileForm(current_user.username, current_user.email)
+    user = current_user.row
+    form = UpdateProfileForm(user.username, user.email)
     
     if form.validate_on_submit():
         if form.profile_picture.data:
             picture_file = save_file(form.profile_picture.data, 'uploads/profile_pics')
-            current_user.profile_picture = picture_file
+            user.profile_picture = picture_file
         
-        current_user.username = form.username.data
-        current_user.email = form.email.data
-        current_user.first_name = form.first_name.data
-        current_user.last_name = form.last_name.data
-        current_user.bio = form.bio.data
+        user.username = form.username.data
+        user.email = form.email.data
+        user.first_name = form.first_name.data
+        user.last_name = form.last_name.data
+        user.bio = form.bio.data
         
         db.session.commit()
+        forget_user(user.id)
         flash('Your profile has been updated!', 'success')
         return redirect(url_for('profile'))
     
     elif request.method == 'GET':
-        form.username.data = current_user.username
-        form.email.data = current_user.email
-        form.first_name.data = current_user.first_name
-        form.last_name.data = current_user.last_name
-        form.bio.data = current_user.bio
+        form.username.data = user.username
+        form.email.data = user.email
+        form.first_name.data = user.first_name
+        form.last_name.data = user.last_name
+        form.bio.data = user.bio
     
     return render_template('profile/edit.html', form=form)
 
-@app.route('/profile/change-password', methods=['GET', 'POST'])
+@views.route('/profile/change-password', methods=['GET', 'POST'])
 @login_required
 def change_password():
     form = ChangePasswordForm()
@@ -140,53 +164,72 @@ def change_password():
             flash('Current password is incorrect!', 'danger')
             return render_template('profile/change_password.html', form=form)
         
-        current_user.set_password(form.new_password.data)
+        current_user.row.set_password(form.new_password.data)
         db.session.commit()
+        forget_user(current_user.id)
         flash('Your password has been updated!', 'success')
         return redirect(url_for('profile'))
     
     return render_template('profile/edit.html', form=form, change_password=True)
 
 # Admin routes
-@app.route('/admin/dashboard')
+@views.route('/admin/dashboard')
 @login_required
+@preloads({Event: ('organizer',)})
 def admin_dashboard():
     if not current_user.is_admin():
         abort(403)
     
-    total_users = User.query.count()
-    total_events = Event.query.count()
-    total_clubs = Club.query.count()
-    total_registrations = Registration.query.count()
-    
-    recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
-    recent_events = Event.query.order_by(Event.created_at.desc()).limit(5).all()
+    # Event figures come from the daily rollups rather than the raw tables
+    ensure_fresh_rollups()
+    totals = rollup_totals()
+    history = monthly_history()
     
+    role_counts = dict(db.session.query(User.role, db.func.count(User.id)).group_by(User.role).all())
     user_roles = {
-        'Admin': User.query.filter_by(role=UserRole.ADMIN).count(),
-        'Organizer': User.query.filter_by(role=UserRole.ORGANIZER).count(),
-        'Student': User.query.filter_by(role=UserRole.STUDENT).count()
+        'Admin': role_counts.get(UserRole.ADMIN, 0),
+        'Organizer': role_counts.get(UserRole.ORGANIZER, 0),
+        'Student': role_counts.get(UserRole.STUDENT, 0)
     }
+    total_users = sum(role_counts.values())
+    total_clubs = Club.query.count()
+    
+    recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
+    recent_events = preloaded(Event.query).order_by(Event.created_at.desc()).limit(5).all()
+    attach_event_stats(recent_events)
     
     return render_template('admin/dashboard.html', 
                            total_users=total_users,
-                           total_events=total_events,
+                           total_events=totals['events'],
                            total_clubs=total_clubs,
-                           total_registrations=total_registrations,
+                           total_registrations=totals['registrations'],
                            recent_users=recent_users,
                            recent_events=recent_events,
-                           user_roles=user_roles)
+                           user_roles=user_roles,
+                           history=history)
 
-@app.route('/admin/users')
+@views.route('/admin/users')
 @login_required
 def admin_users():
     if not current_user.is_admin():
         abort(403)
     
-    users = User.query.all()
-    return render_template('admin/users.html', users=users)
+    query = request.args.get('query', '').strip()
+    role = request.args.get('role', '')
+    
+    users_query = User.query
+    if query:
+        users_query = users_query.filter(User.name_prefix_filter(query) |
+                                         User.email.startswith(query, autoescape=True) |
+                                         User.username.startswith(query, autoescape=True))
+    if role:
+        users_query = users_query.filter(User.role == role)
+    
+    users = keyset_page(users_query, [User.id], request.args.get('after'),
+                        current_app.config['USERS_PER_PAGE'])
+    return render_template('admin/users.html', users=users, query=query, selected_role=role)
 
-@app.route('/admin/user/<int:user_id>/change-role/<role>')
+@views.route('/admin/user/<int:user_id>/change-role/<role>')
 @login_required
 def change_user_role(user_id, role):
     if not current_user.is_admin():
@@ -207,20 +250,22 @@ def change_user_role(user_id, role):
     
     user.role = role
     db.session.commit()
+    forget_user(user.id)
     flash(f'User role updated to {role}', 'success')
     return redirect(url_for('admin_users'))
 
-@app.route('/admin/clubs')
+@views.route('/admin/clubs')
 @login_required
+@preloads({Club: ('admin', 'events')})
 def admin_clubs():
     if not current_user.is_admin():
         abort(403)
     
-    clubs = Club.query.all()
+    clubs = preloaded(Club.query).all()
     form = ClubForm()
     return render_template('admin/clubs.html', clubs=clubs, form=form)
 
-@app.route('/admin/club/new', methods=['GET', 'POST'])
+@views.route('/admin/club/new', methods=['GET', 'POST'])
 @login_required
 def create_club():
     if not current_user.is_admin():
@@ -247,7 +292,7 @@ def create_club():
     
     return render_template('admin/clubs.html', form=form, create_club=True)
 
-@app.route('/admin/club/<int:club_id>/edit', methods=['GET', 'POST'])
+@views.route('/admin/club/<int:club_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_club(club_id):
     if not current_user.is_admin():
@@ -264,6 +309,9 @@ def edit_club(club_id):
         club.name = form.name.data
         club.description = form.description.data
         
+        # Club names are searchable with their events
+        search.index_club_events(club)
+        invalidate_pages(EVENT_LIST_TAG, CLUB_TAG)
         db.session.commit()
         flash('Club updated successfully!', 'success')
         return redirect(url_for('admin_clubs'))
@@ -274,7 +322,7 @@ def edit_club(club_id):
     
     return render_template('admin/clubs.html', form=form, edit_club=True, club=club)
 
-@app.route('/admin/club/<int:club_id>/delete', methods=['POST'])
+@views.route('/admin/club/<int:club_id>/delete', methods=['POST'])
 @login_required
 def delete_club(club_id):
     if not current_user.is_admin():
@@ -293,7 +341,7 @@ def delete_club(club_id):
     return redirect(url_for('admin_clubs'))
 
 # Organizer routes
-@app.route('/organizer/create-club', methods=['GET', 'POST'])
+@views.route('/organizer/create-club', methods=['GET', 'POST'])
 @login_required
 def organizer_create_club():
     # Check if user is an organizer or admin
@@ -321,42 +369,71 @@ def organizer_create_club():
     
     return render_template('organizer/create_club.html', form=form)
 
-@app.route('/organizer/dashboard')
+@views.route('/organizer/dashboard')
 @login_required
+@preloads({Club: ('events',), Registration: ('user', 'event')})
 def organizer_dashboard():
     if not (current_user.is_organizer() or current_user.is_admin()):
         abort(403)
     
+    # Refresh the rollups before loading anything else: a refresh commits,
+    # which would expire the rows loaded for the page
+    ensure_fresh_rollups()
+    
     # Get clubs administered by the user
-    clubs = Club.query.filter_by(admin_id=current_user.id).all()
+    clubs = preloaded(Club.query).filter_by(admin_id=current_user.id).all()
     
-    # Get all events organized by the user
-    events = Event.query.filter_by(organizer_id=current_user.id).all()
+    # Get the user's next events
+    upcoming_events = Event.query.filter(Event.organizer_id == current_user.id,
+                                         Event.start_time > datetime.now()) \
+        .order_by(Event.start_time).limit(10).all()
+    attach_event_stats(upcoming_events)
     
-    # Get event statistics
-    event_stats = get_event_stats(events)
+    # Get event statistics from the daily rollups
+    event_stats = organizer_event_stats(current_user.id)
     
     # Get recent registrations for user's events
-    event_ids = [event.id for event in events]
-    recent_registrations = Registration.query.filter(Registration.event_id.in_(event_ids)).order_by(Registration.registration_time.desc()).limit(10).all()
+    recent_registrations = preloaded(Registration.query) \
+        .join(Event, Event.id == Registration.event_id) \
+        .filter(Event.organizer_id == current_user.id) \
+        .order_by(Registration.registration_time.desc()).limit(10).all()
     
     return render_template('organizer/dashboard.html',
                           clubs=clubs,
-                          events=events,
+                          upcoming_events=upcoming_events,
+                          checkin_horizon=datetime.now() + timedelta(days=7),
                           event_stats=event_stats,
                           recent_registrations=recent_registrations)
 
-@app.route('/organizer/events')
+@views.route('/organizer/events')
 @login_required
 def organizer_events():
     if not (current_user.is_organizer() or current_user.is_admin()):
         abort(403)
     
-    events = Event.query.filter_by(organizer_id=current_user.id).order_by(Event.start_time.desc()).all()
-    return render_template('organizer/events.html', events=events)
+    now = datetime.now()
+    events_query = Event.query.filter_by(organizer_id=current_user.id)
+    per_page = current_app.config['EVENTS_PER_PAGE']
+    
+    # Ongoing events are few at any moment; upcoming and past are paged
+    ongoing_events = events_query.filter(Event.start_time <= now, Event.end_time >= now) \
+        .order_by(Event.start_time).all()
+    upcoming_events = keyset_page(events_query.filter(Event.start_time > now), EVENT_PAGE_ORDER,
+                                  request.args.get('upcoming_after'), per_page)
+    past_events = keyset_page(events_query.filter(Event.end_time < now), EVENT_PAGE_ORDER,
+                              request.args.get('past_after'), per_page, descending=True)
+    attach_event_stats(upcoming_events, ongoing_events, past_events)
+    
+    active_tab = 'past' if request.args.get('past_after') else 'upcoming'
+    return render_template('organizer/events.html',
+                          upcoming_events=upcoming_events,
+                          ongoing_events=ongoing_events,
+                          past_events=past_events,
+                          active_tab=active_tab)
 
-@app.route('/organizer/check-in/<int:event_id>', methods=['GET', 'POST'])
+@views.route('/organizer/check-in/<int:event_id>', methods=['GET', 'POST'])
 @login_required
+@preloads({Registration: ('user',), Attendance: ('user',)})
 def event_check_in(event_id):
     if not (current_user.is_organizer() or current_user.is_admin()):
         abort(403)
@@ -377,77 +454,113 @@ def event_check_in(event_id):
                 flash('Full name is required.', 'danger')
                 return redirect(url_for('event_check_in', event_id=event_id))
             
-            # Find the user with this full name
-            users = User.query.all()
-            matching_user = None
-            for user in users:
-                if user.get_full_name().lower() == full_name.lower():
-                    matching_user = user
-                    break
+            # Find registrants with this full name, along with any existing
+            # attendance, in one query over the indexed name key
+            matches = registrant_query(event_id) \
+                .filter(User.full_name_key == normalize_name(full_name))
+            user_id = form.user_id.data
+            if user_id and user_id.isdigit():
+                matches = matches.filter(User.id == int(user_id))
+            matches = matches.all()
             
-            if not matching_user:
-                flash('No user found with that name', 'danger')
+            if not matches:
+                flash('No registered attendee found with that name', 'danger')
                 return redirect(url_for('event_check_in', event_id=event_id))
             
-            # Check if user is registered for this event
-            registration = Registration.query.filter_by(user_id=matching_user.id, event_id=event_id).first()
-            if not registration:
-                flash('This user is not registered for this event', 'warning')
+            if len(matches) > 1:
+                emails = ', '.join(user.email for user, _ in matches)
+                flash(f'{len(matches)} registered attendees are named {full_name} ({emails}). '
+                      'Use the Check In button next to the right person.', 'warning')
                 return redirect(url_for('event_check_in', event_id=event_id))
             
+            matching_user, existing_attendance_id = matches[0]
+            
             # Check if user already checked in
-            existing_attendance = Attendance.query.filter_by(user_id=matching_user.id, event_id=event_id).first()
-            if existing_attendance:
+            if existing_attendance_id:
                 flash('This user has already checked in', 'info')
                 return redirect(url_for('event_check_in', event_id=event_id))
             
             # Create attendance record
             attendance = Attendance(user_id=matching_user.id, event_id=event_id)
             db.session.add(attendance)
+            event.update_counters(attendances=1)
+            record_roster_changes(event_id, [matching_user.id], RosterAction.CHECKED_IN)
             db.session.commit()
             
             flash(f'{matching_user.get_full_name()} has been checked in successfully!', 'success')
             return redirect(url_for('event_check_in', event_id=event_id))
     except Exception as e:
-        import traceback
-        print(traceback.format_exc())
+        current_app.logger.exception("Check-in failed", extra={'event_id': event_id})
         flash(f'An unexpected error occurred during check-in: {str(e)}', 'danger')
         return redirect(url_for('event_check_in', event_id=event_id))
     
+    # Generate the check-in QR code in the background if it doesn't exist yet.
+    # Queue it before loading the roster: the commit expires everything
+    # loaded so far, and the template would reload each user on its own
+    qr_filename = f"event_{event_id}_checkin.png"
+    qr_path = os.path.join(current_app.root_path, 'static', 'uploads', 'qrcodes', qr_filename)
+    
+    if os.path.exists(qr_path):
+        qr_image_path = f'uploads/qrcodes/{qr_filename}'
+    else:
+        qr_image_path = None
+        qr_data = url_for('event_qr_check_in', event_id=event_id, _external=True)
+        enqueue('check_in_qr', dedupe_key=f'check_in_qr:{event_id}', event_id=event_id, url=qr_data)
+        db.session.commit()
+    
     # Get list of registered users for this event
-    registrations = Registration.query.filter_by(event_id=event_id).all()
+    registrations = preloaded(Registration.query).filter_by(event_id=event_id).all()
     registered_users = [reg.user for reg in registrations]
+    registration_times = {reg.user_id: reg.registration_time for reg in registrations}
     
     # Get list of users who have already checked in
-    attendances = Attendance.query.filter_by(event_id=event_id).all()
+    attendances = preloaded(Attendance.query).filter_by(event_id=event_id).all()
     checked_in_users = [att.user for att in attendances]
-    
-    # Generate QR code for check-in if it doesn't exist
-    qr_filename = f"event_{event_id}_checkin.png"
-    qr_path = os.path.join('static', 'uploads', 'qrcodes', qr_filename)
-    
-    if not os.path.exists(qr_path):
-        # Generate QR code data (URL to check-in page with event ID)
-        qr_data = url_for('event_qr_check_in', event_id=event_id, _external=True)
-        qr_image_path = generate_qr_code(qr_data, qr_filename)
-    else:
-        qr_image_path = os.path.join('uploads', 'qrcodes', qr_filename)
-    # Ensure web-compatible path
-    qr_image_path = str(qr_image_path).replace('\\', '/').replace('\\', '/')
-    print('DEBUG: qr_image_path =', qr_image_path)
+    checked_in_user_ids = {att.user_id for att in attendances}
     
     return render_template('organizer/check_in.html', 
                           event=event, 
                           form=form,
                           registered_users=registered_users,
+                          registration_times=registration_times,
                           checked_in_users=checked_in_users,
-                          qr_image_path=qr_image_path)
+                          checked_in_user_ids=checked_in_user_ids,
+                          qr_image_path=qr_image_path,
+                          scanner_key=make_scanner_key(event_id))
+
+@views.route('/organizer/check-in/<int:event_id>/search')
+@login_required
+def event_check_in_search(event_id):
+    """Autocomplete registrant names by prefix for the check-in form"""
+    if not (current_user.is_organizer() or current_user.is_admin()):
+        abort(403)
+    
+    event = Event.query.get_or_404(event_id)
+    if event.organizer_id != current_user.id and not current_user.is_admin():
+        abort(403)
+    
+    prefix = request.args.get('q', '')
+    if not normalize_name(prefix):
+        return jsonify([])
+    
+    matches = registrant_query(event_id) \
+        .filter(User.name_prefix_filter(prefix)) \
+        .order_by(User.full_name_key) \
+        .limit(10) \
+        .all()
+    
+    return jsonify([{
+        'id': user.id,
+        'name': user.get_full_name(),
+        'email': user.email,
+        'checked_in': attendance_id is not None
+    } for user, attendance_id in matches])
 
 # QR code check-in route
-@app.route('/events/<int:event_id>/qr-check-in', methods=['GET', 'POST'])
+@views.route('/events/<int:event_id>/qr-check-in', methods=['GET', 'POST'])
 def event_qr_check_in(event_id):
     # Get event
-    Event.query.get_or_404(event_id)
+    event = Event.query.get_or_404(event_id)
     
     # If user is logged in and registered for this event, check them in
     if current_user.is_authenticated:
@@ -466,6 +579,8 @@ def event_qr_check_in(event_id):
         # Create attendance record
         attendance = Attendance(user_id=current_user.id, event_id=event_id)
         db.session.add(attendance)
+        event.update_counters(attendances=1)
+        record_roster_changes(event_id, [current_user.id], RosterAction.CHECKED_IN)
         db.session.commit()
         
         flash('You have been checked in successfully!', 'success')
@@ -475,8 +590,65 @@ def event_qr_check_in(event_id):
         flash('Please log in to check in to this event', 'info')
         return redirect(url_for('login', next=url_for('event_qr_check_in', event_id=event_id)))
 
+# Maximum number of scanned tokens accepted in one batch
+CHECK_IN_BATCH_LIMIT = 500
+
+@views.route('/events/<int:event_id>/check-in/batch', methods=['POST'])
+@csrf.exempt
+def event_batch_check_in(event_id):
+    """Check in a batch of scanned passes sent by a door scanner.
+    
+    Scanners authenticate with the event's scanner key in the X-Scanner-Key
+    header rather than a login session.
+    """
+    if not is_valid_scanner_key(request.headers.get('X-Scanner-Key'), event_id):
+        return jsonify({'error': 'Invalid scanner key'}), 403
+    
+    payload = request.get_json(silent=True) or {}
+    tokens = payload.get('tokens')
+    if not isinstance(tokens, list) or not all(isinstance(token, str) for token in tokens):
+        return jsonify({'error': 'Expected a JSON body with a list of tokens'}), 400
+    if len(tokens) > CHECK_IN_BATCH_LIMIT:
+        return jsonify({'error': f'At most {CHECK_IN_BATCH_LIMIT} tokens per batch'}), 413
+    
+    results = check_in_batch(event_id, tokens)
+    
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return jsonify({'results': results, 'summary': summary})
+
+@views.route('/events/<int:event_id>/roster')
+def event_roster(event_id):
+    """Check-in roster for door devices.
+    
+    Without arguments returns a full snapshot; with ?since=<version> returns
+    only the changes after that version. Devices keep the returned version
+    and send it on the next sync.
+    """
+    if not is_valid_scanner_key(request.headers.get('X-Scanner-Key'), event_id):
+        return jsonify({'error': 'Invalid scanner key'}), 403
+    
+    since = request.args.get('since', type=int)
+    if since is None:
+        roster = roster_snapshot(event_id)
+    else:
+        roster = roster_changes_since(event_id, since)
+    if roster['version'] is None:
+        abort(404)
+    roster['event_id'] = event_id
+    return jsonify(roster)
+
+@views.route('/events/<int:event_id>/check-in-pass.png')
+@login_required
+def check_in_pass(event_id):
+    """QR code of the current user's signed check-in token for an event"""
+    registration = Registration.query.filter_by(user_id=current_user.id, event_id=event_id).first_or_404()
+    png = generate_qr_code_png(make_check_in_token(registration))
+    return Response(png, mimetype='image/png', headers={'Cache-Control': 'private, max-age=86400'})
+
 # Export participants route
-@app.route('/organizer/events/<int:event_id>/export-participants')
+@views.route('/organizer/events/<int:event_id>/export-participants')
 @login_required
 def export_participants(event_id):
     # Check if user is an organizer or admin
@@ -492,66 +664,105 @@ def export_participants(event_id):
         flash('You do not have permission to export data for this event', 'danger')
         return redirect(url_for('dashboard'))
     
-    # Export participant list
-    export_path = export_participant_list(event_id)
-    print('DEBUG: export_path =', export_path)
+    export_format = 'csv' if request.args.get('format') == 'csv' else 'xlsx'
+    wants_json = request.accept_mimetypes.best == 'application/json'
     
-    if export_path:
-        flash('Participant list has been exported successfully', 'success')
-        # Use send_from_directory for direct download
-        directory, filename = os.path.split(export_path)
-        return send_from_directory(os.path.join(app.root_path, 'static', directory), filename, as_attachment=True)
-    else:
-        flash('Failed to export participant list', 'danger')
-        return redirect(url_for('event_check_in', event_id=event_id))
+    # CSV streams straight to the browser in constant memory, as rows are read
+    if export_format == 'csv' and not wants_json:
+        filename = f"event_{event_id}_participants_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        return Response(stream_with_context(stream_participants_csv(event_id)),
+                        mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+    
+    # A workbook can only be sent once its last row is written, which can
+    # take longer than a request should for a big event, so it is built in
+    # the background; API clients get either format as a job
+    job = enqueue('export_participants', user_id=current_user.id, event_id=event_id, format=export_format)
+    db.session.commit()
+    
+    if wants_json:
+        return jsonify({'job_id': job.id, 'status_url': url_for('job_status', job_id=job.id)}), 202
+    return redirect(url_for('job_status', job_id=job.id))
+
+# Background job routes
+def get_own_job_or_404(job_id):
+    job = Job.query.get_or_404(job_id)
+    if job.user_id != current_user.id and not current_user.is_admin():
+        abort(404)
+    return job
+
+@views.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = get_own_job_or_404(job_id)
+    
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({
+            'id': job.id,
+            'kind': job.kind,
+            'status': job.status,
+            'error': job.error,
+            'download_url': url_for('job_download', job_id=job.id) if job.artifact else None
+        })
+    return render_template('jobs/status.html', job=job)
+
+@views.route('/jobs/<int:job_id>/download')
+@login_required
+def job_download(job_id):
+    job = get_own_job_or_404(job_id)
+    if job.status != JobStatus.FINISHED or not job.artifact:
+        abort(404)
+    return send_file(os.path.join(artifact_folder(), job.artifact),
+                     as_attachment=True,
+                     download_name=job.download_name)
 
 # Student routes
-@app.route('/student/dashboard')
+@views.route('/student/dashboard')
 @login_required
 def student_dashboard():
-    # Get upcoming events the student is registered for
-    user_registrations = Registration.query.filter_by(user_id=current_user.id).all()
-    registered_event_ids = [reg.event_id for reg in user_registrations]
+    # Queue a rebuild of a stale recommendation model first: its commit
+    # would expire the events loaded below. NumPy is only imported once a
+    # student dashboard is shown.
+    from recommender import ensure_fresh_recommendations, recommend_events
+    ensure_fresh_recommendations()
+    
+    now = datetime.now()
+    registered_event_ids = db.select(Registration.event_id).where(Registration.user_id == current_user.id)
     
+    # Get upcoming events the student is registered for
     upcoming_registered_events = Event.query.filter(
         Event.id.in_(registered_event_ids),
-        Event.start_time > datetime.now()
+        Event.start_time > now
     ).order_by(Event.start_time).limit(5).all()
     
-    # Get all events for statistics
-    all_events = Event.query.all()
-    user_stats = get_user_events_stats(current_user.id, all_events, user_registrations)
+    # Get statistics in one aggregate over the student's registrations
+    user_stats = get_user_events_stats(current_user.id, now)
     
-    # Get recommended events (events in the next week that the user isn't registered for)
-    next_week = datetime.now() + timedelta(days=7)
-    recommended_events = Event.query.filter(
-        ~Event.id.in_(registered_event_ids) if registered_event_ids else True,
-        Event.start_time > datetime.now(),
-        Event.start_time < next_week
-    ).order_by(Event.start_time).limit(3).all()
+    # Get recommended events from the precomputed vectors
+    recommended_events = recommend_events(current_user.id, 3, now)
     
     return render_template('student/dashboard.html', 
                           upcoming_events=upcoming_registered_events,
                           user_stats=user_stats,
                           recommended_events=recommended_events)
 
-@app.route('/student/my-events')
+@views.route('/student/my-events')
 @login_required
 def my_events():
-    # Get all registrations for the current user
-    registrations = Registration.query.filter_by(user_id=current_user.id).all()
-    registered_event_ids = [reg.event_id for reg in registrations]
+    now = datetime.now()
     
     # Get all events the user is registered for
-    registered_events = Event.query.filter(Event.id.in_(registered_event_ids)).all() if registered_event_ids else []
+    registered_events = Event.query.join(Registration, Registration.event_id == Event.id) \
+        .filter(Registration.user_id == current_user.id) \
+        .order_by(Event.start_time).all()
     
     # Separate into upcoming and past events
-    upcoming_events = [event for event in registered_events if event.is_upcoming()]
-    past_events = [event for event in registered_events if event.is_past()]
+    upcoming_events = [event for event in registered_events if event.is_upcoming(now)]
+    past_events = [event for event in registered_events if event.is_past(now)]
     
     # Get attendance records
-    attendances = Attendance.query.filter_by(user_id=current_user.id).all()
-    attended_event_ids = [att.event_id for att in attendances]
+    attended_event_ids = set(db.session.scalars(
+        db.select(Attendance.event_id).where(Attendance.user_id == current_user.id)))
     
     # Get events the user has rated
     ratings = Rating.query.filter_by(user_id=current_user.id).all()
@@ -564,30 +775,56 @@ def my_events():
                           rated_events=rated_events)
 
 # Event routes
-@app.route('/events')
+# Events are paged by start time, with the id breaking ties
+EVENT_PAGE_ORDER = [Event.start_time, Event.id]
+
+def filtered_events_query(query, category):
+    """Events matching the list filters, plus the search ranks if searching"""
+    events_query = Event.query
+    search_ranks = search.search_ranks(query)
+    if search_ranks is not None:
+        events_query = events_query.join(search_ranks, search_ranks.c.event_id == Event.id)
+    
+    if category:
+        events_query = events_query.filter(Event.category == category)
+    return events_query, search_ranks
+
+def events_page(events_query, section, cursor, per_page, search_ranks=None):
+    """One page of upcoming or past events from a filtered query"""
+    now = datetime.now()
+    if section == 'past':
+        events_query = events_query.filter(Event.start_time <= now)
+    else:
+        events_query = events_query.filter(Event.start_time > now)
+    
+    # Search results are paged best match first
+    if search_ranks is not None:
+        return keyset_page(events_query, [search_ranks.c.rank, Event.id], cursor, per_page)
+    return keyset_page(events_query, EVENT_PAGE_ORDER, cursor, per_page,
+                       descending=section == 'past')
+
+@views.route('/events')
+@cached_page(EVENT_LIST_TAG)
 def events_list():
-    form = EventSearchForm()
+    # The search is a plain GET form; a CSRF token would start a session
+    # for every new visitor, and pages that set cookies are never cached
+    form = EventSearchForm(meta={'csrf': False})
     
     # Handle search/filter
     query = request.args.get('query', '')
     category = request.args.get('category', '')
+    events_query, search_ranks = filtered_events_query(query, category)
     
-    # Base query
-    events_query = Event.query
-    
-    # Apply filters
-    if query:
-        events_query = events_query.filter(Event.title.ilike(f'%{query}%') | Event.description.ilike(f'%{query}%'))
-    
-    if category:
-        events_query = events_query.filter(Event.category == category)
-    
-    # Get upcoming and past events
-    upcoming_events = events_query.filter(Event.start_time > datetime.now()).order_by(Event.start_time).all()
-    past_events = events_query.filter(Event.start_time <= datetime.now()).order_by(Event.start_time.desc()).all()
+    # Get a page of upcoming and of past events
+    per_page = current_app.config['EVENTS_PER_PAGE']
+    upcoming_events = events_page(events_query, 'upcoming', request.args.get('upcoming_after'),
+                                  per_page, search_ranks)
+    past_events = events_page(events_query, 'past', request.args.get('past_after'),
+                              per_page, search_ranks)
+    attach_event_stats(upcoming_events, past_events)
     
     # Get all categories for filter dropdown
-    categories = sorted(set([event.category for event in Event.query.all()]))
+    category_counts = get_category_counts()
     
     return render_template('events/list.html', 
                           upcoming_events=upcoming_events, 
@@ -595,9 +832,45 @@ def events_list():
                           form=form,
                           query=query,
                           selected_category=category,
-                          categories=categories)
+                          categories=list(category_counts),
+                          category_counts=category_counts)
 
-@app.route('/events/create', methods=['GET', 'POST'])
+@views.route('/events/data')
+def events_list_data():
+    """JSON pages of the event list for infinite scrolling"""
+    section = request.args.get('section', 'upcoming')
+    if section not in ('upcoming', 'past'):
+        abort(400)
+    per_page = min(request.args.get('limit', current_app.config['EVENTS_PER_PAGE'], type=int),
+                   current_app.config['MAX_PER_PAGE'])
+    if per_page < 1:
+        abort(400)
+    
+    events_query, search_ranks = filtered_events_query(request.args.get('query', ''),
+                                                      request.args.get('category', ''))
+    page = events_page(events_query, section, request.args.get('after'), per_page, search_ranks)
+    attach_event_stats(page)
+    
+    detail_url = url_for('event_detail', event_id=0)[:-1]
+    return jsonify({
+        'events': [{
+            'id': event.id,
+            'title': event.title,
+            'category': event.category,
+            'start': event.start_time.isoformat(),
+            'end': event.end_time.isoformat(),
+            'location': event.location,
+            'poster': url_for('static', filename=event.poster) if event.poster else None,
+            'max_participants': event.max_participants,
+            'registration_count': event.get_registration_count(),
+            'average_rating': event.get_average_rating(),
+            'rating_count': event.get_rating_count(),
+            'url': f'{detail_url}{event.id}'
+        } for event in page],
+        'next_cursor': page.next_cursor
+    })
+
+@views.route('/events/create', methods=['GET', 'POST'])
 @login_required
 def create_event():
     if not (current_user.is_organizer() or current_user.is_admin()):
@@ -628,24 +901,32 @@ def create_event():
         )
         
         db.session.add(event)
+        search.index_event(event)
+        bump_version('events')
+        invalidate_pages(EVENT_LIST_TAG)
         db.session.commit()
         flash('Event created successfully!', 'success')
         return redirect(url_for('events_list'))
     
     return render_template('events/create.html', form=form)
 
-@app.route('/events/<int:event_id>')
+@views.route('/events/<int:event_id>')
+@preloads({Event: ('organizer', 'club'), Rating: ('user',)})
+@cached_page(event_tag('{event_id}'), CLUB_TAG)
 def event_detail(event_id):
-    event = Event.query.get_or_404(event_id)
+    event = preloaded(Event.query).get_or_404(event_id)
     
     # Check if current user is registered
     is_registered = False
     can_rate = False
     user_rating = None
+    user_waitlist_position = None
     
     if current_user.is_authenticated:
         registration = Registration.query.filter_by(user_id=current_user.id, event_id=event_id).first()
         is_registered = registration is not None
+        if not is_registered:
+            user_waitlist_position = waitlist_position(event_id, current_user.id)
         
         # Check if user has attended and can rate
         attendance = Attendance.query.filter_by(user_id=current_user.id, event_id=event_id).first()
@@ -655,14 +936,19 @@ def event_detail(event_id):
         user_rating = Rating.query.filter_by(user_id=current_user.id, event_id=event_id).first()
     
     # Get event ratings
-    ratings = Rating.query.filter_by(event_id=event_id).all()
-    avg_rating = sum(r.rating for r in ratings) / len(ratings) if ratings else 0
+    ratings = preloaded(Rating.query).filter_by(event_id=event_id).all()
+    avg_rating = event.get_average_rating()
     
     # Get number of registrations
-    registrations_count = Registration.query.filter_by(event_id=event_id).count()
+    registrations_count = event.get_registration_count()
     
     # Get number of attendees
-    attendance_count = Attendance.query.filter_by(event_id=event_id).count()
+    attendance_count = event.get_attendance_count()
+    
+    # The waitlist only matters once the event is full
+    waitlist_count = 0
+    if event.max_participants and registrations_count >= event.max_participants:
+        waitlist_count = waitlist_length(event_id)
     
     # Rating form
     rating_form = RatingForm()
@@ -684,9 +970,11 @@ def event_detail(event_id):
                           avg_rating=avg_rating,
                           registrations_count=registrations_count,
                           attendance_count=attendance_count,
+                          waitlist_count=waitlist_count,
+                          waitlist_position=user_waitlist_position,
                           now=current_datetime)
 
-@app.route('/events/<int:event_id>/edit', methods=['GET', 'POST'])
+@views.route('/events/<int:event_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_event(event_id):
     event = Event.query.get_or_404(event_id)
@@ -706,6 +994,7 @@ def edit_event(event_id):
             poster_file = save_file(form.poster.data, 'uploads/event_posters')
             event.poster = poster_file
         
+        previous_day = event.start_time.date()
         event.title = form.title.data
         event.description = form.description.data
         event.start_time = form.start_time.data
@@ -715,8 +1004,17 @@ def edit_event(event_id):
         event.max_participants = form.max_participants.data
         event.club_id = form.club_id.data
         
+        search.index_event(event)
+        bump_version('events')
+        invalidate_pages(EVENT_LIST_TAG, event_tag(event.id))
+        # Raising the capacity fills the new seats from the waitlist
+        promoted = promote_from_waitlist(event.id)
+        if event.start_time.date() != previous_day:
+            refresh_days([previous_day, event.start_time.date()])
         db.session.commit()
         flash('Event updated successfully!', 'success')
+        if promoted:
+            flash(f'{len(promoted)} people were registered from the waitlist', 'info')
         return redirect(url_for('event_detail', event_id=event.id))
     
     elif request.method == 'GET':
@@ -731,7 +1029,7 @@ def edit_event(event_id):
     
     return render_template('events/edit.html', form=form, event=event)
 
-@app.route('/events/<int:event_id>/delete', methods=['POST'])
+@views.route('/events/<int:event_id>/delete', methods=['POST'])
 @login_required
 def delete_event(event_id):
     event = Event.query.get_or_404(event_id)
@@ -740,12 +1038,18 @@ def delete_event(event_id):
     if event.organizer_id != current_user.id and not current_user.is_admin():
         abort(403)
     
+    search.remove_event(event.id)
+    event_day = event.start_time.date()
     db.session.delete(event)
+    db.session.flush()
+    refresh_days([event_day])
+    bump_version('events')
+    invalidate_pages(EVENT_LIST_TAG, event_tag(event_id))
     db.session.commit()
     flash('Event deleted successfully!', 'success')
     return redirect(url_for('events_list'))
 
-@app.route('/events/<int:event_id>/register', methods=['POST'])
+@views.route('/events/<int:event_id>/register', methods=['POST'])
 @login_required
 def register_for_event(event_id):
     event = Event.query.get_or_404(event_id)
@@ -761,22 +1065,19 @@ def register_for_event(event_id):
         flash('You are already registered for this event', 'info')
         return redirect(url_for('event_detail', event_id=event_id))
     
-    # Check if event has max participants limit
-    if event.max_participants:
-        current_registrations = Registration.query.filter_by(event_id=event_id).count()
-        if current_registrations >= event.max_participants:
-            flash('This event has reached maximum capacity', 'warning')
-            return redirect(url_for('event_detail', event_id=event_id))
-    
-    # Create registration
-    registration = Registration(user_id=current_user.id, event_id=event_id)
-    db.session.add(registration)
-    db.session.commit()
-    
-    flash('You have successfully registered for this event!', 'success')
+    # Seats are claimed atomically, so a rush can't overbook the event
+    status = register_user(event, current_user.id)
+    if status == SeatStatus.FULL:
+        flash('This event has reached maximum capacity. You can join the waitlist instead.', 'warning')
+    elif status == SeatStatus.CLOSED:
+        flash('Registration is closed for this event', 'warning')
+    elif status == SeatStatus.ALREADY_REGISTERED:
+        flash('You are already registered for this event', 'info')
+    else:
+        flash('You have successfully registered for this event!', 'success')
     return redirect(url_for('event_detail', event_id=event_id))
 
-@app.route('/events/<int:event_id>/unregister', methods=['POST'])
+@views.route('/events/<int:event_id>/unregister', methods=['POST'])
 @login_required
 def unregister_from_event(event_id):
     event = Event.query.get_or_404(event_id)
@@ -786,20 +1087,46 @@ def unregister_from_event(event_id):
         flash('Cannot unregister from an event that has already started', 'warning')
         return redirect(url_for('event_detail', event_id=event_id))
     
-    # Find registration
-    registration = Registration.query.filter_by(user_id=current_user.id, event_id=event_id).first()
-    if not registration:
+    # Free seats go to the next person on the waitlist
+    if not release_seat(event, current_user.id):
         flash('You are not registered for this event', 'info')
         return redirect(url_for('event_detail', event_id=event_id))
     
-    # Delete registration
-    db.session.delete(registration)
-    db.session.commit()
-    
     flash('You have successfully unregistered from this event', 'success')
     return redirect(url_for('event_detail', event_id=event_id))
 
-@app.route('/events/<int:event_id>/rate', methods=['POST'])
+@views.route('/events/<int:event_id>/waitlist', methods=['POST'])
+@login_required
+def join_event_waitlist(event_id):
+    event = Event.query.get_or_404(event_id)
+    
+    status = join_waitlist(event, current_user.id)
+    if status == SeatStatus.WAITLISTED:
+        position = waitlist_position(event_id, current_user.id)
+        flash(f"You're on the waitlist at position {position}. "
+              "We'll register you automatically when a seat opens up.", 'success')
+    elif status == SeatStatus.ALREADY_WAITLISTED:
+        flash('You are already on the waitlist for this event', 'info')
+    elif status == SeatStatus.REGISTERED:
+        flash('A seat was free, so you have been registered for this event!', 'success')
+    elif status == SeatStatus.ALREADY_REGISTERED:
+        flash('You are already registered for this event', 'info')
+    else:
+        flash('Registration is closed for this event', 'warning')
+    return redirect(url_for('event_detail', event_id=event_id))
+
+@views.route('/events/<int:event_id>/waitlist/leave', methods=['POST'])
+@login_required
+def leave_event_waitlist(event_id):
+    Event.query.get_or_404(event_id)
+    
+    if leave_waitlist(event_id, current_user.id):
+        flash('You have left the waitlist', 'success')
+    else:
+        flash('You are not on the waitlist for this event', 'info')
+    return redirect(url_for('event_detail', event_id=event_id))
+
+@views.route('/events/<int:event_id>/rate', methods=['POST'])
 @login_required
 def rate_event(event_id):
     event = Event.query.get_or_404(event_id)
@@ -823,6 +1150,7 @@ def rate_event(event_id):
         
         if existing_rating:
             # Update existing rating
+            event.update_counters(rating_sum=form.rating.data - existing_rating.rating)
             existing_rating.rating = form.rating.data
             existing_rating.feedback = form.feedback.data
         else:
@@ -834,58 +1162,87 @@ def rate_event(event_id):
                 feedback=form.feedback.data
             )
             db.session.add(rating)
+            event.update_counters(rating_sum=rating.rating, ratings=1)
         
+        invalidate_pages(EVENT_LIST_TAG, event_tag(event_id))
         db.session.commit()
         flash('Your rating has been submitted', 'success')
     
     return redirect(url_for('event_detail', event_id=event_id))
 
-@app.route('/events/calendar')
+@views.route('/events/calendar')
+@cached_page()
 def events_calendar():
-    events = Event.query.all()
-    return render_template('events/calendar.html', events=events)
+    return render_template('events/calendar.html')
+
+# Serialized calendar feeds per date window, rebuilt when events change
+calendar_feed_cache = VersionedCache('events')
+
+# Define colors for categories
+CALENDAR_CATEGORY_COLORS = {
+    'Academic': '#007bff',      # Blue
+    'Social': '#28a745',        # Green
+    'Cultural': '#fd7e14',     # Orange
+    'Sports': '#dc3545',       # Red
+    'Workshop': '#6f42c1',     # Purple
+    'Seminar': '#20c997',      # Teal
+}
+CALENDAR_DEFAULT_COLOR = '#0dcaf0'      # Cyan for uncategorized
+
+def parse_calendar_bound(value):
+    """Parse a FullCalendar start/end parameter into a naive datetime"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace(' ', '+')).replace(tzinfo=None)
+    except ValueError:
+        abort(400)
+
+def build_calendar_feed(start, end):
+    events_query = Event.query
+    # Only events overlapping the requested window
+    if start:
+        events_query = events_query.filter(Event.end_time > start)
+    if end:
+        events_query = events_query.filter(Event.start_time < end)
+    
+    # Build detail URLs from one url_for call rather than one per event
+    detail_url = url_for('event_detail', event_id=0)[:-1]
+    calendar_events = [{
+        'id': event.id,
+        'title': event.title,
+        'start': event.start_time.isoformat(),
+        'end': event.end_time.isoformat(),
+        'url': f'{detail_url}{event.id}',
+        'category': event.category,
+        'color': CALENDAR_CATEGORY_COLORS.get(event.category, CALENDAR_DEFAULT_COLOR)
+    } for event in events_query.order_by(Event.start_time)]
+    
+    body = json.dumps(calendar_events)
+    return body, hashlib.md5(body.encode()).hexdigest()
 
-@app.route('/events/calendar/data')
+@views.route('/events/calendar/data')
 def events_calendar_data():
-    request.args.get('start')
-    request.args.get('end')
-    
-    events = Event.query.all()
-    calendar_events = []
-    # Define colors for categories
-    category_colors = {
-        'Academic': '#007bff',      # Blue
-        'Social': '#28a745',        # Green
-        'Cultural': '#fd7e14',     # Orange
-        'Sports': '#dc3545',       # Red
-        'Workshop': '#6f42c1',     # Purple
-        'Seminar': '#20c997',      # Teal
-    }
-    default_color = '#0dcaf0'      # Cyan for uncategorized
+    start = parse_calendar_bound(request.args.get('start'))
+    end = parse_calendar_bound(request.args.get('end'))
     
-    for event in events:
-        color = category_colors.get(event.category, default_color)
-        calendar_events.append({
-            'id': event.id,
-            'title': event.title,
-            'start': event.start_time.isoformat(),
-            'end': event.end_time.isoformat(),
-            'url': url_for('event_detail', event_id=event.id),
-            'category': event.category,
-            'color': color
-        })
+    _, (body, etag) = calendar_feed_cache.get_or_build(
+        (start, end), lambda: build_calendar_feed(start, end))
     
-    return jsonify(calendar_events)
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 # Error handlers
-@app.errorhandler(404)
+@views.errorhandler(404)
 def page_not_found(e):
     return render_template('404.html'), 404
 
-@app.errorhandler(403)
+@views.errorhandler(403)
 def forbidden(e):
     return render_template('403.html'), 403
 
-@app.errorhandler(500)
+@views.errorhandler(500)
 def internal_server_error(e):
     return render_template('500.html'), 500
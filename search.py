@@ -0,0 +1,169 @@
+import re
+
+from sqlalchemy import bindparam, event as sa_event, text
+
+from extensions import db
+from models import Club, Event
+
+def search_terms(query):
+    """Split a user's query into lowercase word terms"""
+    return re.findall(r'\w+', (query or '').lower())
+
+class SQLiteSearch:
+    """FTS5 index over event title, description, location and club name.
+
+    The rowid of each index row is the event id.
+    """
+
+    def create(self, connection):
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS event_search USING fts5("
+            "title, description, location, club_name, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+
+    def index_events(self, event_ids):
+        params = {'ids': list(event_ids)}
+        delete = text("DELETE FROM event_search WHERE rowid IN :ids") \
+            .bindparams(bindparam('ids', expanding=True))
+        insert = text(
+            "INSERT INTO event_search (rowid, title, description, location, club_name) "
+            "SELECT events.id, events.title, coalesce(events.description, ''), events.location, clubs.name "
+            "FROM events JOIN clubs ON clubs.id = events.club_id WHERE events.id IN :ids"
+        ).bindparams(bindparam('ids', expanding=True))
+        db.session.execute(delete, params)
+        db.session.execute(insert, params)
+
+    def remove_event(self, event_id):
+        db.session.execute(text("DELETE FROM event_search WHERE rowid = :id"), {'id': event_id})
+
+    def rebuild(self):
+        db.session.execute(text("DELETE FROM event_search"))
+        db.session.execute(text(
+            "INSERT INTO event_search (rowid, title, description, location, club_name) "
+            "SELECT events.id, events.title, coalesce(events.description, ''), events.location, clubs.name "
+            "FROM events JOIN clubs ON clubs.id = events.club_id"
+        ))
+
+    def ranks(self, terms):
+        # Every term must match, each as a prefix
+        match = ' '.join(f'"{term}"*' for term in terms)
+        # bm25 is lower for better matches; its weights follow the column
+        # order, so the title counts most
+        return text(
+            "SELECT rowid AS event_id, bm25(event_search, 10.0, 1.0, 3.0, 3.0) AS rank "
+            "FROM event_search WHERE event_search MATCH :match"
+        ).bindparams(match=match).columns(event_id=db.Integer, rank=db.Float)
+
+class PostgresSearch:
+    """Weighted tsvector per event in a side table with a GIN index"""
+
+    DOCUMENT = (
+        "setweight(to_tsvector('simple', events.title), 'A') || "
+        "setweight(to_tsvector('simple', clubs.name), 'B') || "
+        "setweight(to_tsvector('simple', events.location), 'B') || "
+        "setweight(to_tsvector('simple', coalesce(events.description, '')), 'C')"
+    )
+
+    def create(self, connection):
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS event_search ("
+            "event_id INTEGER PRIMARY KEY REFERENCES events (id) ON DELETE CASCADE, "
+            "document TSVECTOR NOT NULL)"
+        ))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_event_search_document ON event_search USING GIN (document)"
+        ))
+
+    def index_events(self, event_ids):
+        db.session.execute(text(
+            f"INSERT INTO event_search (event_id, document) "
+            f"SELECT events.id, {self.DOCUMENT} "
+            f"FROM events JOIN clubs ON clubs.id = events.club_id WHERE events.id IN :ids "
+            f"ON CONFLICT (event_id) DO UPDATE SET document = excluded.document"
+        ).bindparams(bindparam('ids', expanding=True)), {'ids': list(event_ids)})
+
+    def remove_event(self, event_id):
+        db.session.execute(text("DELETE FROM event_search WHERE event_id = :id"), {'id': event_id})
+
+    def rebuild(self):
+        db.session.execute(text("DELETE FROM event_search"))
+        db.session.execute(text(
+            f"INSERT INTO event_search (event_id, document) "
+            f"SELECT events.id, {self.DOCUMENT} FROM events JOIN clubs ON clubs.id = events.club_id"
+        ))
+
+    def ranks(self, terms):
+        query = ' & '.join(f'{term}:*' for term in terms)
+        # Negated so that, as with bm25, better matches rank lower
+        return text(
+            "SELECT event_id, -ts_rank(document, query) AS rank "
+            "FROM event_search, to_tsquery('simple', :query) AS query WHERE document @@ query"
+        ).bindparams(query=query).columns(event_id=db.Integer, rank=db.Float)
+
+class LikeSearch:
+    """Unindexed fallback for databases without a full-text engine"""
+
+    def create(self, connection):
+        pass
+
+    def index_events(self, event_ids):
+        pass
+
+    def remove_event(self, event_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def ranks(self, terms):
+        # Matches are unranked, so they come in id order
+        query = db.select(Event.id.label('event_id'), db.literal(0.0, db.Float).label('rank')).join(Club)
+        for term in terms:
+            pattern = f'%{term}%'
+            query = query.where(Event.title.ilike(pattern) | Event.description.ilike(pattern) |
+                                Event.location.ilike(pattern) | Club.name.ilike(pattern))
+        return query
+
+SEARCH_BACKENDS = {
+    'sqlite': SQLiteSearch(),
+    'postgresql': PostgresSearch(),
+}
+
+def get_backend(dialect_name=None):
+    return SEARCH_BACKENDS.get(dialect_name or db.engine.dialect.name, LikeSearch())
+
+@sa_event.listens_for(db.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+    """Create the search index alongside the tables in db.create_all()"""
+    get_backend(connection.dialect.name).create(connection)
+
+def index_event(event):
+    """Add or refresh an event in the search index, in the current transaction"""
+    db.session.flush()
+    get_backend().index_events([event.id])
+
+def index_club_events(club):
+    """Refresh every event of a club, e.g. after the club is renamed"""
+    event_ids = [event_id for (event_id,) in
+                 db.session.query(Event.id).filter(Event.club_id == club.id)]
+    if event_ids:
+        db.session.flush()
+        get_backend().index_events(event_ids)
+
+def remove_event(event_id):
+    get_backend().remove_event(event_id)
+
+def rebuild_search_index():
+    backend = get_backend()
+    backend.create(db.session.connection())
+    backend.rebuild()
+
+def search_ranks(query):
+    """Subquery of (event_id, rank) for the events matching every word of
+    query, best match lowest, or None if query has no words. Join it to
+    an events query to filter and order it like any other."""
+    terms = search_terms(query)
+    if not terms:
+        return None
+    return get_backend().ranks(terms).subquery('search_ranks')
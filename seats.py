@@ -0,0 +1,183 @@
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Event, Registration, RosterAction, WaitlistEntry
+from checkin import record_roster_changes, insert_ignoring_duplicates
+
+class SeatStatus:
+    REGISTERED = 'registered'
+    ALREADY_REGISTERED = 'already_registered'
+    FULL = 'full'
+    CLOSED = 'closed'
+    WAITLISTED = 'waitlisted'
+    ALREADY_WAITLISTED = 'already_waitlisted'
+
+def reserve_seat(event_id):
+    """Take one seat on the event's stored registration counter.
+
+    A single conditional UPDATE checks capacity and increments the count,
+    so it can't be raced: the row lock it takes (on PostgreSQL; SQLite locks
+    the database) makes concurrent reservations queue up and each one sees
+    the count left by the last. Returns False if the event is full or has
+    already started.
+    """
+    reserved = db.session.execute(
+        db.update(Event)
+        .where(Event.id == event_id,
+               Event.start_time > datetime.now(),
+               db.or_(Event.max_participants.is_(None),
+                      Event.registration_count < Event.max_participants))
+        .values(registration_count=Event.registration_count + 1)
+    ).rowcount
+    return reserved == 1
+
+def register_user(event, user_id):
+    """Register a user for an event and commit. Returns a SeatStatus."""
+    if event.start_time <= datetime.now():
+        return SeatStatus.CLOSED
+    # Turn people away without a write once the event is known to be full
+    if event.max_participants and event.registration_count >= event.max_participants:
+        return SeatStatus.FULL
+
+    if not reserve_seat(event.id):
+        db.session.rollback()
+        return SeatStatus.FULL
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(Registration(user_id=user_id, event_id=event.id))
+    except IntegrityError:
+        # Registered by a concurrent request; give the seat back
+        db.session.rollback()
+        return SeatStatus.ALREADY_REGISTERED
+
+    # Someone who got a seat no longer needs their place in line
+    db.session.execute(
+        db.delete(WaitlistEntry)
+        .where(WaitlistEntry.event_id == event.id, WaitlistEntry.user_id == user_id)
+    )
+    record_roster_changes(event.id, [user_id], RosterAction.REGISTERED)
+    db.session.commit()
+    return SeatStatus.REGISTERED
+
+def release_seat(event, user_id):
+    """Unregister a user, hand the seat to the waitlist, and commit.
+
+    Returns False if the user wasn't registered.
+    """
+    removed = db.session.execute(
+        db.delete(Registration)
+        .where(Registration.event_id == event.id, Registration.user_id == user_id)
+    ).rowcount
+    if not removed:
+        db.session.rollback()
+        return False
+
+    event.update_counters(registrations=-1)
+    record_roster_changes(event.id, [user_id], RosterAction.UNREGISTERED)
+    promote_from_waitlist(event.id)
+    db.session.commit()
+    return True
+
+def promote_from_waitlist(event_id):
+    """Register people from the head of the waitlist into any free seats.
+
+    Runs in the caller's transaction and returns the promoted user ids. Only
+    the entries being promoted are read, from the (event_id, id) index, so
+    freeing one seat costs the same however long the line is.
+    """
+    # Lock the event row first so nobody else can claim the free seats
+    db.session.execute(
+        db.update(Event)
+        .where(Event.id == event_id)
+        .values(registration_count=Event.registration_count)
+    )
+    registration_count, max_participants, start_time = db.session.execute(
+        db.select(Event.registration_count, Event.max_participants, Event.start_time)
+        .where(Event.id == event_id)
+    ).one()
+    if start_time <= datetime.now():
+        return []
+
+    head = db.select(WaitlistEntry.id, WaitlistEntry.user_id) \
+        .where(WaitlistEntry.event_id == event_id) \
+        .order_by(WaitlistEntry.id)
+    if max_participants is not None:
+        free_seats = max_participants - registration_count
+        if free_seats <= 0:
+            return []
+        head = head.limit(free_seats)
+    entries = db.session.execute(head).all()
+    if not entries:
+        return []
+
+    statement = insert_ignoring_duplicates(Registration)
+    rows = [{'user_id': user_id, 'event_id': event_id} for _, user_id in entries]
+    if db.engine.dialect.insert_executemany_returning:
+        promoted = list(db.session.scalars(statement.returning(Registration.user_id), rows))
+    else:
+        db.session.execute(statement, rows)
+        promoted = [user_id for _, user_id in entries]
+    db.session.execute(
+        db.delete(WaitlistEntry).where(WaitlistEntry.id.in_([entry_id for entry_id, _ in entries]))
+    )
+
+    if promoted:
+        db.session.execute(
+            db.update(Event)
+            .where(Event.id == event_id)
+            .values(registration_count=Event.registration_count + len(promoted))
+        )
+        record_roster_changes(event_id, promoted, RosterAction.REGISTERED)
+    return promoted
+
+def join_waitlist(event, user_id):
+    """Put a user in line for a full event and commit. Returns a SeatStatus.
+
+    If a seat is free after all, the user is registered instead.
+    """
+    if event.start_time <= datetime.now():
+        return SeatStatus.CLOSED
+    if Registration.query.filter_by(user_id=user_id, event_id=event.id).first():
+        return SeatStatus.ALREADY_REGISTERED
+
+    status = register_user(event, user_id)
+    if status != SeatStatus.FULL:
+        return status
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(WaitlistEntry(user_id=user_id, event_id=event.id))
+    except IntegrityError:
+        db.session.rollback()
+        return SeatStatus.ALREADY_WAITLISTED
+    db.session.commit()
+    return SeatStatus.WAITLISTED
+
+def leave_waitlist(event_id, user_id):
+    removed = db.session.execute(
+        db.delete(WaitlistEntry)
+        .where(WaitlistEntry.event_id == event_id, WaitlistEntry.user_id == user_id)
+    ).rowcount
+    db.session.commit()
+    return removed > 0
+
+def waitlist_position(event_id, user_id):
+    """1-based place in line for a user, or None if they aren't waiting"""
+    entry_id = db.session.scalar(
+        db.select(WaitlistEntry.id)
+        .where(WaitlistEntry.event_id == event_id, WaitlistEntry.user_id == user_id)
+    )
+    if entry_id is None:
+        return None
+    return db.session.scalar(
+        db.select(db.func.count(WaitlistEntry.id))
+        .where(WaitlistEntry.event_id == event_id, WaitlistEntry.id <= entry_id)
+    )
+
+def waitlist_length(event_id):
+    return db.session.scalar(
+        db.select(db.func.count(WaitlistEntry.id)).where(WaitlistEntry.event_id == event_id)
+    )
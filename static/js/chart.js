@@ -20,6 +20,19 @@ document.addEventListener('DOMContentLoaded', function() {
   if (document.getElementById('attendanceTrendsChart')) {
     initializeAttendanceTrendsChart();
   }
+  
+  // Admin dashboard charts
+  if (document.getElementById('user-roles-chart')) {
+    initializeUserRolesChart();
+  }
+  if (document.getElementById('event-timeline-chart')) {
+    initializeEventTimelineChart();
+  }
+  
+  // Organizer dashboard categories chart
+  if (document.getElementById('event-categories-chart')) {
+    initializeEventCategoriesChart();
+  }
 });
 
 function initializeEventStatsChart() {
@@ -181,4 +194,119 @@ function initializeAttendanceTrendsChart() {
       }
     }
   });
-}
\ No newline at end of file
+}
+
+function initializeUserRolesChart() {
+  var ctx = document.getElementById('user-roles-chart').getContext('2d');
+  
+  // Get data from data attributes
+  var chartElement = document.getElementById('user-roles-chart');
+  var labels = JSON.parse(chartElement.dataset.labels || '[]');
+  var data = JSON.parse(chartElement.dataset.values || '[]');
+  
+  new Chart(ctx, {
+    type: 'doughnut',
+    data: {
+      labels: labels,
+      datasets: [{
+        data: data,
+        backgroundColor: [
+          'rgba(54, 162, 235, 0.7)',
+          'rgba(75, 192, 192, 0.7)',
+          'rgba(201, 203, 207, 0.7)'
+        ],
+        borderWidth: 1
+      }]
+    },
+    options: {
+      responsive: true,
+      plugins: {
+        legend: {
+          position: 'bottom'
+        }
+      }
+    }
+  });
+}
+
+function initializeEventTimelineChart() {
+  var ctx = document.getElementById('event-timeline-chart').getContext('2d');
+  
+  // Get data from data attributes (monthly totals from the dashboard rollups)
+  var chartElement = document.getElementById('event-timeline-chart');
+  var labels = JSON.parse(chartElement.dataset.labels || '[]');
+  var events = JSON.parse(chartElement.dataset.events || '[]');
+  var registrations = JSON.parse(chartElement.dataset.registrations || '[]');
+  var attendances = JSON.parse(chartElement.dataset.attendances || '[]');
+  
+  new Chart(ctx, {
+    type: 'bar',
+    data: {
+      labels: labels,
+      datasets: [{
+        label: 'Events',
+        data: events,
+        backgroundColor: 'rgba(255, 159, 64, 0.5)',
+        borderColor: 'rgba(255, 159, 64, 1)',
+        borderWidth: 1
+      }, {
+        label: 'Registrations',
+        data: registrations,
+        backgroundColor: 'rgba(54, 162, 235, 0.5)',
+        borderColor: 'rgba(54, 162, 235, 1)',
+        borderWidth: 1
+      }, {
+        label: 'Attendances',
+        data: attendances,
+        backgroundColor: 'rgba(75, 192, 192, 0.5)',
+        borderColor: 'rgba(75, 192, 192, 1)',
+        borderWidth: 1
+      }]
+    },
+    options: {
+      responsive: true,
+      scales: {
+        y: {
+          beginAtZero: true,
+          ticks: {
+            precision: 0
+          }
+        }
+      }
+    }
+  });
+}
+
+function initializeEventCategoriesChart() {
+  var ctx = document.getElementById('event-categories-chart').getContext('2d');
+  
+  // Get data from data attributes
+  var chartElement = document.getElementById('event-categories-chart');
+  var labels = JSON.parse(chartElement.dataset.labels || '[]');
+  var data = JSON.parse(chartElement.dataset.values || '[]');
+  
+  new Chart(ctx, {
+    type: 'bar',
+    data: {
+      labels: labels,
+      datasets: [{
+        label: 'Events',
+        data: data,
+        backgroundColor: 'rgba(54, 162, 235, 0.5)',
+        borderColor: 'rgba(54, 162, 235, 1)',
+        borderWidth: 1
+      }]
+    },
+    options: {
+      responsive: true,
+      scales: {
+        y: {
+          beginAtZero: true,
+          ticks: {
+            precision: 0
+          }
+        }
+      }
+    }
+  });
+}
@@ -0,0 +1,144 @@
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.engine import Engine
+
+from advisor import capture_statements, find_full_scans
+from app import create_app
+from extensions import db
+from migrations import run_migrations
+from routes import calendar_feed_cache
+from utils import category_cache
+from models import User, UserRole, Club, Event, Registration
+
+def pytest_addoption(parser):
+    parser.addoption('--advise-indexes', action='store_true',
+                     help='EXPLAIN every query the tests run and fail on full table scans.')
+
+# Statements the tests ran, with their parameters and the first test to run each
+statements_key = pytest.StashKey[dict]()
+scans_key = pytest.StashKey[list]()
+
+def pytest_configure(config):
+    if config.getoption('advise_indexes'):
+        config.stash[statements_key] = {}
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    # With --advise-indexes, the flask advise-indexes check covers every
+    # query the tests run rather than a fixed set of pages. Every test has
+    # its own engine, so listen on all of them.
+    statements = item.config.stash.get(statements_key, None)
+    if statements is None:
+        yield
+        return
+    with capture_statements(Engine) as captured:
+        yield
+    for statement, parameters in captured.items():
+        statements.setdefault(statement, (parameters, item.nodeid))
+
+def pytest_sessionfinish(session):
+    statements = session.config.stash.get(statements_key, None)
+    if statements is None:
+        return
+    # The statements are explained against a fresh copy of the schema
+    with tempfile.TemporaryDirectory() as folder:
+        app = create_app('testing', {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(folder, 'explain.db')}"})
+        with app.app_context():
+            run_migrations(echo=lambda message: None)
+            scans = find_full_scans({statement: parameters for statement, (parameters, _) in statements.items()})
+            db.engine.dispose()
+    session.config.stash[scans_key] = scans
+    if scans:
+        session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+def pytest_terminal_summary(terminalreporter, config):
+    if scans_key not in config.stash:
+        return
+    statements = config.stash[statements_key]
+    scans = config.stash[scans_key]
+    terminalreporter.section('advise-indexes')
+    for scan in scans:
+        terminalreporter.write_line(f"SCAN  {scan.table} in {statements[scan.statement][1]}: {scan.detail}")
+        terminalreporter.write_line(f"      {' '.join(scan.statement.split())[:160]}")
+    terminalreporter.write_line(f"{len(scans)} full table scans in {len(statements)} distinct statements")
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build testing apps, each on its own migrated SQLite database"""
+    apps = []
+    # Check-in QR codes are written under the app's static folder
+    qr_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'static', 'uploads', 'qrcodes')
+    existing = set(os.listdir(qr_folder)) if os.path.isdir(qr_folder) else set()
+
+    def make_app(config=None):
+        # The process-wide caches would otherwise serve the last app's data
+        category_cache.clear()
+        calendar_feed_cache.clear()
+        folder = tmp_path / f'app{len(apps)}'
+        folder.mkdir()
+        app = create_app('testing', {
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{folder / 'test.db'}",
+            'JOB_ARTIFACT_FOLDER': str(folder / 'job_artifacts'),
+            'RECOMMENDATION_FILE': str(folder / 'recommendations.npz'),
+            'REMINDER_FILE': str(folder / 'reminders.log'),
+            **(config or {}),
+        })
+        with app.app_context():
+            run_migrations(echo=lambda message: None)
+        apps.append(app)
+        return app
+
+    yield make_app
+    for app in apps:
+        with app.app_context():
+            db.engine.dispose()
+    if os.path.isdir(qr_folder):
+        for name in set(os.listdir(qr_folder)) - existing:
+            os.remove(os.path.join(qr_folder, name))
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+@pytest.fixture
+def data(app):
+    """An admin, an organizer with a club and an upcoming event, and a
+    student registered for it"""
+    with app.app_context():
+        admin = User(username='admin', email='admin@example.com', first_name='Ada', last_name='Admin',
+                     role=UserRole.ADMIN)
+        organizer = User(username='organizer', email='organizer@example.com', first_name='Otto',
+                         last_name='Organizer', role=UserRole.ORGANIZER)
+        student = User(username='student', email='student@example.com', first_name='Stu',
+                       last_name='Dent', role=UserRole.STUDENT)
+        for user in (admin, organizer, student):
+            user.set_password('password')
+        db.session.add_all([admin, organizer, student])
+        db.session.flush()
+        club = Club(name='Chess Club', admin_id=organizer.id)
+        db.session.add(club)
+        db.session.flush()
+        start = datetime.now() + timedelta(days=2)
+        event = Event(title='Opening Night', description='Simultaneous exhibition', location='Main Hall',
+                      start_time=start, end_time=start + timedelta(hours=2), category='Social',
+                      max_participants=50, organizer_id=organizer.id, club_id=club.id)
+        db.session.add(event)
+        db.session.flush()
+        db.session.add(Registration(user_id=student.id, event_id=event.id))
+        event.update_counters(registrations=1)
+        db.session.commit()
+        return {'admin_id': admin.id, 'organizer_id': organizer.id, 'student_id': student.id,
+                'club_id': club.id, 'event_id': event.id}
+
+@pytest.fixture
+def log_in():
+    """Sign a test client in as a user without going through the login form"""
+    def log_in(client, user_id):
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+    return log_in
@@ -0,0 +1,20 @@
+from app import create_app
+
+def test_each_app_gets_the_views_and_commands(app, tmp_path):
+    other = create_app('testing', {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'other.db'}"})
+
+    assert other is not app
+    assert other.testing and not other.debug
+    assert other.config['SQLALCHEMY_DATABASE_URI'] != app.config['SQLALCHEMY_DATABASE_URI']
+    for built in (app, other):
+        assert 'login' in built.view_functions
+        assert 'format_datetime' in built.jinja_env.filters
+        assert {'migrate', 'check-queries'} <= set(built.cli.commands)
+
+def test_pages_render_on_a_testing_app(app, data, log_in):
+    client = app.test_client()
+    assert client.get('/events').status_code == 200
+    assert client.get('/no-such-page').status_code == 404
+
+    log_in(client, data['student_id'])
+    assert client.get('/student/my-events').status_code == 200
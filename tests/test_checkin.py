@@ -0,0 +1,23 @@
+import pytest
+
+from checkin import make_scanner_key
+
+@pytest.mark.parametrize('query', ['', '?since=0', '?since=5'])
+def test_roster_of_a_missing_event_is_not_found(app, data, query):
+    with app.test_request_context():
+        key = make_scanner_key(999)
+    response = app.test_client().get(f'/events/999/roster{query}', headers={'X-Scanner-Key': key})
+
+    assert response.status_code == 404
+
+def test_roster_changes_since_a_version(app, data):
+    event_id = data['event_id']
+    with app.test_request_context():
+        key = make_scanner_key(event_id)
+    client = app.test_client()
+
+    snapshot = client.get(f'/events/{event_id}/roster', headers={'X-Scanner-Key': key}).get_json()
+    changes = client.get(f"/events/{event_id}/roster?since={snapshot['version']}",
+                         headers={'X-Scanner-Key': key}).get_json()
+
+    assert changes == {'event_id': event_id, 'version': snapshot['version'], 'changes': []}
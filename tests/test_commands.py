@@ -0,0 +1,35 @@
+import re
+
+def statement_counts(output):
+    """{url: (status, statements)} from check-queries or advise-indexes output"""
+    return {url: (int(status), int(statements)) for url, status, statements
+            in re.findall(r'^\S+\s+(\S+) -> (\d+), (\d+) statements$', output, re.MULTILINE)}
+
+def test_check_queries_renders_pages_as_their_users(app, data):
+    result = app.test_cli_runner().invoke(args=['check-queries'])
+
+    pages = statement_counts(result.output)
+    assert pages['/student/my-events'][0] == 200
+    assert pages['/student/my-events'][1] > 0
+    assert pages['/admin/users'][0] == 200
+    assert pages[f"/organizer/check-in/{data['event_id']}"][0] == 200
+    assert 'FAIL' not in result.output
+    assert result.exit_code == 0
+
+def test_check_queries_fails_pages_that_redirect(app, data):
+    # Students can't see the admin dashboard, so it redirects
+    app.view_functions['admin_dashboard'] = lambda: app.redirect('/login')
+    result = app.test_cli_runner().invoke(args=['check-queries'])
+
+    assert re.search(r'^FAIL\s+/admin/dashboard -> 302', result.output, re.MULTILINE)
+    assert result.exit_code == 1
+
+def test_advise_indexes_explains_signed_in_pages(app, data):
+    result = app.test_cli_runner().invoke(args=['advise-indexes'])
+
+    pages = statement_counts(result.output)
+    assert pages['/student/my-events'][0] == 200
+    assert pages['/student/my-events'][1] > 0
+    assert not re.search(r'^FAIL', result.output, re.MULTILINE)
+    # The admin user list pages through every user
+    assert re.search(r'^SCAN\s+users on /admin/users', result.output, re.MULTILINE)
@@ -0,0 +1,17 @@
+import logging
+import time
+
+def test_pool_stats_are_logged_from_requests(make_app, caplog):
+    app = make_app({'DB_POOL_STATS_INTERVAL': 0.05})
+    # Building the app replaced the root logger's handlers, caplog's among them
+    logging.getLogger().addHandler(caplog.handler)
+    time.sleep(0.1)
+    with caplog.at_level(logging.INFO, logger='database'):
+        assert app.test_client().get('/').status_code == 200
+        app.test_client().get('/')
+
+    logged = [record for record in caplog.records if record.getMessage().startswith('Database pool')]
+    # Once per interval, however many requests end in it
+    assert len(logged) == 1
+    assert logged[0].pool['checkouts'] > 0
+    assert 'Pool size' in logged[0].pool['status']
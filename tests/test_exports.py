@@ -0,0 +1,41 @@
+import csv
+import io
+
+from models import Job
+
+def test_csv_export_streams_to_the_browser(app, data, log_in):
+    client = app.test_client()
+    log_in(client, data['organizer_id'])
+    response = client.get(f"/organizer/events/{data['event_id']}/export-participants?format=csv")
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'].startswith('attachment; filename=')
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ['ID', 'First Name', 'Last Name', 'Email', 'Registration Date', 'Attended']
+    assert rows[1][:4] == [str(data['student_id']), 'Stu', 'Dent', 'student@example.com']
+    with app.app_context():
+        assert Job.query.count() == 0
+
+def test_xlsx_export_is_built_in_the_background(app, data, log_in):
+    client = app.test_client()
+    log_in(client, data['organizer_id'])
+    response = client.get(f"/organizer/events/{data['event_id']}/export-participants")
+
+    assert response.status_code == 302
+    with app.app_context():
+        job = Job.query.one()
+        assert job.kind == 'export_participants'
+        assert job.params['format'] == 'xlsx'
+    assert response.location.endswith(f'/jobs/{job.id}')
+
+def test_api_clients_get_csv_exports_as_a_job(app, data, log_in):
+    client = app.test_client()
+    log_in(client, data['organizer_id'])
+    response = client.get(f"/organizer/events/{data['event_id']}/export-participants?format=csv",
+                          headers={'Accept': 'application/json'})
+
+    assert response.status_code == 202
+    with app.app_context():
+        assert Job.query.one().params['format'] == 'csv'
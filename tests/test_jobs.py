@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from jobs import job, enqueue, run_job, run_queued_jobs, recover_stale_jobs
+from models import Job, JobStatus
+
+calls = []
+
+class WorkerStopped(BaseException):
+    """Stands in for the worker process going away mid-job"""
+
+@job('test_flaky')
+def flaky_job(current_job, fail):
+    calls.append(current_job.id)
+    if fail:
+        raise WorkerStopped()
+
+@pytest.fixture
+def stuck_job(app):
+    """A job whose worker stopped after claiming it"""
+    calls.clear()
+    with app.app_context():
+        stuck = Job(kind='test_flaky', params={'fail': True}, dedupe_key='flaky')
+        db.session.add(stuck)
+        db.session.commit()
+        with pytest.raises(WorkerStopped):
+            run_job(stuck.id)
+        db.session.rollback()
+        stuck.params = {'fail': False}
+        db.session.commit()
+        assert stuck.status == JobStatus.RUNNING
+        return stuck.id
+
+def test_a_stuck_job_blocks_its_key_only_until_the_claim_times_out(app, stuck_job):
+    with app.app_context():
+        assert enqueue('test_flaky', dedupe_key='flaky', fail=False).id == stuck_job
+        db.session.rollback()
+
+        app.config['JOB_CLAIM_TIMEOUT'] = 0
+        fresh = enqueue('test_flaky', dedupe_key='flaky', fail=False)
+        assert fresh.id != stuck_job
+        db.session.rollback()
+
+def test_stale_jobs_are_requeued_and_run(app, stuck_job):
+    with app.app_context():
+        assert recover_stale_jobs() == []
+
+        later = datetime.now() + timedelta(seconds=app.config['JOB_CLAIM_TIMEOUT'] + 1)
+        assert recover_stale_jobs(now=later) == [stuck_job]
+        assert run_queued_jobs() == 1
+        assert db.session.get(Job, stuck_job).status == JobStatus.FINISHED
+        assert calls == [stuck_job, stuck_job]
+
+@pytest.fixture
+def orphaned_job(app):
+    """A job committed by a worker that stopped before its pool picked it up"""
+    calls.clear()
+    with app.app_context():
+        orphaned = Job(kind='test_flaky', params={'fail': False}, dedupe_key='flaky')
+        db.session.add(orphaned)
+        db.session.commit()
+        return orphaned.id
+
+def test_an_orphaned_job_blocks_its_key_only_until_the_claim_times_out(app, orphaned_job):
+    with app.app_context():
+        assert enqueue('test_flaky', dedupe_key='flaky', fail=False).id == orphaned_job
+        db.session.rollback()
+
+        app.config['JOB_CLAIM_TIMEOUT'] = 0
+        assert enqueue('test_flaky', dedupe_key='flaky', fail=False).id != orphaned_job
+        db.session.rollback()
+
+def test_orphaned_jobs_are_resubmitted_and_run(app, orphaned_job):
+    with app.app_context():
+        assert recover_stale_jobs() == []
+
+        later = datetime.now() + timedelta(seconds=app.config['JOB_CLAIM_TIMEOUT'] + 1)
+        assert recover_stale_jobs(now=later) == [orphaned_job]
+        assert run_job(orphaned_job)
+        assert db.session.get(Job, orphaned_job).status == JobStatus.FINISHED
+        assert calls == [orphaned_job]
+
+def test_run_jobs_command_recovers_stuck_jobs(app, stuck_job):
+    app.config['JOB_CLAIM_TIMEOUT'] = 0
+    result = app.test_cli_runner().invoke(args=['run-jobs'])
+
+    assert 'Ran 1 queued jobs (1 left behind by a stopped worker)' in result.output
+    with app.app_context():
+        assert db.session.get(Job, stuck_job).status == JobStatus.FINISHED
@@ -0,0 +1,11 @@
+def test_first_visit_to_the_event_list_is_cached(make_app):
+    app = make_app({'WTF_CSRF_ENABLED': True})
+
+    first = app.test_client().get('/events')
+    assert first.status_code == 200
+    assert 'Set-Cookie' not in first.headers
+    assert first.cache_control.public
+
+    # A second new visitor gets the stored page
+    second = app.test_client().get('/events', headers={'If-None-Match': first.get_etag()[0]})
+    assert second.status_code == 304
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from commands import QUERY_CHECK_PAGES, check_page_requests, request_page
+from extensions import db
+from loading import count_queries
+from models import User, UserRole, Club, Event, Registration, Attendance, Rating
+
+class HeldJobs:
+    """Stands in for the job pool, so no job runs while a page renders"""
+
+    def submit(self, *args):
+        pass
+
+@pytest.fixture
+def held_jobs(monkeypatch):
+    monkeypatch.setattr(jobs, '_get_executor', lambda app: HeldJobs())
+
+def seed(app, registrants):
+    """Two past and three upcoming events, each with the given number of
+    registrants; half of them attended and rated the past ones"""
+    with app.app_context():
+        admin = User(username='admin', email='admin@example.com', first_name='Ada', last_name='Admin',
+                     role=UserRole.ADMIN, password_hash='!')
+        organizer = User(username='organizer', email='organizer@example.com', first_name='Otto',
+                         last_name='Organizer', role=UserRole.ORGANIZER, password_hash='!')
+        students = [User(username=f'student{i}', email=f'student{i}@example.com', first_name='Stu',
+                         last_name=f'Dent{i}', password_hash='!') for i in range(registrants)]
+        db.session.add_all([admin, organizer] + students)
+        db.session.flush()
+        club = Club(name='Chess Club', admin_id=organizer.id)
+        db.session.add(club)
+        db.session.flush()
+
+        now = datetime.now()
+        for days in (-14, -7, 2, 5, 9):
+            start = now + timedelta(days=days)
+            event = Event(title=f'Event in {days} days', description='Simultaneous exhibition',
+                          location='Main Hall', start_time=start, end_time=start + timedelta(hours=2),
+                          category='Social', max_participants=0, organizer_id=organizer.id, club_id=club.id)
+            db.session.add(event)
+            db.session.flush()
+            for number, student in enumerate(students):
+                db.session.add(Registration(user_id=student.id, event_id=event.id))
+                if days < 0 and number % 2 == 0:
+                    db.session.add(Attendance(user_id=student.id, event_id=event.id))
+                    db.session.add(Rating(user_id=student.id, event_id=event.id, rating=4))
+            attended = (registrants + 1) // 2 if days < 0 else 0
+            event.update_counters(registrations=registrants, attendances=attended,
+                                  rating_sum=4 * attended, ratings=attended)
+        db.session.commit()
+
+def statement_counts(app):
+    """{endpoint: statements} for each page check-queries renders"""
+    with app.app_context():
+        engine = db.engine
+    counts = {}
+    for (endpoint, _), (url, user_id) in zip(QUERY_CHECK_PAGES, check_page_requests(app)):
+        with count_queries(engine) as statements:
+            response = request_page(app, url, user_id)
+        assert response.status_code == 200, url
+        counts[endpoint] = len(statements)
+    return counts
+
+def test_page_query_counts_dont_grow_with_registrants(make_app, held_jobs):
+    counts = {}
+    for registrants in (2, 20):
+        app = make_app()
+        seed(app, registrants)
+        counts[registrants] = statement_counts(app)
+
+    assert len(counts[2]) == len(QUERY_CHECK_PAGES)
+    assert counts[20] == counts[2]
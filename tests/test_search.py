@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+from extensions import db
+from models import Event
+from search import rebuild_search_index
+
+def add_events(data, count, category, **fields):
+    start = datetime.now() + timedelta(days=3)
+    events = [Event(location='Main Hall', start_time=start, end_time=start + timedelta(hours=2),
+                    category=category, organizer_id=data['organizer_id'], club_id=data['club_id'],
+                    **fields) for _ in range(count)]
+    db.session.add_all(events)
+    db.session.flush()
+    return [event.id for event in events]
+
+def search_pages(client, **args):
+    """Ids of every upcoming event the JSON feed returns, following its cursors"""
+    ids, after = [], None
+    while True:
+        page = client.get('/events/data', query_string=dict(args, limit=50, after=after)).get_json()
+        ids.extend(event['id'] for event in page['events'])
+        after = page['next_cursor']
+        if after is None:
+            return ids
+
+def test_search_pages_through_every_match_best_first(app, data):
+    with app.app_context():
+        in_title = add_events(data, 210, 'Academic', title='Robotics lecture', description='Openings')
+        in_description = add_events(data, 3, 'Social', title='Board games', description='Bring a robotics kit')
+        add_events(data, 5, 'Social', title='Quiz night', description='Teams of four')
+        rebuild_search_index()
+        db.session.commit()
+
+    ids = search_pages(app.test_client(), query='robotics')
+    assert len(ids) == len(set(ids)) == 213
+    # Title matches rank first
+    assert set(ids[:210]) == set(in_title)
+    assert ids[210:] == sorted(in_description)
+
+def test_search_filters_by_category_before_ranking(app, data):
+    with app.app_context():
+        add_events(data, 210, 'Academic', title='Robotics lecture', description='Openings')
+        in_description = add_events(data, 3, 'Social', title='Board games', description='Bring a robotics kit')
+        rebuild_search_index()
+        db.session.commit()
+
+    client = app.test_client()
+    assert search_pages(client, query='robotics', category='Social') == sorted(in_description)
+    response = client.get('/events', query_string={'query': 'robotics', 'category': 'Social'})
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert 'Board games' in page and 'Robotics lecture' not in page
@@ -4,6 +4,11 @@ from datetime import datetime
 from flask import current_app
 from werkzeug.utils import secure_filename
 
+from cache import VersionedCache
+
+# Per-category event counts, rebuilt when events are created, edited or deleted
+category_cache = VersionedCache('events', max_entries=1)
+
 def save_file(file, folder):
     """Save a file to the specified folder and return the filename"""
     if file and file.filename:
@@ -21,7 +26,14 @@ def save_file(file, folder):
         file.save(file_path)
         
         # Always return a web-compatible path (forward slashes)
-        return os.path.join(folder, unique_filename).replace('\\', '/').replace('\\', '/')
+        relative_path = os.path.join(folder, unique_filename).replace('\\', '/').replace('\\', '/')
+        
+        # Downscale oversized images in the background once the request commits
+        if file_extension.lower() in ('.png', '.jpg', '.jpeg'):
+            from jobs import enqueue
+            enqueue('optimize_image', path=relative_path)
+        
+        return relative_path
     return None
 
 def format_datetime(value, format='%Y-%m-%d %H:%M'):
@@ -30,35 +42,66 @@ def format_datetime(value, format='%Y-%m-%d %H:%M'):
         return value.strftime(format)
     return ""
 
-def get_event_stats(events):
-    """Get statistics for a list of events"""
-    total_events = len(events)
-    upcoming_events = sum(1 for event in events if event.is_upcoming())
-    past_events = sum(1 for event in events if event.is_past())
-    ongoing_events = sum(1 for event in events if event.is_ongoing())
-    
-    categories = {}
+def load_event_stats(event_ids):
+    """Load registration, attendance and rating figures for many events.
+    
+    Issues one GROUP BY query per source table regardless of how many
+    events are requested and returns a dict keyed by event id.
+    """
+    from extensions import db
+    from models import Registration, Attendance, Rating
+    
+    event_ids = list(set(event_ids))
+    stats = {event_id: {'registrations': 0, 'attendance': 0, 'ratings': 0, 'average_rating': 0}
+             for event_id in event_ids}
+    if not event_ids:
+        return stats
+    
+    registration_counts = db.session.query(Registration.event_id, db.func.count(Registration.id)) \
+        .filter(Registration.event_id.in_(event_ids)) \
+        .group_by(Registration.event_id)
+    for event_id, count in registration_counts:
+        stats[event_id]['registrations'] = count
+    
+    attendance_counts = db.session.query(Attendance.event_id, db.func.count(Attendance.id)) \
+        .filter(Attendance.event_id.in_(event_ids)) \
+        .group_by(Attendance.event_id)
+    for event_id, count in attendance_counts:
+        stats[event_id]['attendance'] = count
+    
+    rating_figures = db.session.query(Rating.event_id, db.func.count(Rating.id), db.func.avg(Rating.rating)) \
+        .filter(Rating.event_id.in_(event_ids)) \
+        .group_by(Rating.event_id)
+    for event_id, count, average in rating_figures:
+        stats[event_id]['ratings'] = count
+        stats[event_id]['average_rating'] = float(average or 0)
+    
+    return stats
+
+def attach_event_stats(*event_lists):
+    """Attach batch-loaded stats to the events before rendering"""
+    events = [event for event_list in event_lists for event in event_list]
+    stats = load_event_stats(event.id for event in events)
     for event in events:
-        if event.category in categories:
-            categories[event.category] += 1
-        else:
-            categories[event.category] = 1
-    
-    return {
-        'total': total_events,
-        'upcoming': upcoming_events,
-        'past': past_events,
-        'ongoing': ongoing_events,
-        'categories': categories
-    }
+        event.stats = stats[event.id]
 
-def get_user_events_stats(user_id, events, registrations):
-    """Get statistics for a user's events"""
-    registered_events = [reg.event_id for reg in registrations]
-    registered_count = len(registered_events)
-    
-    upcoming_registered = sum(1 for event in events if event.id in registered_events and event.is_upcoming())
-    past_registered = sum(1 for event in events if event.id in registered_events and event.is_past())
+def get_user_events_stats(user_id, now=None):
+    """Get statistics for a user's events.
+    
+    Counts the user's registrations in one aggregate query, classifying
+    each event against a single reference time.
+    """
+    from extensions import db
+    from models import Registration, Event
+    
+    now = now or datetime.now()
+    registered_count, upcoming_registered, past_registered = db.session.query(
+        db.func.count(Registration.id),
+        db.func.coalesce(db.func.sum(db.case((Event.start_time > now, 1), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((Event.end_time < now, 1), else_=0)), 0)
+    ).join(Event, Event.id == Registration.event_id) \
+        .filter(Registration.user_id == user_id) \
+        .one()
     
     return {
         'registered_count': registered_count,
@@ -66,6 +109,23 @@ def get_user_events_stats(user_id, events, registrations):
         'past_registered': past_registered
     }
 
+def get_category_counts():
+    """Return {category: number of events}, ordered by category name.
+    
+    Built with a single GROUP BY and then served from the in-process cache.
+    """
+    from extensions import db
+    from models import Event
+    
+    def build():
+        rows = db.session.query(Event.category, db.func.count(Event.id)) \
+            .group_by(Event.category) \
+            .order_by(Event.category)
+        return dict(rows.all())
+    
+    _, counts = category_cache.get_or_build('categories', build)
+    return counts
+
 def allowed_file(filename, allowed_extensions):
     """Check if file has an allowed extension"""
     return '.' in filename and \
@@ -99,48 +159,74 @@ def generate_qr_code(data, filename=None):
     # Return the relative path for use in templates
     return os.path.join('uploads', 'qrcodes', os.path.basename(file_path)).replace('\\', '/').replace('\\', '/')
 
-def export_participant_list(event_id, format='excel'):
-    """Export participant list to Excel or CSV format"""
-    import pandas as pd
-    import os
-    from flask import current_app
-    from models import Event, Registration, User, Attendance
-    
-    # Get event and registrations
-    event = Event.query.get(event_id)
-    if not event:
-        return None
+def generate_qr_code_png(data):
+    """Render a QR code to PNG bytes without touching the filesystem"""
+    import io
+    import qrcode
     
-    # Create directory if it doesn't exist
-    export_dir = os.path.join(current_app.root_path, 'static', 'exports')
-    os.makedirs(export_dir, exist_ok=True)
-    
-    # Get registrations and attendances
-    registrations = Registration.query.filter_by(event_id=event_id).all()
-    attendances = Attendance.query.filter_by(event_id=event_id).all()
-    attended_user_ids = [attendance.user_id for attendance in attendances]
-    
-    # Prepare data for export
-    data = []
-    for registration in registrations:
-        user = User.query.get(registration.user_id)
-        if user:
-            data.append({
-                'ID': user.id,
-                'First Name': user.first_name,
-                'Last Name': user.last_name,
-                'Email': user.email,
-                'Registration Date': registration.registration_time.strftime('%Y-%m-%d %H:%M'),
-                'Attended': 'Yes' if user.id in attended_user_ids else 'No'
-            })
-    
-    # Create DataFrame
-    df = pd.DataFrame(data)
-    
-    # Export to Excel
-    filename = f"event_{event_id}_participants_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    file_path = os.path.join(export_dir, filename)
-    df.to_excel(file_path, index=False)
-    
-    # Return the relative path for download
-    return os.path.join('exports', filename)
+    buffer = io.BytesIO()
+    qrcode.make(data).save(buffer)
+    return buffer.getvalue()
+
+# Column headings of the participant export
+PARTICIPANT_EXPORT_HEADER = ('ID', 'First Name', 'Last Name', 'Email', 'Registration Date', 'Attended')
+
+def iter_participant_rows(event_id, batch_size=1000):
+    """Yield one export row per registrant of an event.
+    
+    Rows come from a single Registration/User/Attendance join fetched in
+    batches, so memory use does not grow with the number of registrants.
+    """
+    from extensions import db
+    from models import Registration, User, Attendance
+    
+    rows = db.session.query(User.id, User.first_name, User.last_name, User.email,
+                            Registration.registration_time, Attendance.id) \
+        .join(User, User.id == Registration.user_id) \
+        .outerjoin(Attendance, db.and_(Attendance.user_id == Registration.user_id,
+                                       Attendance.event_id == Registration.event_id)) \
+        .filter(Registration.event_id == event_id) \
+        .order_by(Registration.id) \
+        .yield_per(batch_size)
+    
+    for user_id, first_name, last_name, email, registration_time, attendance_id in rows:
+        yield (user_id, first_name, last_name, email,
+               format_datetime(registration_time),
+               'Yes' if attendance_id else 'No')
+
+def stream_participants_csv(event_id):
+    """Generate the participant list as CSV text chunks"""
+    import csv
+    import io
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(PARTICIPANT_EXPORT_HEADER)
+    for count, row in enumerate(iter_participant_rows(event_id), 1):
+        writer.writerow(row)
+        if count % 500 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def build_participants_xlsx(event_id):
+    """Write the participant list to an in-memory XLSX file object.
+    
+    Uses openpyxl's write-only mode, so rows are written out as they are
+    read. The result spills to an anonymous temporary file once it is
+    large, and that file is removed as soon as it is closed.
+    """
+    import tempfile
+    from openpyxl import Workbook
+    
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Participants')
+    worksheet.append(PARTICIPANT_EXPORT_HEADER)
+    for row in iter_participant_rows(event_id):
+        worksheet.append(row)
+    
+    output = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    workbook.save(output)
+    output.seek(0)
+    return output